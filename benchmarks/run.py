@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+Calculator benchmarks
+
+Measures per-operation latency of each calculator_c backend, Calculator
+throughput across expression sizes, CLI cold-start time and batch
+throughput. Results are written as JSON and can be compared against a
+previous run:
+
+  python benchmarks/run.py --output results.json
+  python benchmarks/run.py --baseline results.json --threshold 0.10
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import calculator_c  # noqa: E402
+from python import Calculator  # noqa: E402
+from python.batch import run_batch  # noqa: E402
+
+
+def time_per_call(statement, namespace, repeat=5):
+    """Return the best time per call of statement in nanoseconds."""
+    timer = timeit.Timer(statement, globals=namespace)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e9
+
+
+def pure_python_backend():
+    class PurePython:
+        add = staticmethod(lambda a, b: a + b)
+        subtract = staticmethod(lambda a, b: a - b)
+        multiply = staticmethod(lambda a, b: a * b)
+        divide = staticmethod(lambda a, b: a / b)
+
+    return PurePython
+
+
+def scalar_backends():
+    """Return the available scalar backends by name."""
+    backends = {"python": pure_python_backend()}
+    for name in ("_native", "_ctypes"):
+        try:
+            backends[name.lstrip("_")] = importlib.import_module(f"calculator_c.{name}")
+        except ImportError:
+            pass
+    return backends
+
+
+def bench_scalar_ops(results):
+    for backend_name, backend in scalar_backends().items():
+        for op in ("add", "subtract", "multiply", "divide"):
+            ns = time_per_call("op(3.0, 2.0)", {"op": getattr(backend, op)})
+            results[f"op.{backend_name}.{op}"] = {"value": ns, "unit": "ns/op"}
+
+
+def make_expression(operators):
+    """Return an expression with the given number of binary operators."""
+    symbols = "+-*/"
+    parts = ["1.5"]
+    for i in range(operators):
+        parts.append(f"{symbols[i % 4]} {i % 7 + 2}")
+    return " ".join(parts)
+
+
+def bench_expressions(results, sizes):
+    for size in sizes:
+        expression = make_expression(size)
+        for engine in Calculator.ENGINES:
+            uncached = Calculator(cache_size=0, engine=engine)
+            ns = time_per_call("calc.calculate(e)", {"calc": uncached, "e": expression})
+            results[f"calculate.{engine}.uncached.{size}ops"] = {
+                "value": ns,
+                "unit": "ns/expr",
+            }
+        cached = Calculator()
+        ns = time_per_call("calc.calculate(e)", {"calc": cached, "e": expression})
+        results[f"calculate.cached.{size}ops"] = {"value": ns, "unit": "ns/expr"}
+
+
+def bench_cold_start(results, runs):
+    command = [sys.executable, os.path.join(ROOT, "run_cli.py"), "2 + 2"]
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, cwd=ROOT)
+        timings.append((time.perf_counter() - start) * 1e3)
+    results["cli.cold_start"] = {"value": statistics.median(timings), "unit": "ms"}
+
+
+def bench_batch(results, count):
+    lines = "".join(f"{make_expression(i % 8)}\n" for i in range(count))
+    for jobs in (1, 2):
+        start = time.perf_counter()
+        run_batch(Calculator(), io.StringIO(lines), io.StringIO(), "plain", jobs)
+        elapsed = time.perf_counter() - start
+        results[f"batch.jobs{jobs}"] = {
+            "value": count / elapsed,
+            "unit": "expr/s",
+            "higher_is_better": True,
+        }
+
+
+def compare(baseline, current, threshold):
+    """Print a comparison table and return the names that regressed."""
+    regressions = []
+    for name, result in sorted(current.items()):
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["value"], result["value"]
+        change = (after - before) / before if before else 0.0
+        if result.get("higher_is_better"):
+            change = -change
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:45s} {before:14.1f} -> {after:14.1f} {result['unit']:8s}"
+            f" {change:+7.1%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculator benchmarks")
+    parser.add_argument("--output", "-o", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against a previous JSON result")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Relative slowdown that counts as a regression (default: 0.10)",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="Fewer sizes and runs, for smoke tests"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    bench_scalar_ops(results)
+    bench_expressions(results, (1, 8) if args.quick else (1, 4, 16, 64))
+    bench_cold_start(results, 3 if args.quick else 15)
+    bench_batch(results, 2000 if args.quick else 100000)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": calculator_c.BACKEND,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(
+                f"{len(regressions)} benchmark(s) regressed by more than "
+                f"{args.threshold:.0%}"
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
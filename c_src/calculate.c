@@ -3,7 +3,33 @@
 #include "calculatePythonWrapper.h"
 #endif  // EXCLUDE_PYTHON_CODE
 #include <math.h>
+#include <stdint.h>
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#ifndef _WIN32
+#define CALC_HAVE_PTHREADS
+#include <pthread.h>
+#include <unistd.h>
+#endif
+
+/* Settings read by kernels while other threads may change them (the Python
+ * wrappers release the GIL). Each call reads a setting once, so relaxed
+ * ordering is enough. Compilers without C11 atomics (MSVC by default) get
+ * volatile instead: aligned int and size_t accesses are atomic there. */
+#if defined(__STDC_VERSION__) && __STDC_VERSION__ >= 201112L && \
+    !defined(__STDC_NO_ATOMICS__)
+#include <stdatomic.h>
+#define CALC_ATOMIC(type) _Atomic type
+#define calc_load(object) atomic_load_explicit(&(object), memory_order_relaxed)
+#define calc_store(object, value) \
+  atomic_store_explicit(&(object), (value), memory_order_relaxed)
+#else
+#define CALC_ATOMIC(type) volatile type
+#define calc_load(object) (object)
+#define calc_store(object, value) ((object) = (value))
+#endif
 
 float add(float num1, float num2) { return num1 + num2; }
 float subtract(float num1, float num2) { return num1 - num2; }
@@ -18,60 +44,1757 @@ float divide(float num1, float num2) {
   }
 }
 
+double add_double(double num1, double num2) { return num1 + num2; }
+double subtract_double(double num1, double num2) { return num1 - num2; }
+double multiply_double(double num1, double num2) { return num1 * num2; }
+double divide_double(double num1, double num2) {
+  return num2 != 0.0 ? num1 / num2 : NAN;
+}
+
+/* Array kernels, for float64 (double) and float32 (float) elements. Every
+ * kernel exists in a scalar version and, on x86 with GCC or Clang, in SSE2,
+ * AVX2 and AVX-512 versions compiled with per-function target attributes,
+ * so the library itself needs no special compiler flags. The fastest
+ * version the CPU supports is chosen on first use; the CALCULATOR_SIMD
+ * environment variable or set_simd_path() can force one. IEEE 754 add,
+ * subtract, multiply and divide are correctly rounded in every instruction
+ * set, so all versions give bit-identical results. */
+
+/* Define the scalar kernels <op><suffix>_scalar over elements of type. */
+#define CALC_DEFINE_SCALAR_KERNELS(suffix, type)                            \
+  static void add##suffix##_scalar(const type* a, const type* b, type* out, \
+                                   size_t n) {                              \
+    for (size_t i = 0; i < n; i++) {                                        \
+      out[i] = a[i] + b[i];                                                 \
+    }                                                                       \
+  }                                                                         \
+  static void subtract##suffix##_scalar(const type* a, const type* b,       \
+                                        type* out, size_t n) {              \
+    for (size_t i = 0; i < n; i++) {                                        \
+      out[i] = a[i] - b[i];                                                 \
+    }                                                                       \
+  }                                                                         \
+  static void multiply##suffix##_scalar(const type* a, const type* b,       \
+                                        type* out, size_t n) {              \
+    for (size_t i = 0; i < n; i++) {                                        \
+      out[i] = a[i] * b[i];                                                 \
+    }                                                                       \
+  }                                                                         \
+  static size_t divide##suffix##_scalar(const type* a, const type* b,       \
+                                        type* out, size_t n) {              \
+    size_t zero_divisors = 0;                                               \
+    for (size_t i = 0; i < n; i++) {                                        \
+      if (b[i] != 0.0) {                                                    \
+        out[i] = a[i] / b[i];                                               \
+      } else {                                                              \
+        out[i] = NAN;                                                       \
+        zero_divisors++;                                                    \
+      }                                                                     \
+    }                                                                       \
+    return zero_divisors;                                                   \
+  }
+
+CALC_DEFINE_SCALAR_KERNELS(, double)
+CALC_DEFINE_SCALAR_KERNELS(_float, float)
+
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__))
+#define CALC_HAVE_X86_SIMD
+#include <immintrin.h>
+
+/* Define the <op><suffix>_<isa> kernels for one instruction set. Vectors of
+ * `width` elements are processed with unaligned loads, the remainder by the
+ * scalar kernels. Divisions by zero are found with a vector compare and
+ * patched to NAN from the lane mask, since out may alias b. */
+#define CALC_DEFINE_SIMD_KERNELS(suffix, type, isa, features, width, vec,     \
+                                 load, store, add_op, sub_op, mul_op, div_op, \
+                                 zero_mask)                                   \
+  __attribute__((target(features))) static void add##suffix##_##isa(          \
+      const type* a, const type* b, type* out, size_t n) {                    \
+    size_t i = 0;                                                             \
+    for (; i + width <= n; i += width) {                                      \
+      store(out + i, add_op(load(a + i), load(b + i)));                       \
+    }                                                                         \
+    add##suffix##_scalar(a + i, b + i, out + i, n - i);                       \
+  }                                                                           \
+  __attribute__((target(features))) static void subtract##suffix##_##isa(     \
+      const type* a, const type* b, type* out, size_t n) {                    \
+    size_t i = 0;                                                             \
+    for (; i + width <= n; i += width) {                                      \
+      store(out + i, sub_op(load(a + i), load(b + i)));                       \
+    }                                                                         \
+    subtract##suffix##_scalar(a + i, b + i, out + i, n - i);                  \
+  }                                                                           \
+  __attribute__((target(features))) static void multiply##suffix##_##isa(     \
+      const type* a, const type* b, type* out, size_t n) {                    \
+    size_t i = 0;                                                             \
+    for (; i + width <= n; i += width) {                                      \
+      store(out + i, mul_op(load(a + i), load(b + i)));                       \
+    }                                                                         \
+    multiply##suffix##_scalar(a + i, b + i, out + i, n - i);                  \
+  }                                                                           \
+  __attribute__((target(features))) static size_t divide##suffix##_##isa(     \
+      const type* a, const type* b, type* out, size_t n) {                    \
+    size_t zero_divisors = 0;                                                 \
+    size_t i = 0;                                                             \
+    for (; i + width <= n; i += width) {                                      \
+      vec divisor = load(b + i);                                              \
+      unsigned int zeros = zero_mask(divisor);                                \
+      store(out + i, div_op(load(a + i), divisor));                           \
+      if (zeros != 0) {                                                       \
+        for (int k = 0; k < width; k++) {                                     \
+          if (zeros >> k & 1) {                                               \
+            out[i + k] = NAN;                                                 \
+            zero_divisors++;                                                  \
+          }                                                                   \
+        }                                                                     \
+      }                                                                       \
+    }                                                                         \
+    return zero_divisors +                                                    \
+           divide##suffix##_scalar(a + i, b + i, out + i, n - i);             \
+  }
+
+#define CALC_SSE2_ZEROS_PD(v) \
+  ((unsigned int)_mm_movemask_pd(_mm_cmpeq_pd((v), _mm_setzero_pd())))
+#define CALC_SSE2_ZEROS_PS(v) \
+  ((unsigned int)_mm_movemask_ps(_mm_cmpeq_ps((v), _mm_setzero_ps())))
+#define CALC_AVX2_ZEROS_PD(v)        \
+  ((unsigned int)_mm256_movemask_pd( \
+      _mm256_cmp_pd((v), _mm256_setzero_pd(), _CMP_EQ_OQ)))
+#define CALC_AVX2_ZEROS_PS(v)        \
+  ((unsigned int)_mm256_movemask_ps( \
+      _mm256_cmp_ps((v), _mm256_setzero_ps(), _CMP_EQ_OQ)))
+#define CALC_AVX512_ZEROS_PD(v) \
+  ((unsigned int)_mm512_cmp_pd_mask((v), _mm512_setzero_pd(), _CMP_EQ_OQ))
+#define CALC_AVX512_ZEROS_PS(v) \
+  ((unsigned int)_mm512_cmp_ps_mask((v), _mm512_setzero_ps(), _CMP_EQ_OQ))
+
+CALC_DEFINE_SIMD_KERNELS(, double, sse2, "sse2", 2, __m128d, _mm_loadu_pd,
+                         _mm_storeu_pd, _mm_add_pd, _mm_sub_pd, _mm_mul_pd,
+                         _mm_div_pd, CALC_SSE2_ZEROS_PD)
+CALC_DEFINE_SIMD_KERNELS(, double, avx2, "avx2", 4, __m256d, _mm256_loadu_pd,
+                         _mm256_storeu_pd, _mm256_add_pd, _mm256_sub_pd,
+                         _mm256_mul_pd, _mm256_div_pd, CALC_AVX2_ZEROS_PD)
+CALC_DEFINE_SIMD_KERNELS(, double, avx512, "avx512f", 8, __m512d,
+                         _mm512_loadu_pd, _mm512_storeu_pd, _mm512_add_pd,
+                         _mm512_sub_pd, _mm512_mul_pd, _mm512_div_pd,
+                         CALC_AVX512_ZEROS_PD)
+CALC_DEFINE_SIMD_KERNELS(_float, float, sse2, "sse2", 4, __m128, _mm_loadu_ps,
+                         _mm_storeu_ps, _mm_add_ps, _mm_sub_ps, _mm_mul_ps,
+                         _mm_div_ps, CALC_SSE2_ZEROS_PS)
+CALC_DEFINE_SIMD_KERNELS(_float, float, avx2, "avx2", 8, __m256,
+                         _mm256_loadu_ps, _mm256_storeu_ps, _mm256_add_ps,
+                         _mm256_sub_ps, _mm256_mul_ps, _mm256_div_ps,
+                         CALC_AVX2_ZEROS_PS)
+CALC_DEFINE_SIMD_KERNELS(_float, float, avx512, "avx512f", 16, __m512,
+                         _mm512_loadu_ps, _mm512_storeu_ps, _mm512_add_ps,
+                         _mm512_sub_ps, _mm512_mul_ps, _mm512_div_ps,
+                         CALC_AVX512_ZEROS_PS)
+#endif  // x86 SIMD
+
+typedef struct {
+  void (*add)(const double*, const double*, double*, size_t);
+  void (*subtract)(const double*, const double*, double*, size_t);
+  void (*multiply)(const double*, const double*, double*, size_t);
+  size_t (*divide)(const double*, const double*, double*, size_t);
+  void (*add_float)(const float*, const float*, float*, size_t);
+  void (*subtract_float)(const float*, const float*, float*, size_t);
+  void (*multiply_float)(const float*, const float*, float*, size_t);
+  size_t (*divide_float)(const float*, const float*, float*, size_t);
+} calc_kernel_table;
+
+#define CALC_KERNEL_TABLE(isa) \
+  {add_##isa,                  \
+   subtract_##isa,             \
+   multiply_##isa,             \
+   divide_##isa,               \
+   add_float_##isa,            \
+   subtract_float_##isa,       \
+   multiply_float_##isa,       \
+   divide_float_##isa}
+
+/* Indexed by calc_simd_path. */
+static const calc_kernel_table kernel_tables[] = {
+    CALC_KERNEL_TABLE(scalar),
+#ifdef CALC_HAVE_X86_SIMD
+    CALC_KERNEL_TABLE(sse2),
+    CALC_KERNEL_TABLE(avx2),
+    CALC_KERNEL_TABLE(avx512),
+#endif
+};
+
+static const char* const simd_path_names[] = {"scalar", "sse2", "avx2",
+                                              "avx512"};
+
+/* CALC_SIMD_AUTO until first use. */
+static CALC_ATOMIC(int) active_simd_path = CALC_SIMD_AUTO;
+
+static int simd_path_supported(int path) {
+  switch (path) {
+    case CALC_SIMD_SCALAR:
+      return 1;
+#ifdef CALC_HAVE_X86_SIMD
+    case CALC_SIMD_SSE2:
+      return __builtin_cpu_supports("sse2");
+    case CALC_SIMD_AVX2:
+      return __builtin_cpu_supports("avx2");
+    case CALC_SIMD_AVX512:
+      return __builtin_cpu_supports("avx512f");
+#endif
+    default:
+      return 0;
+  }
+}
+
+/* The path named by CALCULATOR_SIMD if it is supported, else the best. */
+static int select_simd_path(void) {
+  const char* forced = getenv("CALCULATOR_SIMD");
+  int path;
+  for (path = CALC_SIMD_AVX512; forced != NULL && path >= 0; path--) {
+    if (strcmp(forced, simd_path_names[path]) == 0 &&
+        simd_path_supported(path)) {
+      return path;
+    }
+  }
+  for (path = CALC_SIMD_AVX512; !simd_path_supported(path); path--) {
+  }
+  return path;
+}
+
+static const calc_kernel_table* kernels(void) {
+  int path = calc_load(active_simd_path);
+  if (path == CALC_SIMD_AUTO) {
+    path = select_simd_path();
+    calc_store(active_simd_path, path);
+  }
+  return &kernel_tables[path];
+}
+
+int get_simd_path(void) { return (int)(kernels() - kernel_tables); }
+
+int set_simd_path(int path) {
+  if (path == CALC_SIMD_AUTO) {
+    calc_store(active_simd_path, select_simd_path());
+    return 0;
+  }
+  if (!simd_path_supported(path)) {
+    return -1;
+  }
+  calc_store(active_simd_path, path);
+  return 0;
+}
+
+const char* simd_path_name(int path) {
+  if (path < CALC_SIMD_SCALAR || path > CALC_SIMD_AVX512) {
+    return NULL;
+  }
+  return simd_path_names[path];
+}
+
+void add_array(const double* a, const double* b, double* out, size_t n) {
+  kernels()->add(a, b, out, n);
+}
+
+void subtract_array(const double* a, const double* b, double* out, size_t n) {
+  kernels()->subtract(a, b, out, n);
+}
+
+void multiply_array(const double* a, const double* b, double* out, size_t n) {
+  kernels()->multiply(a, b, out, n);
+}
+
+size_t divide_array(const double* a, const double* b, double* out, size_t n) {
+  return kernels()->divide(a, b, out, n);
+}
+
+void add_array_float(const float* a, const float* b, float* out, size_t n) {
+  kernels()->add_float(a, b, out, n);
+}
+
+void subtract_array_float(const float* a, const float* b, float* out,
+                          size_t n) {
+  kernels()->subtract_float(a, b, out, n);
+}
+
+void multiply_array_float(const float* a, const float* b, float* out,
+                          size_t n) {
+  kernels()->multiply_float(a, b, out, n);
+}
+
+size_t divide_array_float(const float* a, const float* b, float* out,
+                          size_t n) {
+  return kernels()->divide_float(a, b, out, n);
+}
+
+/* Elements per block of strided_array_op: three blocks of doubles on the
+ * stack. */
+#define CALC_STRIDED_BLOCK 256
+
+/* Define contiguous_op<suffix>, running one arithmetic opcode's kernel,
+ * and the public strided_array_op<suffix> over elements of type. */
+#define CALC_DEFINE_STRIDED_OP(suffix, type)                                 \
+  static size_t contiguous_op##suffix(int opcode, const type* a,             \
+                                      const type* b, type* out, size_t n) {  \
+    switch (opcode) {                                                        \
+      case CALC_OP_ADD:                                                      \
+        add_array##suffix(a, b, out, n);                                     \
+        return 0;                                                            \
+      case CALC_OP_SUBTRACT:                                                 \
+        subtract_array##suffix(a, b, out, n);                                \
+        return 0;                                                            \
+      case CALC_OP_MULTIPLY:                                                 \
+        multiply_array##suffix(a, b, out, n);                                \
+        return 0;                                                            \
+      default:                                                               \
+        return divide_array##suffix(a, b, out, n);                           \
+    }                                                                        \
+  }                                                                          \
+  size_t strided_array_op##suffix(                                           \
+      int opcode, const type* a, ptrdiff_t a_stride, const type* b,          \
+      ptrdiff_t b_stride, type* out, ptrdiff_t out_stride, size_t n) {       \
+    const ptrdiff_t size = sizeof(type);                                     \
+    type a_block[CALC_STRIDED_BLOCK], b_block[CALC_STRIDED_BLOCK];           \
+    type out_block[CALC_STRIDED_BLOCK];                                      \
+    size_t zero_divisors = 0;                                                \
+    if (opcode < CALC_OP_ADD || opcode > CALC_OP_DIVIDE) {                   \
+      return SIZE_MAX;                                                       \
+    }                                                                        \
+    if (a_stride == size && b_stride == size && out_stride == size) {        \
+      return contiguous_op##suffix(opcode, a, b, out, n);                    \
+    }                                                                        \
+    for (size_t start = 0; start < n; start += CALC_STRIDED_BLOCK) {         \
+      size_t count = n - start;                                              \
+      if (count > CALC_STRIDED_BLOCK) {                                      \
+        count = CALC_STRIDED_BLOCK;                                          \
+      }                                                                      \
+      for (size_t i = 0; i < count; i++) {                                   \
+        ptrdiff_t k = (ptrdiff_t)(start + i);                                \
+        memcpy(&a_block[i], (const char*)a + k * a_stride, size);            \
+        memcpy(&b_block[i], (const char*)b + k * b_stride, size);            \
+      }                                                                      \
+      zero_divisors +=                                                       \
+          contiguous_op##suffix(opcode, a_block, b_block, out_block, count); \
+      for (size_t i = 0; i < count; i++) {                                   \
+        ptrdiff_t k = (ptrdiff_t)(start + i);                                \
+        memcpy((char*)out + k * out_stride, &out_block[i], size);            \
+      }                                                                      \
+    }                                                                        \
+    return zero_divisors;                                                    \
+  }
+
+CALC_DEFINE_STRIDED_OP(, double)
+CALC_DEFINE_STRIDED_OP(_float, float)
+
+/* Reductions all follow the same binary tree over the input: a range of
+ * more than CALC_PAIRWISE_BLOCK elements is split in two and the halves'
+ * results are combined; smaller ranges are reduced by a loop with eight
+ * independent accumulators. The tree depends only on n, so evaluating its
+ * top subtrees on separate threads gives the same result as one thread. */
+
+#define CALC_PAIRWISE_BLOCK 128
+/* Fewest elements worth a thread of their own. */
+#define CALC_THREAD_MIN_ELEMENTS ((size_t)1 << 17)
+#define CALC_MAX_THREADS 64
+
+enum calc_reduction {
+  CALC_REDUCE_SUM,
+  CALC_REDUCE_PRODUCT,
+  CALC_REDUCE_MIN,
+  CALC_REDUCE_MAX,
+  CALC_REDUCE_DOT
+};
+
+typedef struct {
+  int kind;
+  const double* a;
+  const double* b; /* second operand of CALC_REDUCE_DOT, else NULL */
+} calc_reduction_input;
+
+static CALC_ATOMIC(size_t) reduction_threads = 0;
+
+static double combine(int kind, double x, double y) {
+  switch (kind) {
+    case CALC_REDUCE_PRODUCT:
+      return x * y;
+    case CALC_REDUCE_MIN:
+      return x < y || x != x ? x : y;
+    case CALC_REDUCE_MAX:
+      return x > y || x != x ? x : y;
+    default:
+      return x + y;
+  }
+}
+
+static size_t split_point(size_t n) {
+  size_t half = n / 2;
+  return half - half % 8;
+}
+
+/* Reduce n (at least 1 for min and max) elements from start. */
+static double reduce_leaf(const calc_reduction_input* input, size_t start,
+                          size_t n) {
+  const double* a = input->a + start;
+  const double* b = input->b != NULL ? input->b + start : NULL;
+  int kind = input->kind;
+  double acc[8];
+  double result;
+  size_t i = 0;
+
+  if (kind == CALC_REDUCE_MIN || kind == CALC_REDUCE_MAX) {
+    result = a[0];
+    for (i = 1; i < n; i++) {
+      result = combine(kind, result, a[i]);
+    }
+    return result;
+  }
+  for (int k = 0; k < 8; k++) {
+    acc[k] = kind == CALC_REDUCE_PRODUCT ? 1.0 : 0.0;
+  }
+  if (kind == CALC_REDUCE_SUM) {
+    for (; i + 8 <= n; i += 8) {
+      for (int k = 0; k < 8; k++) {
+        acc[k] += a[i + k];
+      }
+    }
+  } else if (kind == CALC_REDUCE_DOT) {
+    for (; i + 8 <= n; i += 8) {
+      for (int k = 0; k < 8; k++) {
+        acc[k] += a[i + k] * b[i + k];
+      }
+    }
+  } else {
+    for (; i + 8 <= n; i += 8) {
+      for (int k = 0; k < 8; k++) {
+        acc[k] *= a[i + k];
+      }
+    }
+  }
+  result = combine(kind,
+                   combine(kind, combine(kind, acc[0], acc[1]),
+                           combine(kind, acc[2], acc[3])),
+                   combine(kind, combine(kind, acc[4], acc[5]),
+                           combine(kind, acc[6], acc[7])));
+  for (; i < n; i++) {
+    result = combine(kind, result, b != NULL ? a[i] * b[i] : a[i]);
+  }
+  return result;
+}
+
+static double reduce_range(const calc_reduction_input* input, size_t start,
+                           size_t n) {
+  if (n <= CALC_PAIRWISE_BLOCK) {
+    return reduce_leaf(input, start, n);
+  }
+  size_t half = split_point(n);
+  double left = reduce_range(input, start, half);
+  return combine(input->kind, left,
+                 reduce_range(input, start + half, n - half));
+}
+
+typedef struct {
+  const calc_reduction_input* input;
+  size_t start;
+  size_t n;
+  double result;
+} calc_reduction_task;
+
+static void* run_reduction_task(void* arg) {
+  calc_reduction_task* task = arg;
+  task->result = reduce_range(task->input, task->start, task->n);
+  return NULL;
+}
+
+/* Number of threads to use for n elements. */
+static size_t thread_count(size_t n) {
+#ifdef CALC_HAVE_PTHREADS
+  size_t threads = calc_load(reduction_threads);
+  if (threads == 0) {
+    long cpus = sysconf(_SC_NPROCESSORS_ONLN);
+    threads = cpus > 0 ? (size_t)cpus : 1;
+  }
+  if (threads > n / CALC_THREAD_MIN_ELEMENTS) {
+    threads = n / CALC_THREAD_MIN_ELEMENTS;
+  }
+  return threads < CALC_MAX_THREADS ? threads : CALC_MAX_THREADS;
+#else
+  return 1;
+#endif
+}
+
+static double reduce(int kind, const double* a, const double* b, size_t n) {
+  calc_reduction_input input = {kind, a, b};
+  calc_reduction_task tasks[CALC_MAX_THREADS];
+  size_t threads = thread_count(n);
+  size_t count = 1;
+
+  /* Cut the tree into the 2^k subtrees at depth k, one per thread. Each
+   * has at least CALC_THREAD_MIN_ELEMENTS elements, so none is a leaf. */
+  tasks[0].input = &input;
+  tasks[0].start = 0;
+  tasks[0].n = n;
+  while (count * 2 <= threads) {
+    for (size_t k = count; k-- > 0;) {
+      calc_reduction_task parent = tasks[k];
+      size_t half = split_point(parent.n);
+      tasks[2 * k] = parent;
+      tasks[2 * k].n = half;
+      tasks[2 * k + 1] = parent;
+      tasks[2 * k + 1].start = parent.start + half;
+      tasks[2 * k + 1].n = parent.n - half;
+    }
+    count *= 2;
+  }
+  if (count == 1) {
+    return reduce_range(&input, 0, n);
+  }
+
+#ifdef CALC_HAVE_PTHREADS
+  pthread_t ids[CALC_MAX_THREADS];
+  int started[CALC_MAX_THREADS];
+  for (size_t k = 1; k < count; k++) {
+    started[k] =
+        pthread_create(&ids[k], NULL, run_reduction_task, &tasks[k]) == 0;
+  }
+  run_reduction_task(&tasks[0]);
+  for (size_t k = 1; k < count; k++) {
+    if (started[k]) {
+      pthread_join(ids[k], NULL);
+    } else {
+      run_reduction_task(&tasks[k]);
+    }
+  }
+#endif
+
+  /* Combine the subtree results in the order reduce_range would. */
+  for (; count > 1; count /= 2) {
+    for (size_t k = 0; k < count / 2; k++) {
+      tasks[k].result =
+          combine(kind, tasks[2 * k].result, tasks[2 * k + 1].result);
+    }
+  }
+  return tasks[0].result;
+}
+
+double sum_array(const double* a, size_t n) {
+  return reduce(CALC_REDUCE_SUM, a, NULL, n);
+}
+
+double product_array(const double* a, size_t n) {
+  return reduce(CALC_REDUCE_PRODUCT, a, NULL, n);
+}
+
+double min_array(const double* a, size_t n) {
+  return n > 0 ? reduce(CALC_REDUCE_MIN, a, NULL, n) : NAN;
+}
+
+double max_array(const double* a, size_t n) {
+  return n > 0 ? reduce(CALC_REDUCE_MAX, a, NULL, n) : NAN;
+}
+
+double mean_array(const double* a, size_t n) {
+  return n > 0 ? sum_array(a, n) / (double)n : NAN;
+}
+
+double dot_array(const double* a, const double* b, size_t n) {
+  return reduce(CALC_REDUCE_DOT, a, b, n);
+}
+
+size_t set_reduction_threads(size_t threads) {
+  size_t previous = calc_load(reduction_threads);
+  calc_store(reduction_threads, threads);
+  return previous;
+}
+
+/* Check a STORE or RECALL against the registers defined so far, defining
+ * a new one for a STORE to the next index. Returns 0 if valid, else -1. */
+static int use_register(const calc_instruction* ins, size_t* registers) {
+  if (ins->index < 0 || (size_t)ins->index > *registers) {
+    return -1;
+  }
+  if ((size_t)ins->index == *registers) {
+    if (ins->opcode == CALC_OP_RECALL) {
+      return -1;
+    }
+    (*registers)++;
+  }
+  return 0;
+}
+
+int check_program(const calc_instruction* code, size_t n) {
+  int depth = 0;
+  int max_depth = 0;
+  size_t registers = 0;
+  for (size_t i = 0; i < n; i++) {
+    switch (code[i].opcode) {
+      case CALC_OP_PUSH:
+      case CALC_OP_LOAD:
+        depth++;
+        break;
+      case CALC_OP_RECALL:
+        if (use_register(&code[i], &registers) != 0) {
+          return -1;
+        }
+        depth++;
+        break;
+      case CALC_OP_STORE:
+        if (depth < 1 || use_register(&code[i], &registers) != 0) {
+          return -1;
+        }
+        break;
+      case CALC_OP_ADD:
+      case CALC_OP_SUBTRACT:
+      case CALC_OP_MULTIPLY:
+      case CALC_OP_DIVIDE:
+        if (depth < 2) {
+          return -1;
+        }
+        depth--;
+        break;
+      case CALC_OP_NEGATE:
+        if (depth < 1) {
+          return -1;
+        }
+        break;
+      default:
+        return -1;
+    }
+    if (depth > max_depth) {
+      max_depth = depth;
+    }
+  }
+  return depth == 1 ? max_depth : -1;
+}
+
+/* Number of registers used by a program accepted by check_program. */
+static size_t count_registers(const calc_instruction* code, size_t n) {
+  size_t registers = 0;
+  for (size_t i = 0; i < n; i++) {
+    if (code[i].opcode == CALC_OP_STORE && (size_t)code[i].index >= registers) {
+      registers = (size_t)code[i].index + 1;
+    }
+  }
+  return registers;
+}
+
+#define CALC_SMALL_STACK 64
+
+/* Precision of a program's arithmetic. */
+enum calc_precision { CALC_FLOAT32, CALC_FLOAT64 };
+
+/* Evaluate a program; CALC_FLOAT32 narrows constants, variables and the
+ * result of every operation to float, like run_program_columns_float. */
+static int execute_program(const calc_instruction* code, size_t n,
+                           const double* variables, size_t n_variables,
+                           int precision, double* result) {
+  /* The stack and the registers each need at most n slots. */
+  double small_stack[2 * CALC_SMALL_STACK];
+  double* stack = small_stack;
+  double* registers;
+  size_t n_registers = 0;
+  size_t sp = 0;
+  int status = CALC_OK;
+
+  if (n > CALC_SMALL_STACK) {
+    stack = malloc(2 * n * sizeof(double));
+    if (stack == NULL) {
+      return CALC_ERR_NO_MEMORY;
+    }
+  }
+  registers = stack + (n > CALC_SMALL_STACK ? n : CALC_SMALL_STACK);
+  for (size_t i = 0; i < n && status == CALC_OK; i++) {
+    const calc_instruction* ins = &code[i];
+    if (ins->opcode == CALC_OP_PUSH) {
+      stack[sp++] = precision == CALC_FLOAT32 ? (float)ins->value : ins->value;
+      continue;
+    }
+    if (ins->opcode == CALC_OP_LOAD) {
+      if (ins->index < 0 || (size_t)ins->index >= n_variables) {
+        status = CALC_ERR_BAD_VARIABLE;
+      } else {
+        double value = variables[ins->index];
+        stack[sp++] = precision == CALC_FLOAT32 ? (float)value : value;
+      }
+      continue;
+    }
+    if (ins->opcode == CALC_OP_NEGATE) {
+      if (sp < 1) {
+        status = CALC_ERR_BAD_PROGRAM;
+      } else {
+        stack[sp - 1] = -stack[sp - 1];
+      }
+      continue;
+    }
+    if (ins->opcode == CALC_OP_STORE) {
+      if (sp < 1 || use_register(ins, &n_registers) != 0) {
+        status = CALC_ERR_BAD_PROGRAM;
+      } else {
+        registers[ins->index] = stack[sp - 1];
+      }
+      continue;
+    }
+    if (ins->opcode == CALC_OP_RECALL) {
+      if (use_register(ins, &n_registers) != 0) {
+        status = CALC_ERR_BAD_PROGRAM;
+      } else {
+        stack[sp++] = registers[ins->index];
+      }
+      continue;
+    }
+    if (sp < 2) {
+      status = CALC_ERR_BAD_PROGRAM;
+      continue;
+    }
+    double right = stack[--sp];
+    double left = stack[sp - 1];
+    switch (ins->opcode) {
+      case CALC_OP_ADD:
+        stack[sp - 1] =
+            precision == CALC_FLOAT32 ? add(left, right) : left + right;
+        break;
+      case CALC_OP_SUBTRACT:
+        stack[sp - 1] =
+            precision == CALC_FLOAT32 ? subtract(left, right) : left - right;
+        break;
+      case CALC_OP_MULTIPLY:
+        stack[sp - 1] =
+            precision == CALC_FLOAT32 ? multiply(left, right) : left * right;
+        break;
+      case CALC_OP_DIVIDE:
+        if (precision == CALC_FLOAT32 ? (float)right == 0.0f : right == 0.0) {
+          status = CALC_ERR_DIVISION_BY_ZERO;
+        } else {
+          stack[sp - 1] =
+              precision == CALC_FLOAT32 ? divide(left, right) : left / right;
+        }
+        break;
+      default:
+        status = CALC_ERR_BAD_PROGRAM;
+    }
+  }
+  if (status == CALC_OK) {
+    if (sp == 1) {
+      *result = stack[0];
+    } else {
+      status = CALC_ERR_BAD_PROGRAM;
+    }
+  }
+  if (stack != small_stack) {
+    free(stack);
+  }
+  return status;
+}
+
+int run_program(const calc_instruction* code, size_t n, const double* variables,
+                size_t n_variables, double* result) {
+  return execute_program(code, n, variables, n_variables, CALC_FLOAT32, result);
+}
+
+int run_program_double(const calc_instruction* code, size_t n,
+                       const double* variables, size_t n_variables,
+                       double* result) {
+  return execute_program(code, n, variables, n_variables, CALC_FLOAT64, result);
+}
+
+/* Rows evaluated per block by run_program_columns; a block of every stack
+ * slot of a typical expression stays in L1/L2 cache. */
+#define CALC_BLOCK 512
+
+/* Blocks are always computed in double. With float32 columns (columns32
+ * and out32 set instead of columns and out) each loaded block is widened
+ * and every operation's result rounded back to float, which gives exactly
+ * the float arithmetic result: double has more than 2 * 24 + 2 bits of
+ * precision, so the double rounding is harmless for + - * and /. */
+static int execute_columns(const calc_instruction* code, size_t n,
+                           const double* const* columns,
+                           const float* const* columns32, size_t n_columns,
+                           size_t length, double* out, float* out32) {
+  int depth = check_program(code, n);
+  if (depth < 0) {
+    return CALC_ERR_BAD_PROGRAM;
+  }
+  for (size_t i = 0; i < n; i++) {
+    if (code[i].opcode == CALC_OP_LOAD &&
+        (code[i].index < 0 || (size_t)code[i].index >= n_columns)) {
+      return CALC_ERR_BAD_VARIABLE;
+    }
+  }
+
+  /* Stack slot k holds a block of values. slots[k] points either at the
+   * slot's own buffer or straight into a float64 column, so such loads copy
+   * nothing. Register r keeps its block after the buffers of the slots. */
+  size_t n_registers = count_registers(code, n);
+  double* buffers =
+      malloc(((size_t)depth + n_registers) * CALC_BLOCK * sizeof(double));
+  const double** slots = malloc((size_t)depth * sizeof(double*));
+  double* registers = NULL;
+  int status = CALC_OK;
+  if (buffers == NULL || slots == NULL) {
+    status = CALC_ERR_NO_MEMORY;
+  } else {
+    registers = buffers + (size_t)depth * CALC_BLOCK;
+  }
+
+  for (size_t start = 0; start < length && status == CALC_OK;
+       start += CALC_BLOCK) {
+    size_t m = length - start < CALC_BLOCK ? length - start : CALC_BLOCK;
+    size_t sp = 0;
+    for (size_t i = 0; i < n && status == CALC_OK; i++) {
+      const calc_instruction* ins = &code[i];
+      double* buffer;
+      switch (ins->opcode) {
+        case CALC_OP_PUSH:
+          buffer = buffers + sp * CALC_BLOCK;
+          for (size_t j = 0; j < m; j++) {
+            buffer[j] = columns32 != NULL ? (float)ins->value : ins->value;
+          }
+          slots[sp++] = buffer;
+          break;
+        case CALC_OP_LOAD:
+          if (columns32 == NULL) {
+            slots[sp++] = columns[ins->index] + start;
+            break;
+          }
+          buffer = buffers + sp * CALC_BLOCK;
+          for (size_t j = 0; j < m; j++) {
+            buffer[j] = columns32[ins->index][start + j];
+          }
+          slots[sp++] = buffer;
+          break;
+        case CALC_OP_STORE:
+          memcpy(registers + (size_t)ins->index * CALC_BLOCK, slots[sp - 1],
+                 m * sizeof(double));
+          break;
+        case CALC_OP_RECALL:
+          slots[sp++] = registers + (size_t)ins->index * CALC_BLOCK;
+          break;
+        case CALC_OP_NEGATE:
+          buffer = buffers + (sp - 1) * CALC_BLOCK;
+          for (size_t j = 0; j < m; j++) {
+            buffer[j] = -slots[sp - 1][j];
+          }
+          slots[sp - 1] = buffer;
+          break;
+        default:
+          sp--;
+          buffer = buffers + (sp - 1) * CALC_BLOCK;
+          if (ins->opcode == CALC_OP_ADD) {
+            add_array(slots[sp - 1], slots[sp], buffer, m);
+          } else if (ins->opcode == CALC_OP_SUBTRACT) {
+            subtract_array(slots[sp - 1], slots[sp], buffer, m);
+          } else if (ins->opcode == CALC_OP_MULTIPLY) {
+            multiply_array(slots[sp - 1], slots[sp], buffer, m);
+          } else if (divide_array(slots[sp - 1], slots[sp], buffer, m) > 0) {
+            status = CALC_ERR_DIVISION_BY_ZERO;
+          }
+          if (columns32 != NULL) {
+            for (size_t j = 0; j < m; j++) {
+              buffer[j] = (float)buffer[j];
+            }
+          }
+          slots[sp - 1] = buffer;
+      }
+    }
+    if (status == CALC_OK && out32 != NULL) {
+      for (size_t j = 0; j < m; j++) {
+        out32[start + j] = (float)slots[0][j];
+      }
+    } else if (status == CALC_OK) {
+      memmove(out + start, slots[0], m * sizeof(double));
+    }
+  }
+  free(buffers);
+  free((void*)slots);
+  return status;
+}
+
+int run_program_columns(const calc_instruction* code, size_t n,
+                        const double* const* columns, size_t n_columns,
+                        size_t length, double* out) {
+  return execute_columns(code, n, columns, NULL, n_columns, length, out, NULL);
+}
+
+int run_program_columns_float(const calc_instruction* code, size_t n,
+                              const float* const* columns, size_t n_columns,
+                              size_t length, float* out) {
+  return execute_columns(code, n, NULL, columns, n_columns, length, NULL, out);
+}
+
 #ifndef EXCLUDE_PYTHON_CODE
 /* Python wrapper functions */
 
-PyObject* py_add(PyObject* self, PyObject* args) {
+/* Scalar wrappers use METH_FASTCALL: arguments arrive as a C array, so no
+ * argument tuple is built or parsed per call. */
+
+static int parse_operands(const char* name, PyObject* const* args,
+                          Py_ssize_t nargs, double* a, double* b) {
+  if (nargs != 2) {
+    PyErr_Format(PyExc_TypeError, "%s() takes exactly 2 arguments (%zd given)",
+                 name, nargs);
+    return -1;
+  }
+  *a = PyFloat_AsDouble(args[0]);
+  if (*a == -1.0 && PyErr_Occurred()) {
+    return -1;
+  }
+  *b = PyFloat_AsDouble(args[1]);
+  if (*b == -1.0 && PyErr_Occurred()) {
+    return -1;
+  }
+  return 0;
+}
+
+PyObject* py_add(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
   double a, b;
-  if (!PyArg_ParseTuple(args, "dd", &a, &b)) {
+  if (parse_operands("add", args, nargs, &a, &b) != 0) {
     return NULL;
   }
   return PyFloat_FromDouble(add(a, b));
 }
 
-PyObject* py_subtract(PyObject* self, PyObject* args) {
+PyObject* py_subtract(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
   double a, b;
-  if (!PyArg_ParseTuple(args, "dd", &a, &b)) {
+  if (parse_operands("subtract", args, nargs, &a, &b) != 0) {
     return NULL;
   }
   return PyFloat_FromDouble(subtract(a, b));
 }
 
-PyObject* py_multiply(PyObject* self, PyObject* args) {
+PyObject* py_multiply(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
   double a, b;
-  if (!PyArg_ParseTuple(args, "dd", &a, &b)) {
+  if (parse_operands("multiply", args, nargs, &a, &b) != 0) {
     return NULL;
   }
   return PyFloat_FromDouble(multiply(a, b));
 }
 
-PyObject* py_divide(PyObject* self, PyObject* args) {
+PyObject* py_divide(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
   double a, b;
-  if (!PyArg_ParseTuple(args, "dd", &a, &b)) {
+  if (parse_operands("divide", args, nargs, &a, &b) != 0) {
     return NULL;
   }
-  if (b == 0.0) {
+  /* Checked after narrowing: a tiny b is a zero float divisor. */
+  if ((float)b == 0.0f) {
     PyErr_SetString(PyExc_ZeroDivisionError, "Division by zero");
     return NULL;
   }
   return PyFloat_FromDouble(divide(a, b));
 }
 
+PyObject* py_add_double(PyObject* self, PyObject* const* args,
+                        Py_ssize_t nargs) {
+  double a, b;
+  if (parse_operands("add_double", args, nargs, &a, &b) != 0) {
+    return NULL;
+  }
+  return PyFloat_FromDouble(add_double(a, b));
+}
+
+PyObject* py_subtract_double(PyObject* self, PyObject* const* args,
+                             Py_ssize_t nargs) {
+  double a, b;
+  if (parse_operands("subtract_double", args, nargs, &a, &b) != 0) {
+    return NULL;
+  }
+  return PyFloat_FromDouble(subtract_double(a, b));
+}
+
+PyObject* py_multiply_double(PyObject* self, PyObject* const* args,
+                             Py_ssize_t nargs) {
+  double a, b;
+  if (parse_operands("multiply_double", args, nargs, &a, &b) != 0) {
+    return NULL;
+  }
+  return PyFloat_FromDouble(multiply_double(a, b));
+}
+
+PyObject* py_divide_double(PyObject* self, PyObject* const* args,
+                           Py_ssize_t nargs) {
+  double a, b;
+  if (parse_operands("divide_double", args, nargs, &a, &b) != 0) {
+    return NULL;
+  }
+  if (b == 0.0) {
+    PyErr_SetString(PyExc_ZeroDivisionError, "Division by zero");
+    return NULL;
+  }
+  return PyFloat_FromDouble(divide_double(a, b));
+}
+
+/* The wrappers below release the GIL while a native loop over at least
+ * this many elements runs, so other Python threads run meanwhile; shorter
+ * loops take less time than handing the GIL over. Operand buffers stay
+ * exported, so they cannot be resized in the meantime. */
+#define CALC_RELEASE_GIL_MIN_ELEMENTS 4096
+
+static PyThreadState* release_gil(size_t n) {
+  return n >= CALC_RELEASE_GIL_MIN_ELEMENTS ? PyEval_SaveThread() : NULL;
+}
+
+static void restore_gil(PyThreadState* state) {
+  if (state != NULL) {
+    PyEval_RestoreThread(state);
+  }
+}
+
+/* Array wrappers: operands are any buffer-protocol object holding float64
+ * values ('d'), or float32 values ('f') for the *_float functions. Other
+ * inputs are converted through array.array(code, obj). */
+
+static PyObject* array_type = NULL;
+
+static PyObject* new_typed_array(char code, Py_ssize_t n) {
+  size_t itemsize = code == 'f' ? sizeof(float) : sizeof(double);
+  PyObject* zeros = PyBytes_FromStringAndSize(NULL, n * itemsize);
+  if (zeros == NULL) {
+    return NULL;
+  }
+  memset(PyBytes_AS_STRING(zeros), 0, n * itemsize);
+  PyObject* result = PyObject_CallFunction(array_type, "CO", code, zeros);
+  Py_DECREF(zeros);
+  return result;
+}
+
+/* True for the struct format of a native `code` ('d' or 'f') element. */
+static int is_format(const char* format, char code) {
+  if (format == NULL) {
+    return 0;
+  }
+  if (format[0] == '<' || format[0] == '=') {
+    format++;
+  }
+  return format[0] == code && format[1] == '\0';
+}
+
+/* Fill view with a contiguous buffer of `code` elements for obj. On success
+ * *holder owns any temporary conversion and must be released after the
+ * view. */
+static int get_typed_buffer(PyObject* obj, Py_buffer* view, int writable,
+                            PyObject** holder, char code) {
+  int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT;
+  size_t itemsize = code == 'f' ? sizeof(float) : sizeof(double);
+  *holder = NULL;
+  if (writable) {
+    flags |= PyBUF_WRITABLE;
+  }
+  if (PyObject_CheckBuffer(obj) && PyObject_GetBuffer(obj, view, flags) == 0) {
+    if (is_format(view->format, code) ||
+        (strcmp(view->format, "B") == 0 && view->len % itemsize == 0)) {
+      return 0;
+    }
+    PyBuffer_Release(view);
+  }
+  PyErr_Clear();
+  if (writable) {
+    PyErr_Format(PyExc_TypeError, "out must be a writable contiguous %s buffer",
+                 code == 'f' ? "float32" : "float64");
+    return -1;
+  }
+  *holder = PyObject_CallFunction(array_type, "CO", code, obj);
+  if (*holder == NULL) {
+    return -1;
+  }
+  if (PyObject_GetBuffer(*holder, view, flags) != 0) {
+    Py_CLEAR(*holder);
+    return -1;
+  }
+  return 0;
+}
+
+static int get_double_buffer(PyObject* obj, Py_buffer* view, int writable,
+                             PyObject** holder) {
+  return get_typed_buffer(obj, view, writable, holder, 'd');
+}
+
+/* An operand of the element-wise wrappers: view.len / itemsize elements,
+ * `stride` bytes apart from view.buf. */
+typedef struct {
+  Py_buffer view;
+  PyObject* holder; /* owns any conversion of the original object */
+  Py_ssize_t stride;
+} array_operand;
+
+/* Fill operand for obj without copying when obj is a 1-D buffer of `code`
+ * elements, strided or not; otherwise as get_typed_buffer. */
+static int get_operand(PyObject* obj, array_operand* operand, int writable,
+                       char code) {
+  int flags = PyBUF_STRIDES | PyBUF_FORMAT;
+  Py_buffer* view = &operand->view;
+  if (writable) {
+    flags |= PyBUF_WRITABLE;
+  }
+  operand->holder = NULL;
+  if (PyObject_CheckBuffer(obj) && PyObject_GetBuffer(obj, view, flags) == 0) {
+    if (view->ndim == 1 && is_format(view->format, code)) {
+      operand->stride = view->strides[0];
+      return 0;
+    }
+    PyBuffer_Release(view);
+  }
+  PyErr_Clear();
+  operand->stride = code == 'f' ? sizeof(float) : sizeof(double);
+  if (get_typed_buffer(obj, view, writable, &operand->holder, code) != 0) {
+    if (writable) {
+      PyErr_Format(PyExc_TypeError, "out must be a writable 1-D %s buffer",
+                   code == 'f' ? "float32" : "float64");
+    }
+    return -1;
+  }
+  return 0;
+}
+
+static void release_operand(array_operand* operand) {
+  PyBuffer_Release(&operand->view);
+  Py_XDECREF(operand->holder);
+}
+
+/* Lowest and one past the highest byte address an operand touches. */
+static void operand_bounds(const array_operand* operand, Py_ssize_t itemsize,
+                           const char** low, const char** high) {
+  const char* first = operand->view.buf;
+  Py_ssize_t span = (operand->view.len / itemsize - 1) * operand->stride;
+  *low = span < 0 ? first + span : first;
+  *high = (span < 0 ? first : first + span) + itemsize;
+}
+
+/* True if input shares memory with out other than element for element. */
+static int overlaps_out(const array_operand* input, const array_operand* out,
+                        Py_ssize_t itemsize) {
+  const char *input_low, *input_high, *out_low, *out_high;
+  if (input->view.len == 0 ||
+      (input->view.buf == out->view.buf && input->stride == out->stride)) {
+    return 0;
+  }
+  operand_bounds(input, itemsize, &input_low, &input_high);
+  operand_bounds(out, itemsize, &out_low, &out_high);
+  return input_low < out_high && out_low < input_high;
+}
+
+/* Replace an input by a contiguous copy, so writing out cannot clobber
+ * elements not read yet. */
+static int copy_operand(array_operand* operand, char code) {
+  Py_ssize_t itemsize = code == 'f' ? sizeof(float) : sizeof(double);
+  Py_ssize_t n = operand->view.len / itemsize;
+  PyObject* copy = new_typed_array(code, n);
+  Py_buffer view;
+  if (copy == NULL) {
+    return -1;
+  }
+  if (PyObject_GetBuffer(copy, &view, PyBUF_C_CONTIGUOUS) != 0) {
+    Py_DECREF(copy);
+    return -1;
+  }
+  for (Py_ssize_t i = 0; i < n; i++) {
+    memcpy((char*)view.buf + i * itemsize,
+           (const char*)operand->view.buf + i * operand->stride, itemsize);
+  }
+  release_operand(operand);
+  operand->view = view;
+  operand->holder = copy;
+  operand->stride = itemsize;
+  return 0;
+}
+
+/* Element-wise wrapper running strided_array_op (or its float version)
+ * for `opcode`. out may be any writable 1-D buffer, including one of the
+ * operands; nothing is allocated when it is given. */
+static PyObject* apply_array_kernel(PyObject* args, PyObject* kwargs,
+                                    int opcode, char code) {
+  static char* kwlist[] = {"a", "b", "out", NULL};
+  PyObject *a_obj, *b_obj, *out_obj = Py_None;
+  PyObject* new_out = NULL;
+  array_operand a, b, out;
+  PyObject* result = NULL;
+  size_t n, zero_divisors;
+  PyThreadState* state;
+  Py_ssize_t itemsize = code == 'f' ? sizeof(float) : sizeof(double);
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO|O", kwlist, &a_obj, &b_obj,
+                                   &out_obj)) {
+    return NULL;
+  }
+  if (get_operand(a_obj, &a, 0, code) != 0) {
+    return NULL;
+  }
+  if (get_operand(b_obj, &b, 0, code) != 0) {
+    goto release_a;
+  }
+  if (a.view.len != b.view.len) {
+    PyErr_SetString(PyExc_ValueError, "operands must have the same length");
+    goto release_b;
+  }
+  if (out_obj == Py_None) {
+    new_out = new_typed_array(code, a.view.len / itemsize);
+    if (new_out == NULL) {
+      goto release_b;
+    }
+    out_obj = new_out;
+  }
+  if (get_operand(out_obj, &out, 1, code) != 0) {
+    goto release_new_out;
+  }
+  if (out.view.len != a.view.len) {
+    PyErr_SetString(PyExc_ValueError, "out must match the operand length");
+    goto release_out;
+  }
+  if ((overlaps_out(&a, &out, itemsize) && copy_operand(&a, code) != 0) ||
+      (overlaps_out(&b, &out, itemsize) && copy_operand(&b, code) != 0)) {
+    goto release_out;
+  }
+  n = (size_t)(a.view.len / itemsize);
+  state = release_gil(n);
+  if (code == 'f') {
+    zero_divisors =
+        strided_array_op_float(opcode, a.view.buf, a.stride, b.view.buf,
+                               b.stride, out.view.buf, out.stride, n);
+  } else {
+    zero_divisors = strided_array_op(opcode, a.view.buf, a.stride, b.view.buf,
+                                     b.stride, out.view.buf, out.stride, n);
+  }
+  restore_gil(state);
+  if (zero_divisors > 0) {
+    PyErr_SetString(PyExc_ZeroDivisionError, "Division by zero");
+    goto release_out;
+  }
+  Py_INCREF(out_obj);
+  result = out_obj;
+
+release_out:
+  release_operand(&out);
+release_new_out:
+  Py_XDECREF(new_out);
+release_b:
+  release_operand(&b);
+release_a:
+  release_operand(&a);
+  return result;
+}
+
+PyObject* py_add_array(PyObject* self, PyObject* args, PyObject* kwargs) {
+  return apply_array_kernel(args, kwargs, CALC_OP_ADD, 'd');
+}
+
+PyObject* py_subtract_array(PyObject* self, PyObject* args, PyObject* kwargs) {
+  return apply_array_kernel(args, kwargs, CALC_OP_SUBTRACT, 'd');
+}
+
+PyObject* py_multiply_array(PyObject* self, PyObject* args, PyObject* kwargs) {
+  return apply_array_kernel(args, kwargs, CALC_OP_MULTIPLY, 'd');
+}
+
+PyObject* py_divide_array(PyObject* self, PyObject* args, PyObject* kwargs) {
+  return apply_array_kernel(args, kwargs, CALC_OP_DIVIDE, 'd');
+}
+
+PyObject* py_add_array_float(PyObject* self, PyObject* args, PyObject* kwargs) {
+  return apply_array_kernel(args, kwargs, CALC_OP_ADD, 'f');
+}
+
+PyObject* py_subtract_array_float(PyObject* self, PyObject* args,
+                                  PyObject* kwargs) {
+  return apply_array_kernel(args, kwargs, CALC_OP_SUBTRACT, 'f');
+}
+
+PyObject* py_multiply_array_float(PyObject* self, PyObject* args,
+                                  PyObject* kwargs) {
+  return apply_array_kernel(args, kwargs, CALC_OP_MULTIPLY, 'f');
+}
+
+PyObject* py_divide_array_float(PyObject* self, PyObject* args,
+                                PyObject* kwargs) {
+  return apply_array_kernel(args, kwargs, CALC_OP_DIVIDE, 'f');
+}
+
+/* Reduction wrappers. */
+
+typedef double (*array_reduction)(const double*, size_t);
+
+static PyObject* apply_reduction(PyObject* values, array_reduction reduction,
+                                 int needs_values) {
+  Py_buffer view;
+  PyObject* holder;
+  double result;
+  size_t n;
+
+  if (get_double_buffer(values, &view, 0, &holder) != 0) {
+    return NULL;
+  }
+  n = (size_t)view.len / sizeof(double);
+  if (n == 0 && needs_values) {
+    PyBuffer_Release(&view);
+    Py_XDECREF(holder);
+    PyErr_SetString(PyExc_ValueError, "array must not be empty");
+    return NULL;
+  }
+  PyThreadState* state = release_gil(n);
+  result = reduction(view.buf, n);
+  restore_gil(state);
+  PyBuffer_Release(&view);
+  Py_XDECREF(holder);
+  return PyFloat_FromDouble(result);
+}
+
+PyObject* py_sum_array(PyObject* self, PyObject* values) {
+  return apply_reduction(values, sum_array, 0);
+}
+
+PyObject* py_product_array(PyObject* self, PyObject* values) {
+  return apply_reduction(values, product_array, 0);
+}
+
+PyObject* py_min_array(PyObject* self, PyObject* values) {
+  return apply_reduction(values, min_array, 1);
+}
+
+PyObject* py_max_array(PyObject* self, PyObject* values) {
+  return apply_reduction(values, max_array, 1);
+}
+
+PyObject* py_mean_array(PyObject* self, PyObject* values) {
+  return apply_reduction(values, mean_array, 1);
+}
+
+PyObject* py_dot_array(PyObject* self, PyObject* args, PyObject* kwargs) {
+  static char* kwlist[] = {"a", "b", NULL};
+  PyObject *a_obj, *b_obj;
+  PyObject *a_holder, *b_holder;
+  Py_buffer a_view, b_view;
+  PyObject* result = NULL;
+  double value;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO", kwlist, &a_obj,
+                                   &b_obj)) {
+    return NULL;
+  }
+  if (get_double_buffer(a_obj, &a_view, 0, &a_holder) != 0) {
+    return NULL;
+  }
+  if (get_double_buffer(b_obj, &b_view, 0, &b_holder) != 0) {
+    goto release_a;
+  }
+  if (a_view.len != b_view.len) {
+    PyErr_SetString(PyExc_ValueError, "operands must have the same length");
+  } else {
+    size_t n = (size_t)a_view.len / sizeof(double);
+    PyThreadState* state = release_gil(n);
+    value = dot_array(a_view.buf, b_view.buf, n);
+    restore_gil(state);
+    result = PyFloat_FromDouble(value);
+  }
+  PyBuffer_Release(&b_view);
+  Py_XDECREF(b_holder);
+release_a:
+  PyBuffer_Release(&a_view);
+  Py_XDECREF(a_holder);
+  return result;
+}
+
+PyObject* py_set_reduction_threads(PyObject* self, PyObject* threads) {
+  size_t n = PyLong_AsSize_t(threads);
+  if (n == (size_t)-1 && PyErr_Occurred()) {
+    return NULL;
+  }
+  return PyLong_FromSize_t(set_reduction_threads(n));
+}
+
+/* SIMD path selection, by name. */
+
+PyObject* py_simd_path(PyObject* self, PyObject* unused) {
+  return PyUnicode_FromString(simd_path_name(get_simd_path()));
+}
+
+PyObject* py_set_simd_path(PyObject* self, PyObject* name) {
+  int path = CALC_SIMD_AUTO;
+  if (name != Py_None) {
+    const char* text = PyUnicode_AsUTF8(name);
+    if (text == NULL) {
+      return NULL;
+    }
+    for (path = CALC_SIMD_AVX512; path >= CALC_SIMD_SCALAR; path--) {
+      if (strcmp(text, simd_path_name(path)) == 0) {
+        break;
+      }
+    }
+    if (path < CALC_SIMD_SCALAR) {
+      return PyErr_Format(PyExc_ValueError, "Unknown SIMD path %R", name);
+    }
+  }
+  if (set_simd_path(path) != 0) {
+    return PyErr_Format(PyExc_ValueError, "SIMD path %R is not supported",
+                        name);
+  }
+  return py_simd_path(self, NULL);
+}
+
+/* Bytecode wrappers. A compiled program is a bytes object holding packed
+ * calc_instruction structs. Instructions are (name, argument) pairs where
+ * name is "push", "var", "+", "-", "*", "/", "neg", "store" or "recall". */
+
+static int opcode_from_name(const char* name) {
+  static const char* names[] = {"push", "var", "+",     "-",     "*",
+                                "/",    "neg", "store", "recall"};
+  for (int i = 0; i < (int)(sizeof(names) / sizeof(names[0])); i++) {
+    if (strcmp(name, names[i]) == 0) {
+      return i;
+    }
+  }
+  return -1;
+}
+
+PyObject* py_compile(PyObject* self, PyObject* instructions) {
+  PyObject* seq = PySequence_Fast(instructions, "program must be a sequence");
+  if (seq == NULL) {
+    return NULL;
+  }
+  Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+  PyObject* program =
+      PyBytes_FromStringAndSize(NULL, n * sizeof(calc_instruction));
+  if (program == NULL) {
+    Py_DECREF(seq);
+    return NULL;
+  }
+  calc_instruction* code = (calc_instruction*)PyBytes_AS_STRING(program);
+  memset(code, 0, n * sizeof(calc_instruction));
+  for (Py_ssize_t i = 0; i < n; i++) {
+    const char* name;
+    PyObject* argument;
+    if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(seq, i), "sO", &name,
+                          &argument)) {
+      goto error;
+    }
+    code[i].opcode = opcode_from_name(name);
+    if (code[i].opcode == CALC_OP_PUSH) {
+      code[i].value = PyFloat_AsDouble(argument);
+    } else if (code[i].opcode == CALC_OP_LOAD ||
+               code[i].opcode == CALC_OP_STORE ||
+               code[i].opcode == CALC_OP_RECALL) {
+      code[i].index = (int)PyLong_AsLong(argument);
+    }
+    if (PyErr_Occurred()) {
+      goto error;
+    }
+  }
+  if (check_program(code, (size_t)n) < 0) {
+    PyErr_SetString(PyExc_ValueError, "Invalid program");
+    goto error;
+  }
+  Py_DECREF(seq);
+  return program;
+
+error:
+  Py_DECREF(seq);
+  Py_DECREF(program);
+  return NULL;
+}
+
+static PyObject* raise_for_status(int status) {
+  switch (status) {
+    case CALC_ERR_DIVISION_BY_ZERO:
+      PyErr_SetString(PyExc_ZeroDivisionError, "Division by zero");
+      break;
+    case CALC_ERR_BAD_VARIABLE:
+      PyErr_SetString(PyExc_IndexError, "Variable index out of range");
+      break;
+    case CALC_ERR_NO_MEMORY:
+      PyErr_NoMemory();
+      break;
+    default:
+      PyErr_SetString(PyExc_ValueError, "Invalid program");
+  }
+  return NULL;
+}
+
+typedef int (*program_runner)(const calc_instruction*, size_t, const double*,
+                              size_t, double*);
+
+static PyObject* run_with(const char* name, program_runner runner,
+                          PyObject* const* args, Py_ssize_t nargs) {
+  Py_buffer program, variables;
+  PyObject* holder = NULL;
+  double result = 0.0;
+  int status;
+
+  if (nargs < 1 || nargs > 2) {
+    PyErr_Format(PyExc_TypeError, "%s() takes 1 or 2 arguments (%zd given)",
+                 name, nargs);
+    return NULL;
+  }
+  if (PyObject_GetBuffer(args[0], &program, PyBUF_SIMPLE) != 0) {
+    return NULL;
+  }
+  if (program.len % sizeof(calc_instruction) != 0) {
+    PyBuffer_Release(&program);
+    return raise_for_status(CALC_ERR_BAD_PROGRAM);
+  }
+  if (nargs == 1 || args[1] == Py_None) {
+    status = runner(program.buf, program.len / sizeof(calc_instruction), NULL,
+                    0, &result);
+  } else {
+    if (get_double_buffer(args[1], &variables, 0, &holder) != 0) {
+      PyBuffer_Release(&program);
+      return NULL;
+    }
+    status = runner(program.buf, program.len / sizeof(calc_instruction),
+                    variables.buf, variables.len / sizeof(double), &result);
+    PyBuffer_Release(&variables);
+    Py_XDECREF(holder);
+  }
+  PyBuffer_Release(&program);
+  if (status != CALC_OK) {
+    return raise_for_status(status);
+  }
+  return PyFloat_FromDouble(result);
+}
+
+PyObject* py_run(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
+  return run_with("run", run_program, args, nargs);
+}
+
+PyObject* py_run_double(PyObject* self, PyObject* const* args,
+                        Py_ssize_t nargs) {
+  return run_with("run_double", run_program_double, args, nargs);
+}
+
+/* Replace a column by a copy if it overlaps out other than exactly: out is
+ * written block by block, which would clobber rows not read yet. */
+static int separate_column(Py_buffer* column, PyObject** holder,
+                           const Py_buffer* out, char code) {
+  const char* start = column->buf;
+  const char* out_start = out->buf;
+  Py_ssize_t itemsize = code == 'f' ? sizeof(float) : sizeof(double);
+  PyObject* copy;
+  Py_buffer view;
+  if (start == out_start || start >= out_start + out->len ||
+      out_start >= start + column->len) {
+    return 0;
+  }
+  copy = new_typed_array(code, column->len / itemsize);
+  if (copy == NULL) {
+    return -1;
+  }
+  if (PyObject_GetBuffer(copy, &view, PyBUF_C_CONTIGUOUS) != 0) {
+    Py_DECREF(copy);
+    return -1;
+  }
+  memcpy(view.buf, column->buf, column->len);
+  PyBuffer_Release(column);
+  Py_XDECREF(*holder);
+  *column = view;
+  *holder = copy;
+  return 0;
+}
+
+/* run_columns(program, columns, out=None): columns is a sequence of float64
+ * buffers of equal length, one per variable index. run_columns_float takes
+ * float32 buffers ('f' code) instead. */
+static PyObject* run_columns_with(PyObject* args, PyObject* kwargs, char code) {
+  static char* kwlist[] = {"program", "columns", "out", NULL};
+  PyObject *columns_obj, *out_obj = Py_None;
+  PyObject *seq = NULL, *out_holder = NULL, *unused_holder;
+  PyObject** holders = NULL;
+  Py_buffer program, out_view;
+  Py_buffer* views = NULL;
+  const double** pointers = NULL;
+  const float** pointers32 = NULL;
+  Py_ssize_t itemsize = code == 'f' ? sizeof(float) : sizeof(double);
+  Py_ssize_t n_columns, acquired = 0, length = -1;
+  PyObject* result = NULL;
+  PyThreadState* state;
+  int status;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "y*O|O", kwlist, &program,
+                                   &columns_obj, &out_obj)) {
+    return NULL;
+  }
+  if (program.len % sizeof(calc_instruction) != 0) {
+    raise_for_status(CALC_ERR_BAD_PROGRAM);
+    goto done;
+  }
+  seq = PySequence_Fast(columns_obj, "columns must be a sequence");
+  if (seq == NULL) {
+    goto done;
+  }
+  n_columns = PySequence_Fast_GET_SIZE(seq);
+  views = PyMem_Calloc(n_columns + 1, sizeof(Py_buffer));
+  holders = PyMem_Calloc(n_columns + 1, sizeof(PyObject*));
+  if (code == 'f') {
+    pointers32 = PyMem_Calloc(n_columns + 1, sizeof(float*));
+  } else {
+    pointers = PyMem_Calloc(n_columns + 1, sizeof(double*));
+  }
+  if (views == NULL || holders == NULL ||
+      (pointers == NULL && pointers32 == NULL)) {
+    PyErr_NoMemory();
+    goto done;
+  }
+  for (; acquired < n_columns; acquired++) {
+    if (get_typed_buffer(PySequence_Fast_GET_ITEM(seq, acquired),
+                         &views[acquired], 0, &holders[acquired], code) != 0) {
+      goto done;
+    }
+    if (length >= 0 && views[acquired].len != length) {
+      PyErr_SetString(PyExc_ValueError, "columns must have the same length");
+      acquired++;
+      goto done;
+    }
+    length = views[acquired].len;
+    if (code == 'f') {
+      pointers32[acquired] = views[acquired].buf;
+    } else {
+      pointers[acquired] = views[acquired].buf;
+    }
+  }
+  if (length < 0) {
+    PyErr_SetString(PyExc_ValueError, "at least one column is required");
+    goto done;
+  }
+  if (out_obj == Py_None) {
+    out_holder = new_typed_array(code, length / itemsize);
+    if (out_holder == NULL) {
+      goto done;
+    }
+    out_obj = out_holder;
+  }
+  if (get_typed_buffer(out_obj, &out_view, 1, &unused_holder, code) != 0) {
+    goto done;
+  }
+  if (out_view.len != length) {
+    PyErr_SetString(PyExc_ValueError, "out must match the column length");
+    PyBuffer_Release(&out_view);
+    goto done;
+  }
+  for (Py_ssize_t i = 0; i < n_columns; i++) {
+    if (separate_column(&views[i], &holders[i], &out_view, code) != 0) {
+      PyBuffer_Release(&out_view);
+      goto done;
+    }
+    if (code == 'f') {
+      pointers32[i] = views[i].buf;
+    } else {
+      pointers[i] = views[i].buf;
+    }
+  }
+  state = release_gil((size_t)(length / itemsize));
+  if (code == 'f') {
+    status = run_program_columns_float(
+        program.buf, program.len / sizeof(calc_instruction), pointers32,
+        (size_t)n_columns, (size_t)(length / itemsize), out_view.buf);
+  } else {
+    status = run_program_columns(
+        program.buf, program.len / sizeof(calc_instruction), pointers,
+        (size_t)n_columns, (size_t)(length / itemsize), out_view.buf);
+  }
+  restore_gil(state);
+  PyBuffer_Release(&out_view);
+  if (status != CALC_OK) {
+    raise_for_status(status);
+    goto done;
+  }
+  Py_INCREF(out_obj);
+  result = out_obj;
+
+done:
+  while (acquired > 0) {
+    acquired--;
+    PyBuffer_Release(&views[acquired]);
+    Py_XDECREF(holders[acquired]);
+  }
+  PyMem_Free(views);
+  PyMem_Free(holders);
+  PyMem_Free((void*)pointers);
+  PyMem_Free((void*)pointers32);
+  Py_XDECREF(out_holder);
+  Py_XDECREF(seq);
+  PyBuffer_Release(&program);
+  return result;
+}
+
+PyObject* py_run_columns(PyObject* self, PyObject* args, PyObject* kwargs) {
+  return run_columns_with(args, kwargs, 'd');
+}
+
+PyObject* py_run_columns_float(PyObject* self, PyObject* args,
+                               PyObject* kwargs) {
+  return run_columns_with(args, kwargs, 'f');
+}
+
 // Method definitions
 static PyMethodDef calculator_methods[] = {
-    {"add", py_add, METH_VARARGS, "Add two numbers"},
-    {"subtract", py_subtract, METH_VARARGS, "Subtract two numbers"},
-    {"multiply", py_multiply, METH_VARARGS, "Multiply two numbers"},
-    {"divide", py_divide, METH_VARARGS, "Divide two numbers"},
+    {"add", (PyCFunction)(void (*)(void))py_add, METH_FASTCALL,
+     "Add two numbers"},
+    {"subtract", (PyCFunction)(void (*)(void))py_subtract, METH_FASTCALL,
+     "Subtract two numbers"},
+    {"multiply", (PyCFunction)(void (*)(void))py_multiply, METH_FASTCALL,
+     "Multiply two numbers"},
+    {"divide", (PyCFunction)(void (*)(void))py_divide, METH_FASTCALL,
+     "Divide two numbers"},
+    {"add_double", (PyCFunction)(void (*)(void))py_add_double, METH_FASTCALL,
+     "Add two numbers in double precision"},
+    {"subtract_double", (PyCFunction)(void (*)(void))py_subtract_double,
+     METH_FASTCALL, "Subtract two numbers in double precision"},
+    {"multiply_double", (PyCFunction)(void (*)(void))py_multiply_double,
+     METH_FASTCALL, "Multiply two numbers in double precision"},
+    {"divide_double", (PyCFunction)(void (*)(void))py_divide_double,
+     METH_FASTCALL, "Divide two numbers in double precision"},
+    {"add_array", (PyCFunction)(void (*)(void))py_add_array,
+     METH_VARARGS | METH_KEYWORDS, "Add two float64 arrays element-wise"},
+    {"subtract_array", (PyCFunction)(void (*)(void))py_subtract_array,
+     METH_VARARGS | METH_KEYWORDS, "Subtract two float64 arrays element-wise"},
+    {"multiply_array", (PyCFunction)(void (*)(void))py_multiply_array,
+     METH_VARARGS | METH_KEYWORDS, "Multiply two float64 arrays element-wise"},
+    {"divide_array", (PyCFunction)(void (*)(void))py_divide_array,
+     METH_VARARGS | METH_KEYWORDS, "Divide two float64 arrays element-wise"},
+    {"add_array_float", (PyCFunction)(void (*)(void))py_add_array_float,
+     METH_VARARGS | METH_KEYWORDS, "Add two float32 arrays element-wise"},
+    {"subtract_array_float",
+     (PyCFunction)(void (*)(void))py_subtract_array_float,
+     METH_VARARGS | METH_KEYWORDS, "Subtract two float32 arrays element-wise"},
+    {"multiply_array_float",
+     (PyCFunction)(void (*)(void))py_multiply_array_float,
+     METH_VARARGS | METH_KEYWORDS, "Multiply two float32 arrays element-wise"},
+    {"divide_array_float", (PyCFunction)(void (*)(void))py_divide_array_float,
+     METH_VARARGS | METH_KEYWORDS, "Divide two float32 arrays element-wise"},
+    {"sum_array", py_sum_array, METH_O, "Sum a float64 array (pairwise)"},
+    {"product_array", py_product_array, METH_O,
+     "Multiply the elements of a float64 array"},
+    {"min_array", py_min_array, METH_O, "Smallest element of a float64 array"},
+    {"max_array", py_max_array, METH_O, "Largest element of a float64 array"},
+    {"mean_array", py_mean_array, METH_O, "Mean of a float64 array"},
+    {"dot_array", (PyCFunction)(void (*)(void))py_dot_array,
+     METH_VARARGS | METH_KEYWORDS, "Dot product of two float64 arrays"},
+    {"set_reduction_threads", py_set_reduction_threads, METH_O,
+     "Set the maximum threads per reduction (0 = one per CPU)"},
+    {"simd_path", py_simd_path, METH_NOARGS,
+     "Name of the instruction set used by the array kernels"},
+    {"set_simd_path", py_set_simd_path, METH_O,
+     "Force an instruction set by name, or None to select the best"},
+    {"compile", py_compile, METH_O, "Compile instructions to a program"},
+    {"run", (PyCFunction)(void (*)(void))py_run, METH_FASTCALL,
+     "Evaluate a compiled program"},
+    {"run_double", (PyCFunction)(void (*)(void))py_run_double, METH_FASTCALL,
+     "Evaluate a compiled program in double precision"},
+    {"run_columns", (PyCFunction)(void (*)(void))py_run_columns,
+     METH_VARARGS | METH_KEYWORDS,
+     "Evaluate a compiled program over columns of variable values"},
+    {"run_columns_float", (PyCFunction)(void (*)(void))py_run_columns_float,
+     METH_VARARGS | METH_KEYWORDS,
+     "Evaluate a compiled program over float32 columns"},
     {NULL, NULL, 0, NULL}};
 
-// Module definition
+// Module definition; installed as calculator_c._native
 static struct PyModuleDef calculator_module = {
-    PyModuleDef_HEAD_INIT, "calculator_c",
+    PyModuleDef_HEAD_INIT, "calculator_c._native",
     "A simple calculator implemented in C", -1, calculator_methods};
 
 // Module initialization
-PyMODINIT_FUNC PyInit_calculator_c(void) {
+PyMODINIT_FUNC PyInit__native(void) {
+  PyObject* array_module = PyImport_ImportModule("array");
+  if (array_module == NULL) {
+    return NULL;
+  }
+  array_type = PyObject_GetAttrString(array_module, "array");
+  Py_DECREF(array_module);
+  if (array_type == NULL) {
+    return NULL;
+  }
   return PyModule_Create(&calculator_module);
 }
 
@@ -7,9 +7,48 @@ float subtract(float num1, float num2);
 float multiply(float num1, float num2);
 float divide(float num1, float num2);
 
-PyObject* py_add(PyObject* self, PyObject* args);
-PyObject* py_subtract(PyObject* self, PyObject* args);
-PyObject* py_multiply(PyObject* self, PyObject* args);
-PyObject* py_divide(PyObject* self, PyObject* args);
+PyObject* py_add(PyObject* self, PyObject* const* args, Py_ssize_t nargs);
+PyObject* py_subtract(PyObject* self, PyObject* const* args, Py_ssize_t nargs);
+PyObject* py_multiply(PyObject* self, PyObject* const* args, Py_ssize_t nargs);
+PyObject* py_divide(PyObject* self, PyObject* const* args, Py_ssize_t nargs);
+PyObject* py_add_double(PyObject* self, PyObject* const* args,
+                        Py_ssize_t nargs);
+PyObject* py_subtract_double(PyObject* self, PyObject* const* args,
+                             Py_ssize_t nargs);
+PyObject* py_multiply_double(PyObject* self, PyObject* const* args,
+                             Py_ssize_t nargs);
+PyObject* py_divide_double(PyObject* self, PyObject* const* args,
+                           Py_ssize_t nargs);
 
-PyMODINIT_FUNC PyInit_calculator_c(void);
+PyObject* py_add_array(PyObject* self, PyObject* args, PyObject* kwargs);
+PyObject* py_subtract_array(PyObject* self, PyObject* args, PyObject* kwargs);
+PyObject* py_multiply_array(PyObject* self, PyObject* args, PyObject* kwargs);
+PyObject* py_divide_array(PyObject* self, PyObject* args, PyObject* kwargs);
+PyObject* py_add_array_float(PyObject* self, PyObject* args, PyObject* kwargs);
+PyObject* py_subtract_array_float(PyObject* self, PyObject* args,
+                                  PyObject* kwargs);
+PyObject* py_multiply_array_float(PyObject* self, PyObject* args,
+                                  PyObject* kwargs);
+PyObject* py_divide_array_float(PyObject* self, PyObject* args,
+                                PyObject* kwargs);
+
+PyObject* py_sum_array(PyObject* self, PyObject* values);
+PyObject* py_product_array(PyObject* self, PyObject* values);
+PyObject* py_min_array(PyObject* self, PyObject* values);
+PyObject* py_max_array(PyObject* self, PyObject* values);
+PyObject* py_mean_array(PyObject* self, PyObject* values);
+PyObject* py_dot_array(PyObject* self, PyObject* args, PyObject* kwargs);
+PyObject* py_set_reduction_threads(PyObject* self, PyObject* threads);
+
+PyObject* py_simd_path(PyObject* self, PyObject* unused);
+PyObject* py_set_simd_path(PyObject* self, PyObject* name);
+
+PyObject* py_compile(PyObject* self, PyObject* instructions);
+PyObject* py_run(PyObject* self, PyObject* const* args, Py_ssize_t nargs);
+PyObject* py_run_double(PyObject* self, PyObject* const* args,
+                        Py_ssize_t nargs);
+PyObject* py_run_columns(PyObject* self, PyObject* args, PyObject* kwargs);
+PyObject* py_run_columns_float(PyObject* self, PyObject* args,
+                               PyObject* kwargs);
+
+PyMODINIT_FUNC PyInit__native(void);
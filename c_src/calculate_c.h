@@ -6,6 +6,8 @@
 #define DLL_EXPORT
 #endif
 
+#include <stddef.h>
+
 #ifdef __cplusplus
 extern "C" {
 #endif
@@ -15,6 +17,149 @@ DLL_EXPORT float subtract(float num1, float num2);
 DLL_EXPORT float multiply(float num1, float num2);
 DLL_EXPORT float divide(float num1, float num2);
 
+/* The same operations in double precision; divide_double returns NAN for
+ * a zero divisor. */
+DLL_EXPORT double add_double(double num1, double num2);
+DLL_EXPORT double subtract_double(double num1, double num2);
+DLL_EXPORT double multiply_double(double num1, double num2);
+DLL_EXPORT double divide_double(double num1, double num2);
+
+/* Element-wise kernels over contiguous float64 arrays of length n.
+ * divide_array writes NAN where the divisor is zero and returns the
+ * number of such elements. */
+DLL_EXPORT void add_array(const double* a, const double* b, double* out,
+                          size_t n);
+DLL_EXPORT void subtract_array(const double* a, const double* b, double* out,
+                               size_t n);
+DLL_EXPORT void multiply_array(const double* a, const double* b, double* out,
+                               size_t n);
+DLL_EXPORT size_t divide_array(const double* a, const double* b, double* out,
+                               size_t n);
+/* The same kernels over float32 arrays, for half the memory traffic. */
+DLL_EXPORT void add_array_float(const float* a, const float* b, float* out,
+                                size_t n);
+DLL_EXPORT void subtract_array_float(const float* a, const float* b, float* out,
+                                     size_t n);
+DLL_EXPORT void multiply_array_float(const float* a, const float* b, float* out,
+                                     size_t n);
+DLL_EXPORT size_t divide_array_float(const float* a, const float* b, float* out,
+                                     size_t n);
+/* The kernels may be called with out equal to a or b, for in-place
+ * operation; other overlaps are undefined. */
+
+/* Element-wise CALC_OP_ADD, CALC_OP_SUBTRACT, CALC_OP_MULTIPLY or
+ * CALC_OP_DIVIDE (see calc_opcode) over strided arrays: element i of a is
+ * at byte offset i * a_stride from a, and likewise for b and out. Strides
+ * may be negative and need not be multiples of the element size. Blocks
+ * are gathered into local buffers and run through the kernels above, so
+ * nothing is allocated; contiguous operands skip the copies. out may equal
+ * a or b with the same stride. Returns the number of zero divisors, or
+ * SIZE_MAX for any other opcode. */
+DLL_EXPORT size_t strided_array_op(int opcode, const double* a,
+                                   ptrdiff_t a_stride, const double* b,
+                                   ptrdiff_t b_stride, double* out,
+                                   ptrdiff_t out_stride, size_t n);
+DLL_EXPORT size_t strided_array_op_float(int opcode, const float* a,
+                                         ptrdiff_t a_stride, const float* b,
+                                         ptrdiff_t b_stride, float* out,
+                                         ptrdiff_t out_stride, size_t n);
+
+/* Instruction sets the array kernels can use. All give bit-identical
+ * results. The best one the CPU supports is used unless the
+ * CALCULATOR_SIMD environment variable names another ("scalar", "sse2",
+ * "avx2" or "avx512"). */
+enum calc_simd_path {
+  CALC_SIMD_AUTO = -1,
+  CALC_SIMD_SCALAR = 0,
+  CALC_SIMD_SSE2 = 1,
+  CALC_SIMD_AVX2 = 2,
+  CALC_SIMD_AVX512 = 3
+};
+
+/* Return the calc_simd_path in use. */
+DLL_EXPORT int get_simd_path(void);
+/* Force a path, or CALC_SIMD_AUTO to select one again. Returns 0, or -1
+ * if this CPU or build does not support the path. May be called while
+ * kernels run on other threads; it applies to later calls only. */
+DLL_EXPORT int set_simd_path(int path);
+/* Lower-case name of a path ("avx2"), or NULL if there is none. */
+DLL_EXPORT const char* simd_path_name(int path);
+
+/* Reductions over contiguous float64 arrays of length n. Sums, products
+ * and dot products use pairwise (tree) evaluation, so the rounding error of
+ * a sum grows with log(n) rather than n. Large inputs are split across
+ * threads without changing the result. The sum of an empty array is 0 and
+ * its product 1; its min, max and mean are NAN. min and max return NAN if
+ * any element is NAN. */
+DLL_EXPORT double sum_array(const double* a, size_t n);
+DLL_EXPORT double product_array(const double* a, size_t n);
+DLL_EXPORT double min_array(const double* a, size_t n);
+DLL_EXPORT double max_array(const double* a, size_t n);
+DLL_EXPORT double mean_array(const double* a, size_t n);
+DLL_EXPORT double dot_array(const double* a, const double* b, size_t n);
+/* Set the maximum number of threads a reduction may use, 0 for one per
+ * CPU (the default). Returns the previous setting. Threads are only used
+ * where pthreads are available. Like set_simd_path, it applies to calls
+ * made after it returns, even while reductions run on other threads. */
+DLL_EXPORT size_t set_reduction_threads(size_t threads);
+
+/* Stack-based bytecode for whole expressions, evaluated in one call.
+ * Registers hold values reused by several parts of an expression; they are
+ * numbered in order of their first CALC_OP_STORE, starting at 0. */
+enum calc_opcode {
+  CALC_OP_PUSH = 0, /* push value */
+  CALC_OP_LOAD = 1, /* push variables[index] */
+  CALC_OP_ADD = 2,
+  CALC_OP_SUBTRACT = 3,
+  CALC_OP_MULTIPLY = 4,
+  CALC_OP_DIVIDE = 5,
+  CALC_OP_NEGATE = 6,
+  CALC_OP_STORE = 7, /* registers[index] = top of stack, which stays */
+  CALC_OP_RECALL = 8 /* push registers[index] */
+};
+
+typedef struct {
+  int opcode;
+  int index;
+  double value;
+} calc_instruction;
+
+enum calc_status {
+  CALC_OK = 0,
+  CALC_ERR_DIVISION_BY_ZERO = 1,
+  CALC_ERR_BAD_PROGRAM = 2,
+  CALC_ERR_BAD_VARIABLE = 3,
+  CALC_ERR_NO_MEMORY = 4
+};
+
+/* Return the maximum stack depth of a well-formed program, or -1 if it
+ * underflows, has an unknown opcode, recalls a register before storing it
+ * or does not leave exactly one value. */
+DLL_EXPORT int check_program(const calc_instruction* code, size_t n);
+/* Evaluate a program with add/subtract/multiply/divide, storing the value
+ * in *result. Returns a calc_status code. */
+DLL_EXPORT int run_program(const calc_instruction* code, size_t n,
+                           const double* variables, size_t n_variables,
+                           double* result);
+/* The same in double precision throughout. */
+DLL_EXPORT int run_program_double(const calc_instruction* code, size_t n,
+                                  const double* variables, size_t n_variables,
+                                  double* result);
+/* Evaluate a program once per row of `length` rows, where variable k of
+ * row i is columns[k][i], writing row i's value to out[i]. Rows are
+ * processed in blocks and each instruction runs as one float64 array
+ * kernel over the block. Returns a calc_status code. */
+DLL_EXPORT int run_program_columns(const calc_instruction* code, size_t n,
+                                   const double* const* columns,
+                                   size_t n_columns, size_t length,
+                                   double* out);
+/* The same over float32 columns and output, with float32 arithmetic as in
+ * run_program. */
+DLL_EXPORT int run_program_columns_float(const calc_instruction* code, size_t n,
+                                         const float* const* columns,
+                                         size_t n_columns, size_t length,
+                                         float* out);
+
 #ifdef __cplusplus
 }
 #endif
@@ -0,0 +1,22 @@
+"""Python bindings for the calculate C library.
+
+The ``_native`` CPython extension is used when it is available; otherwise
+the library is called through ctypes. Set ``CALCULATOR_BACKEND=ctypes`` to
+force the fallback. ``BACKEND`` names the bindings in use.
+"""
+
+import os
+
+if os.environ.get("CALCULATOR_BACKEND") == "ctypes":
+    from ._ctypes import *  # noqa: F401,F403
+
+    BACKEND = "ctypes"
+else:
+    try:
+        from ._native import *  # noqa: F401,F403
+
+        BACKEND = "native"
+    except ImportError:
+        from ._ctypes import *  # noqa: F401,F403
+
+        BACKEND = "ctypes"
@@ -0,0 +1,481 @@
+"""ctypes bindings for the calculate shared library.
+
+Fallback used by ``calculator_c`` when the ``_native`` extension module
+cannot be imported. The shared library is looked up next to this file.
+"""
+
+import os
+from array import array
+from ctypes import (
+    CDLL,
+    POINTER,
+    Structure,
+    addressof,
+    byref,
+    c_double,
+    c_float,
+    c_int,
+    c_char_p,
+    c_size_t,
+    cast,
+    sizeof,
+)
+
+__all__ = [
+    "add",
+    "subtract",
+    "multiply",
+    "divide",
+    "add_double",
+    "subtract_double",
+    "multiply_double",
+    "divide_double",
+    "add_array",
+    "subtract_array",
+    "multiply_array",
+    "divide_array",
+    "add_array_float",
+    "subtract_array_float",
+    "multiply_array_float",
+    "divide_array_float",
+    "sum_array",
+    "product_array",
+    "min_array",
+    "max_array",
+    "mean_array",
+    "dot_array",
+    "set_reduction_threads",
+    "simd_path",
+    "set_simd_path",
+    "compile",
+    "run",
+    "run_double",
+    "run_columns",
+    "run_columns_float",
+]
+
+_LIBRARY_NAMES = (
+    "libcalculate.so",
+    "libcalculate.dylib",
+    "libcalculate.dll",
+    "calculate.dll",
+)
+
+
+def _load_library():
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in _LIBRARY_NAMES:
+        path = os.path.join(here, name)
+        if os.path.exists(path):
+            return CDLL(path)
+    raise ImportError(f"calculate shared library not found in {here}")
+
+
+_dll = _load_library()
+
+for _name in ("add", "subtract", "multiply", "divide"):
+    getattr(_dll, _name).argtypes = [c_float, c_float]
+    getattr(_dll, _name).restype = c_float
+
+for _name in ("add", "subtract", "multiply", "divide"):
+    getattr(_dll, _name + "_double").argtypes = [c_double, c_double]
+    getattr(_dll, _name + "_double").restype = c_double
+
+_DOUBLE_P = POINTER(c_double)
+_FLOAT_P = POINTER(c_float)
+for _name in ("add_array", "subtract_array", "multiply_array", "divide_array"):
+    getattr(_dll, _name).argtypes = [_DOUBLE_P, _DOUBLE_P, _DOUBLE_P, c_size_t]
+    getattr(_dll, _name).restype = None
+    getattr(_dll, _name + "_float").argtypes = [_FLOAT_P, _FLOAT_P, _FLOAT_P, c_size_t]
+    getattr(_dll, _name + "_float").restype = None
+_dll.divide_array.restype = c_size_t
+_dll.divide_array_float.restype = c_size_t
+
+for _name in ("sum_array", "product_array", "min_array", "max_array", "mean_array"):
+    getattr(_dll, _name).argtypes = [_DOUBLE_P, c_size_t]
+    getattr(_dll, _name).restype = c_double
+_dll.dot_array.argtypes = [_DOUBLE_P, _DOUBLE_P, c_size_t]
+_dll.dot_array.restype = c_double
+_dll.set_reduction_threads.argtypes = [c_size_t]
+_dll.set_reduction_threads.restype = c_size_t
+_dll.get_simd_path.argtypes = []
+_dll.get_simd_path.restype = c_int
+_dll.set_simd_path.argtypes = [c_int]
+_dll.set_simd_path.restype = c_int
+_dll.simd_path_name.argtypes = [c_int]
+_dll.simd_path_name.restype = c_char_p
+
+
+class _Instruction(Structure):
+    _fields_ = [("opcode", c_int), ("index", c_int), ("value", c_double)]
+
+
+_INSTRUCTION_P = POINTER(_Instruction)
+_dll.check_program.argtypes = [_INSTRUCTION_P, c_size_t]
+_dll.check_program.restype = c_int
+_dll.run_program.argtypes = [
+    _INSTRUCTION_P,
+    c_size_t,
+    _DOUBLE_P,
+    c_size_t,
+    POINTER(c_double),
+]
+_dll.run_program.restype = c_int
+_dll.run_program_double.argtypes = _dll.run_program.argtypes
+_dll.run_program_double.restype = c_int
+_dll.run_program_columns.argtypes = [
+    _INSTRUCTION_P,
+    c_size_t,
+    POINTER(_DOUBLE_P),
+    c_size_t,
+    c_size_t,
+    _DOUBLE_P,
+]
+_dll.run_program_columns.restype = c_int
+_dll.run_program_columns_float.argtypes = [
+    _INSTRUCTION_P,
+    c_size_t,
+    POINTER(_FLOAT_P),
+    c_size_t,
+    c_size_t,
+    _FLOAT_P,
+]
+_dll.run_program_columns_float.restype = c_int
+
+# Opcodes of calc_instruction, see c_src/calculate_c.h.
+_OPCODES = {
+    "push": 0,
+    "var": 1,
+    "+": 2,
+    "-": 3,
+    "*": 4,
+    "/": 5,
+    "neg": 6,
+    "store": 7,
+    "recall": 8,
+}
+# calc_simd_path values, see c_src/calculate_c.h.
+_SIMD_PATHS = ("scalar", "sse2", "avx2", "avx512")
+_SIMD_AUTO = -1
+
+_DIVISION_BY_ZERO, _BAD_PROGRAM, _BAD_VARIABLE, _NO_MEMORY = 1, 2, 3, 4
+
+_BYTE_FORMATS = ("B", "b", "c")
+# Element type codes of the array functions and their ctypes types.
+_C_TYPES = {"d": c_double, "f": c_float}
+_TYPE_NAMES = {"d": "float64", "f": "float32"}
+
+
+def add(a, b):
+    return _dll.add(float(a), float(b))
+
+
+def subtract(a, b):
+    return _dll.subtract(float(a), float(b))
+
+
+def multiply(a, b):
+    return _dll.multiply(float(a), float(b))
+
+
+def divide(a, b):
+    # Checked after narrowing: a tiny b is a zero float divisor.
+    if c_float(float(b)).value == 0:
+        raise ZeroDivisionError("Division by zero")
+    return _dll.divide(float(a), float(b))
+
+
+def add_double(a, b):
+    return _dll.add_double(a, b)
+
+
+def subtract_double(a, b):
+    return _dll.subtract_double(a, b)
+
+
+def multiply_double(a, b):
+    return _dll.multiply_double(a, b)
+
+
+def divide_double(a, b):
+    if b == 0:
+        raise ZeroDivisionError("Division by zero")
+    return _dll.divide_double(a, b)
+
+
+def _formats(code):
+    return (code, "<" + code, "=" + code)
+
+
+def _as_view(obj, code="d"):
+    """Return a contiguous memoryview of ``code`` elements over obj.
+
+    ``code`` is "d" (float64) or "f" (float32); obj is converted if needed.
+    """
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return memoryview(array(code, obj))
+    itemsize = array(code).itemsize
+    if (
+        view.c_contiguous
+        and view.format in _BYTE_FORMATS
+        and view.nbytes % itemsize == 0
+    ):
+        view = view.cast("B").cast(code)
+    if view.format not in _formats(code) or not view.c_contiguous:
+        return memoryview(array(code, view.tolist()))
+    return view
+
+
+def _as_out_view(out, code="d", strided=False):
+    """Return a writable memoryview of ``code`` elements over out, no copy.
+
+    With ``strided``, non-contiguous 1-D views are accepted too.
+    """
+    try:
+        view = memoryview(out)
+    except TypeError:
+        view = None
+    if view is not None and not view.readonly:
+        if view.c_contiguous:
+            if view.format in _BYTE_FORMATS and view.nbytes % array(code).itemsize == 0:
+                view = view.cast("B").cast(code)
+            if view.format in _formats(code):
+                return view
+        elif strided and view.ndim == 1 and view.format in _formats(code):
+            return view
+    layout = "1-D" if strided else "contiguous"
+    raise TypeError(f"out must be a writable {layout} {_TYPE_NAMES[code]} buffer")
+
+
+def _pointer(view):
+    """Return a c_double (or c_float) pointer into view.
+
+    Read-only buffers are copied.
+    """
+    ctype = _C_TYPES[view.format[-1]]
+    n = view.nbytes // view.itemsize
+    if n == 0:
+        return (ctype * 1)()
+    if view.readonly:
+        return (ctype * n).from_buffer_copy(view)
+    return (ctype * n).from_buffer(view)
+
+
+def _separate(pointer, out_pointer):
+    """Return pointer, or a copy of it if out overlaps it other than exactly."""
+    start, out_start = addressof(pointer), addressof(out_pointer)
+    size = sizeof(pointer)
+    if start != out_start and start < out_start + size and out_start < start + size:
+        return type(pointer).from_buffer_copy(pointer)
+    return pointer
+
+
+def _apply(kernel, a, b, out, code="d"):
+    # Strided inputs are copied by _as_view and a strided out is written
+    # through a contiguous temporary: ctypes cannot address them in place.
+    a_view, b_view = _as_view(a, code), _as_view(b, code)
+    if a_view.nbytes != b_view.nbytes:
+        raise ValueError("operands must have the same length")
+    if out is None:
+        out = array(code, bytes(a_view.nbytes))
+    out_view = _as_out_view(out, code, strided=True)
+    if out_view.nbytes != a_view.nbytes:
+        raise ValueError("out must match the operand length")
+    target = out_view
+    if not out_view.c_contiguous:
+        target = memoryview(array(code, bytes(out_view.nbytes)))
+    out_pointer = _pointer(target)
+    zero_divisors = kernel(
+        _separate(_pointer(a_view), out_pointer),
+        _separate(_pointer(b_view), out_pointer),
+        out_pointer,
+        len(a_view),
+    )
+    if zero_divisors:
+        raise ZeroDivisionError("Division by zero")
+    if target is not out_view:
+        out_view[:] = target
+    return out
+
+
+def add_array(a, b, out=None):
+    return _apply(_dll.add_array, a, b, out)
+
+
+def subtract_array(a, b, out=None):
+    return _apply(_dll.subtract_array, a, b, out)
+
+
+def multiply_array(a, b, out=None):
+    return _apply(_dll.multiply_array, a, b, out)
+
+
+def divide_array(a, b, out=None):
+    return _apply(_dll.divide_array, a, b, out)
+
+
+def add_array_float(a, b, out=None):
+    return _apply(_dll.add_array_float, a, b, out, "f")
+
+
+def subtract_array_float(a, b, out=None):
+    return _apply(_dll.subtract_array_float, a, b, out, "f")
+
+
+def multiply_array_float(a, b, out=None):
+    return _apply(_dll.multiply_array_float, a, b, out, "f")
+
+
+def divide_array_float(a, b, out=None):
+    return _apply(_dll.divide_array_float, a, b, out, "f")
+
+
+def _reduce(reduction, values, needs_values=False):
+    view = _as_view(values)
+    n = view.nbytes // 8
+    if needs_values and not n:
+        raise ValueError("array must not be empty")
+    return reduction(_pointer(view), n)
+
+
+def sum_array(values):
+    return _reduce(_dll.sum_array, values)
+
+
+def product_array(values):
+    return _reduce(_dll.product_array, values)
+
+
+def min_array(values):
+    return _reduce(_dll.min_array, values, True)
+
+
+def max_array(values):
+    return _reduce(_dll.max_array, values, True)
+
+
+def mean_array(values):
+    return _reduce(_dll.mean_array, values, True)
+
+
+def dot_array(a, b):
+    a_view, b_view = _as_view(a), _as_view(b)
+    if a_view.nbytes != b_view.nbytes:
+        raise ValueError("operands must have the same length")
+    return _dll.dot_array(_pointer(a_view), _pointer(b_view), a_view.nbytes // 8)
+
+
+def set_reduction_threads(threads):
+    """Set the maximum threads per reduction (0 = one per CPU)."""
+    if threads < 0:
+        raise OverflowError("can't convert negative int to unsigned")
+    return _dll.set_reduction_threads(threads)
+
+
+def simd_path():
+    """Name of the instruction set used by the array kernels."""
+    return _dll.simd_path_name(_dll.get_simd_path()).decode()
+
+
+def set_simd_path(name):
+    """Force an instruction set by name, or None to select the best."""
+    if name is None:
+        path = _SIMD_AUTO
+    elif name in _SIMD_PATHS:
+        path = _SIMD_PATHS.index(name)
+    else:
+        raise ValueError(f"Unknown SIMD path {name!r}")
+    if _dll.set_simd_path(path) != 0:
+        raise ValueError(f"SIMD path {name!r} is not supported")
+    return simd_path()
+
+
+def compile(instructions):
+    """Pack (name, argument) instructions into a program for run()."""
+    instructions = list(instructions)
+    program = (_Instruction * len(instructions))()
+    for slot, (name, argument) in zip(program, instructions):
+        try:
+            slot.opcode = _OPCODES[name]
+        except KeyError:
+            raise ValueError("Invalid program") from None
+        if name == "push":
+            slot.value = float(argument)
+        elif name in ("var", "store", "recall"):
+            slot.index = int(argument)
+    if _dll.check_program(program, len(program)) < 0:
+        raise ValueError("Invalid program")
+    return program
+
+
+def _check_status(status):
+    if status == _DIVISION_BY_ZERO:
+        raise ZeroDivisionError("Division by zero")
+    if status == _BAD_VARIABLE:
+        raise IndexError("Variable index out of range")
+    if status == _NO_MEMORY:
+        raise MemoryError
+    if status:
+        raise ValueError("Invalid program")
+
+
+def _run(runner, program, variables):
+    result = c_double()
+    if variables is None:
+        status = runner(program, len(program), None, 0, byref(result))
+    else:
+        view = _as_view(variables)
+        status = runner(
+            program, len(program), _pointer(view), view.nbytes // 8, byref(result)
+        )
+    _check_status(status)
+    return result.value
+
+
+def run(program, variables=None):
+    """Evaluate a compiled program in a single native call."""
+    return _run(_dll.run_program, program, variables)
+
+
+def run_double(program, variables=None):
+    """Evaluate a compiled program in double precision."""
+    return _run(_dll.run_program_double, program, variables)
+
+
+def _run_columns(runner, program, columns, out, code):
+    views = [_as_view(column, code) for column in columns]
+    if not views:
+        raise ValueError("at least one column is required")
+    nbytes = views[0].nbytes
+    if any(view.nbytes != nbytes for view in views):
+        raise ValueError("columns must have the same length")
+    if out is None:
+        out = array(code, bytes(nbytes))
+    out_view = _as_out_view(out, code)
+    if out_view.nbytes != nbytes:
+        raise ValueError("out must match the column length")
+    pointer_type = POINTER(_C_TYPES[code])
+    out_pointer = _pointer(out_view)
+    # Rows are written block by block, so a column overlapping out at an
+    # offset would be read after being overwritten.
+    pointers = [_separate(_pointer(view), out_pointer) for view in views]
+    table = (pointer_type * len(pointers))(
+        *(cast(pointer, pointer_type) for pointer in pointers)
+    )
+    status = runner(
+        program, len(program), table, len(pointers), len(views[0]), out_pointer
+    )
+    _check_status(status)
+    return out
+
+
+def run_columns(program, columns, out=None):
+    """Evaluate a compiled program once per row of equal-length columns."""
+    return _run_columns(_dll.run_program_columns, program, columns, out, "d")
+
+
+def run_columns_float(program, columns, out=None):
+    """Evaluate a compiled program over float32 columns, in float32."""
+    return _run_columns(_dll.run_program_columns_float, program, columns, out, "f")
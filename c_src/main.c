@@ -1,14 +1,239 @@
 /**
  * @file main.c
  * @brief Command-line calculator demonstrating basic arithmetic operations.
+ *
+ * Without arguments it prompts for one operation. `calculate --batch`
+ * evaluates a stream of records instead, without any prompt:
+ *
+ *   calculate --batch [--binary] [--input FILE] [--output FILE]
+ *
+ * Text records are lines `op a b` (e.g. `* 2.5 4`); blank lines and lines
+ * starting with '#' are skipped. Each record prints its result, or
+ * `Error: <message>`. With --binary, records are calc_record structs and
+ * the output is one native-endian float32 per record, NAN for errors.
+ * Input and output go through large buffers, and the exit status is 1 if
+ * any record failed.
  */
 
+#include <ctype.h>
 #include <math.h>
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#ifdef _WIN32
+#include <fcntl.h>
+#include <io.h>
+#endif
 
 #include "calculate_c.h"
 
-int main(void) {
+/* A binary record: the operator character ('+', '-', '*' or '/'), three
+ * padding bytes, then both operands as native-endian float32. */
+typedef struct {
+  char op;
+  char padding[3];
+  float a;
+  float b;
+} calc_record;
+
+/* Records per read in binary mode, bytes per read in text mode. */
+#define CALC_BATCH_RECORDS 65536
+#define CALC_BATCH_BYTES (1 << 20)
+/* Output is flushed when less than a line's worth of space is left. */
+#define CALC_MAX_LINE_OUTPUT 64
+
+enum calc_record_status {
+  CALC_RECORD_OK = 0,
+  CALC_RECORD_DIVISION_BY_ZERO = 1,
+  CALC_RECORD_INVALID = 2
+};
+
+static const char* const record_errors[] = {NULL, "Division by zero",
+                                            "Invalid record"};
+
+/* Apply op to a and b, storing the result (NAN on error) in *answer.
+ * Returns a calc_record_status. */
+static int evaluate(char op, float a, float b, float* answer) {
+  *answer = NAN;
+  switch (op) {
+    case '+':
+      *answer = add(a, b);
+      return CALC_RECORD_OK;
+    case '-':
+      *answer = subtract(a, b);
+      return CALC_RECORD_OK;
+    case '*':
+      *answer = multiply(a, b);
+      return CALC_RECORD_OK;
+    case '/':
+      /* Checked here: divide() reports every zero divisor on stderr. */
+      if (b == 0.0f) {
+        return CALC_RECORD_DIVISION_BY_ZERO;
+      }
+      *answer = divide(a, b);
+      return CALC_RECORD_OK;
+    default:
+      return CALC_RECORD_INVALID;
+  }
+}
+
+/* Parse "op a b" from a NUL-terminated line and evaluate it. */
+static int evaluate_line(const char* line, float* answer) {
+  char* end;
+  char op = line[0];
+  float a, b;
+  if (!isspace((unsigned char)line[1])) {
+    *answer = NAN;
+    return CALC_RECORD_INVALID;
+  }
+  a = strtof(line + 1, &end);
+  if (end == line + 1) {
+    *answer = NAN;
+    return CALC_RECORD_INVALID;
+  }
+  line = end;
+  b = strtof(line, &end);
+  if (end == line) {
+    *answer = NAN;
+    return CALC_RECORD_INVALID;
+  }
+  while (isspace((unsigned char)*end)) {
+    end++;
+  }
+  if (*end != '\0') {
+    *answer = NAN;
+    return CALC_RECORD_INVALID;
+  }
+  return evaluate(op, a, b, answer);
+}
+
+/* Evaluate text records; returns the number of failed records. */
+static size_t run_text_batch(FILE* in, FILE* out) {
+  static char input[CALC_BATCH_BYTES + 1];
+  static char output[CALC_BATCH_BYTES];
+  size_t kept = 0, used = 0, failed = 0;
+  int at_end = 0;
+
+  while (!at_end) {
+    size_t length = kept + fread(input + kept, 1, CALC_BATCH_BYTES - kept, in);
+    char* line = input;
+    char* newline;
+    at_end = length < CALC_BATCH_BYTES;
+    if (at_end && length > 0 && input[length - 1] != '\n') {
+      input[length++] = '\n'; /* the last line has no newline */
+    }
+    if (!at_end && memchr(input, '\n', length) == NULL) {
+      /* A line longer than the buffer cannot be a valid record. */
+      fprintf(stderr, "Error: record longer than %d bytes\n", CALC_BATCH_BYTES);
+      return failed + 1;
+    }
+    while ((newline = memchr(line, '\n', input + length - line)) != NULL) {
+      float answer;
+      int status;
+      *newline = '\0';
+      while (isspace((unsigned char)*line)) {
+        line++;
+      }
+      if (*line != '\0' && *line != '#') {
+        status = evaluate_line(line, &answer);
+        if (CALC_BATCH_BYTES - used < CALC_MAX_LINE_OUTPUT) {
+          fwrite(output, 1, used, out);
+          used = 0;
+        }
+        if (status == CALC_RECORD_OK) {
+          used += snprintf(output + used, CALC_MAX_LINE_OUTPUT, "%.9g\n",
+                           (double)answer);
+        } else {
+          used += snprintf(output + used, CALC_MAX_LINE_OUTPUT, "Error: %s\n",
+                           record_errors[status]);
+          failed++;
+        }
+      }
+      line = newline + 1;
+    }
+    kept = input + length - line;
+    memmove(input, line, kept);
+  }
+  fwrite(output, 1, used, out);
+  return failed;
+}
+
+/* Evaluate binary records; returns the number of failed records. */
+static size_t run_binary_batch(FILE* in, FILE* out) {
+  static calc_record records[CALC_BATCH_RECORDS];
+  static float answers[CALC_BATCH_RECORDS];
+  size_t kept = 0, failed = 0;
+  int at_end = 0;
+
+  while (!at_end) {
+    size_t length =
+        kept + fread((char*)records + kept, 1, sizeof(records) - kept, in);
+    size_t count = length / sizeof(calc_record);
+    at_end = length < sizeof(records);
+    for (size_t i = 0; i < count; i++) {
+      failed += evaluate(records[i].op, records[i].a, records[i].b,
+                         &answers[i]) != CALC_RECORD_OK;
+    }
+    fwrite(answers, sizeof(float), count, out);
+    kept = length - count * sizeof(calc_record);
+    memmove(records, (char*)records + count * sizeof(calc_record), kept);
+  }
+  if (kept > 0) {
+    fprintf(stderr, "Error: truncated record at end of input\n");
+    failed++;
+  }
+  return failed;
+}
+
+static int run_batch(const char* input_path, const char* output_path,
+                     int binary) {
+  FILE* in = stdin;
+  FILE* out = stdout;
+  size_t failed;
+  int status = 0;
+
+  if (input_path != NULL && (in = fopen(input_path, "rb")) == NULL) {
+    perror(input_path);
+    return 1;
+  }
+  if (output_path != NULL && (out = fopen(output_path, "wb")) == NULL) {
+    perror(output_path);
+    if (in != stdin) {
+      fclose(in);
+    }
+    return 1;
+  }
+#ifdef _WIN32
+  /* Text-mode stdio would translate CR/LF and stop at 0x1A in records. */
+  if (binary) {
+    _setmode(_fileno(stdin), _O_BINARY);
+    _setmode(_fileno(stdout), _O_BINARY);
+  }
+#endif
+  failed = binary ? run_binary_batch(in, out) : run_text_batch(in, out);
+  if (ferror(in)) {
+    perror(input_path != NULL ? input_path : "stdin");
+    status = 1;
+  }
+  if (fflush(out) != 0 || ferror(out)) {
+    perror(output_path != NULL ? output_path : "stdout");
+    status = 1;
+  }
+  if (in != stdin) {
+    fclose(in);
+  }
+  if (out != stdout) {
+    fclose(out);
+  }
+  if (failed > 0) {
+    fprintf(stderr, "%zu record(s) failed\n", failed);
+    status = 1;
+  }
+  return status;
+}
+
+static int run_interactive(void) {
   char operator_char = '\0';
   float first_nb = 0.0f;
   float second_nb = 0.0f;
@@ -60,3 +285,34 @@ int main(void) {
 
   return 0;
 }
+
+static int usage(void) {
+  fprintf(stderr,
+          "usage: calculate [--batch [--binary] [--input FILE] "
+          "[--output FILE]]\n");
+  return 2;
+}
+
+int main(int argc, char** argv) {
+  const char* input_path = NULL;
+  const char* output_path = NULL;
+  int batch = 0, binary = 0;
+
+  for (int i = 1; i < argc; i++) {
+    if (strcmp(argv[i], "--batch") == 0) {
+      batch = 1;
+    } else if (strcmp(argv[i], "--binary") == 0) {
+      binary = 1;
+    } else if (strcmp(argv[i], "--input") == 0 && i + 1 < argc) {
+      input_path = argv[++i];
+    } else if (strcmp(argv[i], "--output") == 0 && i + 1 < argc) {
+      output_path = argv[++i];
+    } else {
+      return usage();
+    }
+  }
+  if (!batch) {
+    return binary || input_path || output_path ? usage() : run_interactive();
+  }
+  return run_batch(input_path, output_path, binary);
+}
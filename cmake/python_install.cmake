@@ -1,4 +1,4 @@
-# DLL name for Python __init__.py
+# Name of the built shared library
 if(WIN32)
   set(DLL_NAME "libcalculate.dll")
 else()
@@ -18,25 +18,15 @@ file(MAKE_DIRECTORY "${DEST_DIR}")
 # Copy the built shared library to the site-packages destination
 file(COPY "${CMAKE_CURRENT_BINARY_DIR}/c_src/${DLL_NAME}" DESTINATION "${DEST_DIR}")
 
-# Write __init__.py with injected DLL name
-file(WRITE "${DEST_DIR}/__init__.py" "
-from ctypes import CDLL, c_float
-import os
-
-_dll_path = os.path.join(os.path.dirname(__file__), '${DLL_NAME}')
-_dll = CDLL(_dll_path)
+# Copy the CPython extension module (passed in by the python-install target)
+if(NATIVE_MODULE)
+  file(COPY "${NATIVE_MODULE}" DESTINATION "${DEST_DIR}")
+endif()
 
-_dll.add.argtypes = [c_float, c_float]
-_dll.add.restype = c_float
-_dll.subtract.argtypes = [c_float, c_float]
-_dll.subtract.restype = c_float
-_dll.multiply.argtypes = [c_float, c_float]
-_dll.multiply.restype = c_float
-_dll.divide.argtypes = [c_float, c_float]
-_dll.divide.restype = c_float
+# Install the calculator_c package: the _native/_ctypes selector and the
+# ctypes fallback, which locates the shared library next to itself.
+file(GLOB PACKAGE_FILES "${CMAKE_CURRENT_LIST_DIR}/../c_src/calculator_c/*.py")
+file(COPY ${PACKAGE_FILES} DESTINATION "${DEST_DIR}")
 
-def add(a, b): return _dll.add(float(a), float(b))
-def subtract(a, b): return _dll.subtract(float(a), float(b))
-def multiply(a, b): return _dll.multiply(float(a), float(b))
-def divide(a, b): return _dll.divide(float(a), float(b))
-")
+# Record the install location for python/_backend.py
+file(WRITE "${CMAKE_CURRENT_LIST_DIR}/../python/calculator_c.path" "${SITE_PACKAGES}")
@@ -10,6 +10,7 @@ import subprocess
 import shutil
 import platform
 import argparse
+import time
 
 def run_command(command, check=True):
     """Run a command and handle errors."""
@@ -80,14 +81,17 @@ def build_with_make():
     print("Building C library with Make...")
     run_command("make clean", check=False)
     run_command("make")
+    # The CPython extension is optional; without it calculator_c uses ctypes
+    run_command("make native", check=False)
     
-    # Check if library was created
+    # Check if library was created (calculate.dll on Windows, else libcalculate.*)
     lib_extensions = ["dll", "so", "dylib"]
-    for ext in lib_extensions:
-        lib_path = f"c_src/calculate.{ext}"
-        if os.path.exists(lib_path):
-            print(f"✅ C library built: {lib_path}")
-            return lib_path
+    for name in ["calculate", "libcalculate"]:
+        for ext in lib_extensions:
+            lib_path = f"c_src/{name}.{ext}"
+            if os.path.exists(lib_path):
+                print(f"✅ C library built: {lib_path}")
+                return lib_path
     
     raise FileNotFoundError("C library not found after Make build")
 
@@ -154,6 +158,139 @@ def get_library_binary_for_pyinstaller():
     
     return lib_path, lib_file
 
+# Packaging layouts, in order of typical start-up time (slowest first):
+# onefile unpacks the whole bundle to a temporary directory on every launch,
+# onedir runs in place from dist/calculator-cli/, and zipapp runs the
+# precompiled bytecode with the Python interpreter that built it.
+LAYOUTS = ["onefile", "onedir", "zipapp"]
+
+# Standard library packages the CLI never imports. Leaving them out of a
+# PyInstaller bundle makes it smaller, so there is less to unpack and scan.
+EXCLUDED_MODULES = [
+    "tkinter", "unittest", "doctest", "pdb", "pydoc", "pydoc_data",
+    "email", "http", "xml", "xmlrpc", "curses", "lib2to3",
+    "distutils", "setuptools", "pip",
+]
+
+EXE_NAME = "calculator-cli"
+
+ZIPAPP_MAIN = """import os
+import sys
+
+# calculator_c contains extension modules, which cannot be imported from
+# a zip file; deploy.py puts it next to the archive.
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python.cli import main
+
+main()
+"""
+
+def stage_calculator_c(lib_path, target):
+    """Copy the calculator_c package and the built libraries to target."""
+    shutil.rmtree(target, ignore_errors=True)
+    shutil.copytree("c_src/calculator_c", target,
+                    ignore=shutil.ignore_patterns("__pycache__", "*.pyc"))
+    shutil.copy(lib_path, target)
+    # The CPython extension is optional: calculator_c falls back to ctypes
+    lib_dir = os.path.dirname(lib_path)
+    for file in os.listdir(lib_dir):
+        if file.startswith("_native.") and file.endswith((".so", ".pyd")):
+            shutil.copy(os.path.join(lib_dir, file), target)
+
+def build_pyinstaller(layout, lib_path, optimize):
+    """Bundle the CLI with PyInstaller; return (artifact, command to run it)."""
+    try:
+        import PyInstaller
+    except ImportError:
+        print("Installing PyInstaller...")
+        run_command("pip install pyinstaller")
+    
+    separator = ";" if platform.system() == "Windows" else ":"
+    exe_name = EXE_NAME + (".exe" if platform.system() == "Windows" else "")
+    
+    # PyInstaller always bundles precompiled bytecode; --optimize also strips
+    # asserts (1) and docstrings (2) from it
+    cmd = (f'pyinstaller --{layout} --console --name {EXE_NAME} python/cli.py '
+           f'--add-binary "{lib_path}{separator}." --clean --noconfirm')
+    for module in EXCLUDED_MODULES:
+        cmd += f" --exclude-module {module}"
+    if optimize:
+        cmd += f" --optimize {optimize}"
+    
+    # Bundle calculator_c as built here, whatever environment (if any) it
+    # was installed into
+    calculator_c_path = os.path.join("build", "calculator_c")
+    stage_calculator_c(lib_path, calculator_c_path)
+    cmd += f' --add-data "{calculator_c_path}{separator}calculator_c"'
+    
+    run_command(cmd)
+    
+    if layout == "onedir":
+        exe_path = os.path.join("dist", EXE_NAME, exe_name)
+    else:
+        exe_path = os.path.join("dist", exe_name)
+    return exe_path, [exe_path]
+
+def build_zipapp(lib_path, optimize):
+    """Package the CLI as a zipapp of precompiled bytecode.
+
+    Returns (artifact, command to run it). The archive holds the python
+    package; calculator_c is copied next to it, to dist/calculator_c.
+    """
+    import compileall
+    import py_compile
+    import zipapp
+    
+    staging = os.path.join("build", "zipapp")
+    shutil.rmtree(staging, ignore_errors=True)
+    shutil.copytree("python", os.path.join(staging, "python"),
+                    ignore=shutil.ignore_patterns("__pycache__", "*.pyc", "calculator_c.path"))
+    with open(os.path.join(staging, "__main__.py"), "w", encoding="utf-8") as fh:
+        fh.write(ZIPAPP_MAIN)
+    
+    # zipimport never writes bytecode and only reads legacy .pyc files next
+    # to the sources; unchecked-hash .pyc files are used without comparing
+    # them to the sources' timestamps
+    if not compileall.compile_dir(
+        staging, quiet=1, legacy=True, optimize=optimize,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    ):
+        raise RuntimeError("Compiling the zipapp sources failed")
+    
+    os.makedirs("dist", exist_ok=True)
+    exe_path = os.path.join("dist", EXE_NAME + ".pyz")
+    # Stored uncompressed: reading is faster than inflating at start-up
+    zipapp.create_archive(staging, exe_path, interpreter="/usr/bin/env python3")
+    stage_calculator_c(lib_path, os.path.join("dist", "calculator_c"))
+    print(f"Runs with Python {sys.version_info.major}.{sys.version_info.minor} "
+          "(the bytecode and extension module are version-specific)")
+    return exe_path, [sys.executable, exe_path]
+
+def artifact_size(path):
+    """Return the size of a file, or of all files in its directory for onedir."""
+    directory = os.path.dirname(path)
+    if os.path.basename(directory) != EXE_NAME:
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, file))
+               for root, dirs, files in os.walk(directory) for file in files)
+
+def measure_startup(command, runs):
+    """Run the artifact on "2+2" `runs` times; return the wall times in seconds.
+
+    The first run is the smoke test and includes any first-launch costs; None
+    is returned if a run fails.
+    """
+    times = []
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        result = subprocess.run(command + ["2+2"], capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0 or "= 4" not in result.stdout:
+            print(result.stdout + result.stderr)
+            return None
+    return times
+
 def main():
     """Main deployment function."""
     parser = argparse.ArgumentParser(
@@ -165,6 +302,8 @@ Examples:
   python deploy.py --build-system make    # Use Make
   python deploy.py --build-system cmake   # Use CMake
   python deploy.py --no-interactive       # Auto-select build system
+  python deploy.py -n --layout onedir     # Faster-starting directory bundle
+  python deploy.py -n --layout zipapp     # Bytecode archive for this Python
         """
     )
     
@@ -180,6 +319,28 @@ Examples:
         help="Auto-select build system without prompting"
     )
     
+    parser.add_argument(
+        "--layout", "-l",
+        choices=LAYOUTS,
+        default="onefile",
+        help="Packaging layout (default: onefile; onedir and zipapp start faster)"
+    )
+    
+    parser.add_argument(
+        "--optimize", "-O",
+        type=int,
+        choices=[0, 1, 2],
+        default=0,
+        help="Bytecode optimization level: 1 strips asserts, 2 also docstrings"
+    )
+    
+    parser.add_argument(
+        "--runs", "-r",
+        type=int,
+        default=5,
+        help="Times to launch the artifact to measure its start-up (default: 5)"
+    )
+    
     parser.add_argument(
         "--clean-only", "-c",
         action="store_true",
@@ -259,14 +420,7 @@ Examples:
         print(f"❌ Build failed: {e}")
         sys.exit(1)
     
-    # Install PyInstaller if not available
-    try:
-        import PyInstaller
-    except ImportError:
-        print("Installing PyInstaller...")
-        run_command("pip install pyinstaller")
-    
-    # Get library file for PyInstaller
+    # Get library file to bundle
     try:
         lib_path, lib_file = get_library_binary_for_pyinstaller()
         print(f"Using library for packaging: {lib_path}")
@@ -274,50 +428,33 @@ Examples:
         print(f"❌ {e}")
         sys.exit(1)
     
-    # Create standalone executable
-    print("Creating standalone executable...")
-    exe_name = "calculator-cli"
-    if platform.system() == "Windows":
-        exe_name += ".exe"
-      # Build PyInstaller command
-    separator = ";" if platform.system() == "Windows" else ":"
-    
-    # Find calculator_c module path
-    calculator_c_path = None
-    venv_path = os.environ.get("VIRTUAL_ENV")
-    if venv_path:
-        calculator_c_path = os.path.join(venv_path, "Lib", "site-packages", "calculator_c")
-    
-    cmd = f'pyinstaller --onefile --console --name {exe_name} python/cli.py --add-binary "{lib_path}{separator}." --clean'
-    
-    # Add calculator_c module if found
-    if calculator_c_path and os.path.exists(calculator_c_path):
-        cmd += f' --add-data "{calculator_c_path}{separator}calculator_c"'
-        print(f"Including calculator_c module from: {calculator_c_path}")
+    print(f"Creating {args.layout} executable...")
+    if args.layout == "zipapp":
+        exe_path, command = build_zipapp(lib_path, args.optimize)
     else:
-        print("WARNING: calculator_c module not found - executable may not work properly")
-    
-    run_command(cmd)
+        exe_path, command = build_pyinstaller(args.layout, lib_path, args.optimize)
     
     # Verify executable was created
-    exe_path = f"dist/{exe_name}"
-    if os.path.exists(exe_path):
-        size = os.path.getsize(exe_path)
-        print(f"✅ Standalone executable created: {exe_path} ({size:,} bytes)")
-        print("\n=== Deployment Complete ===")
-        print(f"Your executable is ready at: {exe_path}")
-        print("You can distribute this file to run on any compatible system.")
-        
-        # Test the executable
-        print("\nTesting executable...")
-        test_result = run_command(f'"{exe_path}" "2+2"', check=False)
-        if test_result.returncode == 0:
-            print("✅ Executable test passed!")
-        else:
-            print("⚠️  Executable test failed, but binary was created")
-    else:
+    if not os.path.exists(exe_path):
         print("❌ Failed to create executable")
         sys.exit(1)
+    print(f"✅ Standalone executable created: {exe_path} ({artifact_size(exe_path):,} bytes)")
+    print("\n=== Deployment Complete ===")
+    print(f"Your executable is ready at: {exe_path}")
+    
+    # Test the executable; the same runs measure its start-up time
+    print("\nTesting executable...")
+    times = measure_startup(command, args.runs)
+    if times is None:
+        print("⚠️  Executable test failed, but binary was created")
+        return 0
+    print("✅ Executable test passed!")
+    print(f"Cold start ({args.layout}, \"2+2\"): first run {times[0] * 1000:.1f} ms", end="")
+    if len(times) > 1:
+        warm = sorted(times[1:])
+        print(f", then min {warm[0] * 1000:.1f} ms / median {warm[len(warm) // 2] * 1000:.1f} ms"
+              f" over {len(warm)} runs", end="")
+    print()
     
     return 0
 
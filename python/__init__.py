@@ -1,83 +1,372 @@
-import sys
-import os
-import site
-
-# Try to import calculator_c, if it fails, try to find and add it to the path
-try:
-    import calculator_c
-except ImportError:
-    # Look for calculator_c in all site-packages directories
-    calculator_c_found = False
-
-    # Check virtual environment first
-    venv_path = os.environ.get("VIRTUAL_ENV")
-    if venv_path:
-        venv_site_packages = os.path.join(venv_path, "Lib", "site-packages")
-        calculator_c_path = os.path.join(venv_site_packages, "calculator_c")
-
-        if os.path.exists(calculator_c_path):
-            if venv_site_packages not in sys.path:
-                sys.path.insert(0, venv_site_packages)
-            calculator_c_found = True
-
-    # Check all site-packages directories
-    if not calculator_c_found:
-        for site_package in site.getsitepackages():
-            calculator_c_path = os.path.join(site_package, "calculator_c")
-            if os.path.exists(calculator_c_path):
-                if site_package not in sys.path:
-                    sys.path.insert(0, site_package)
-                calculator_c_found = True
-                break
-
-    # Try import again
-    import calculator_c
+from array import array
+from time import perf_counter
+
+from ._backend import calculator_c
+from .cache import CacheInfo, LRUCache
+from .cache import shared_cache as _shared_cache
+from .expression import CompiledExpression, compile_expression
 
 
 class Calculator:
-    """A calculator class that uses C backend for operations."""
+    """A calculator class that uses C backend for operations.
+
+    Parsed expressions and their results are kept in a bounded LRU cache
+    keyed on the whitespace-normalized expression text. Each instance has
+    its own cache of ``cache_size`` entries unless ``shared_cache`` is set,
+    in which case the process-wide ``python.cache.shared_cache`` is used.
+    A Calculator can be shared between threads.
+
+    ``engine`` selects how expressions are evaluated: ``"native"`` runs the
+    whole expression in the bytecode VM of ``calculator_c`` in one call,
+    ``"python"`` calls ``add``/``subtract``/... once per operator and
+    ``"codegen"`` calls a Python function generated from the expression,
+    compiled once and cached with it (see ``CompiledExpression.function``).
+
+    ``optimize=False`` disables the compile-time optimizer (see
+    ``Calculator.compile``).
+
+    ``dtype`` is the working precision: ``"float64"`` (the default) or
+    ``"float32"``, which rounds every operation to single precision and
+    makes the array methods and ``calculate_over`` take and return float32
+    arrays, halving their memory traffic. The methods called on the class
+    itself are float64.
+
+    With ``profile=True`` every ``calculate`` call records the time spent
+    per stage (cache, parse, dispatch, native), reported by ``stats()``.
+    Without it the instrumented code path is never entered.
+    """
+
+    ENGINES = ("native", "python", "codegen")
+    DTYPES = ("float64", "float32")
+
+    def __init__(
+        self,
+        cache_size: int = 1024,
+        shared_cache: bool = False,
+        engine="native",
+        profile: bool = False,
+        optimize: bool = True,
+        dtype: str = "float64",
+    ):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}")
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unknown dtype {dtype!r}")
+        self.engine = engine
+        self.optimize = optimize
+        self.dtype = dtype
+        # Cache keys of unoptimized or float32 programs are kept apart from
+        # the default ones, which matters when the cache is shared.
+        self._key_prefix = "" if optimize else "\0unoptimized:"
+        if dtype == "float32":
+            self._key_prefix += "\0float32:"
+            self.add = calculator_c.add
+            self.subtract = calculator_c.subtract
+            self.multiply = calculator_c.multiply
+            self.divide = calculator_c.divide
+            self.add_array = calculator_c.add_array_float
+            self.subtract_array = calculator_c.subtract_array_float
+            self.multiply_array = calculator_c.multiply_array_float
+            self.divide_array = calculator_c.divide_array_float
+        self._cache = _shared_cache if shared_cache else LRUCache(cache_size)
+        self.profiler = None
+        if profile:
+            from .profiling import Profiler
+
+            self.profiler = Profiler()
+            self.calculate = self._calculate_profiled
 
     @staticmethod
     def add(a: float, b: float) -> float:
         """Add two numbers."""
-        return calculator_c.add(a, b)
+        return calculator_c.add_double(a, b)
 
     @staticmethod
     def subtract(a: float, b: float) -> float:
         """Subtract two numbers."""
-        return calculator_c.subtract(a, b)
+        return calculator_c.subtract_double(a, b)
 
     @staticmethod
     def multiply(a: float, b: float) -> float:
         """Multiply two numbers."""
-        return calculator_c.multiply(a, b)
+        return calculator_c.multiply_double(a, b)
 
     @staticmethod
     def divide(a: float, b: float) -> float:
         """Divide two numbers."""
         if b == 0:
             raise ZeroDivisionError("Division by zero")
-        return calculator_c.divide(a, b)
-
-    def calculate(self, expression: str) -> float:
-        """Parse and calculate a simple expression."""
-        expression = expression.replace(" ", "")
-
-        for op in ["+", "-", "*", "/"]:
-            if op in expression:
-                parts = expression.split(op)
-                if len(parts) == 2:
-                    try:
-                        a, b = float(parts[0]), float(parts[1])
-                        if op == "+":
-                            return self.add(a, b)
-                        elif op == "-":
-                            return self.subtract(a, b)
-                        elif op == "*":
-                            return self.multiply(a, b)
-                        elif op == "/":
-                            return self.divide(a, b)
-                    except ValueError:
-                        raise ValueError("Invalid numbers in expression")
-
-        raise ValueError("Invalid expression format")
+        return calculator_c.divide_double(a, b)
+
+    @staticmethod
+    def add_array(a, b, out=None):
+        """Add two float64 arrays element-wise in a single native call.
+
+        The array methods write into ``out`` when given, which may be one of
+        the operands; 1-D strided memoryviews are used without copying.
+        """
+        return calculator_c.add_array(a, b, out)
+
+    @staticmethod
+    def subtract_array(a, b, out=None):
+        """Subtract two float64 arrays element-wise in a single native call."""
+        return calculator_c.subtract_array(a, b, out)
+
+    @staticmethod
+    def multiply_array(a, b, out=None):
+        """Multiply two float64 arrays element-wise in a single native call."""
+        return calculator_c.multiply_array(a, b, out)
+
+    @staticmethod
+    def divide_array(a, b, out=None):
+        """Divide two float64 arrays element-wise in a single native call.
+
+        Raises ZeroDivisionError if any divisor is zero.
+        """
+        return calculator_c.divide_array(a, b, out)
+
+    @staticmethod
+    def sum_array(values) -> float:
+        """Sum a float64 array natively, with pairwise summation."""
+        return calculator_c.sum_array(values)
+
+    @staticmethod
+    def product_array(values) -> float:
+        """Multiply the elements of a float64 array natively."""
+        return calculator_c.product_array(values)
+
+    @staticmethod
+    def min_array(values) -> float:
+        """Return the smallest element of a float64 array (NaN if any is)."""
+        return calculator_c.min_array(values)
+
+    @staticmethod
+    def max_array(values) -> float:
+        """Return the largest element of a float64 array (NaN if any is)."""
+        return calculator_c.max_array(values)
+
+    @staticmethod
+    def mean_array(values) -> float:
+        """Return the mean of a float64 array, from its pairwise sum."""
+        return calculator_c.mean_array(values)
+
+    @staticmethod
+    def dot_array(a, b) -> float:
+        """Return the dot product of two float64 arrays, summed pairwise."""
+        return calculator_c.dot_array(a, b)
+
+    @staticmethod
+    def compile(
+        expression: str, optimize: bool = True, dtype: str = "float64"
+    ) -> CompiledExpression:
+        """Parse an expression once for repeated evaluation.
+
+        ``optimize`` folds constants, applies exact algebraic identities and
+        evaluates repeated subexpressions once; ``dump()`` on the result
+        shows the optimized form. ``dtype`` is the precision it runs in.
+        """
+        return compile_expression(expression, optimize, dtype)
+
+    def calculate(self, expression: str, variables=None) -> float:
+        """Parse and calculate an expression.
+
+        Supports ``+ - * /`` with the usual precedence, parentheses, unary
+        minus and named variables, e.g. ``-3 * (price + 4) / 5`` with
+        ``variables={"price": 2.5}``. Results of constant expressions are
+        cached; expressions with variables only cache their parse.
+        """
+        key = self._key_prefix + " ".join(expression.split())
+        entry = self._cache.get(key)
+        if entry is not None:
+            compiled, result = entry
+            if result is not None:
+                return result
+            result = self._evaluate(compiled, variables)
+            if not compiled.variables:
+                self._cache.put(key, (compiled, result))
+            return result
+
+        compiled = self.compile(expression, self.optimize, self.dtype)
+        if compiled.variables:
+            self._cache.put(key, (compiled, None))
+            return self._evaluate(compiled, variables)
+        try:
+            result = self._evaluate(compiled)
+        except ArithmeticError:
+            self._cache.put(key, (compiled, None))
+            raise
+        self._cache.put(key, (compiled, result))
+        return result
+
+    def calculate_over(self, expression: str, columns, out=None):
+        """Evaluate an expression once per row of ``columns``.
+
+        ``columns`` maps each variable name to a float64 array (any buffer
+        or sequence of floats); row ``i`` binds every name to its column's
+        ``i``-th value. The whole evaluation runs as a few array passes in
+        ``calculator_c``, whatever the engine. Returns ``out`` if given,
+        otherwise a new ``array('d')``. With ``dtype="float32"`` columns and
+        ``out`` are float32 arrays and the result is an ``array('f')``.
+        """
+        key = self._key_prefix + " ".join(expression.split())
+        entry = self._cache.get(key)
+        if entry is None:
+            entry = (self.compile(expression, self.optimize, self.dtype), None)
+            self._cache.put(key, entry)
+        return entry[0].run_columns(columns, out)
+
+    def calculate_many(
+        self,
+        expressions,
+        jobs: int = 1,
+        chunk_size: int = 1024,
+        return_exceptions=False,
+    ):
+        """Yield the result of each expression, in input order.
+
+        With ``jobs`` > 1 (or ``None`` for one per CPU) the work is spread
+        over a process pool in chunks of ``chunk_size`` expressions while
+        keeping only a few chunks in flight. If ``return_exceptions`` is
+        true, a failing expression yields its exception instead of raising.
+        """
+        from .parallel import imap_outcomes
+
+        for result, error in imap_outcomes(self, expressions, jobs, chunk_size):
+            if error is None:
+                yield result
+            elif return_exceptions:
+                yield error
+            else:
+                raise error
+
+    def map_threaded(
+        self, operation, *operands, out=None, workers=None, chunk_rows=None
+    ):
+        """Apply an array operation to large arrays on a pool of threads.
+
+        ``operation`` is an array method such as ``calc.add_array``, or any
+        callable taking the operands and ``out``; it is called on slices of
+        ``chunk_rows`` rows (default ``python.parallel.CHUNK_ROWS``) by up
+        to ``workers`` threads (default one per CPU). It may also be an
+        expression, evaluated with ``calculate_over`` for a single mapping
+        of columns. The native kernels release the GIL, so this scales with
+        cores without pickling anything. Returns ``out``, or a new array of
+        this calculator's dtype.
+        """
+        from .parallel import CHUNK_ROWS, as_chunkable, map_chunks
+
+        code = "f" if self.dtype == "float32" else "d"
+        if isinstance(operation, str):
+            expression, (columns,) = operation, operands
+            names, operands = list(columns), columns.values()
+
+            def operation(*chunks, out):
+                return self.calculate_over(expression, dict(zip(names, chunks)), out)
+
+        views = [as_chunkable(operand, code) for operand in operands]
+        if not views:
+            raise ValueError("at least one operand is required")
+        if out is None:
+            out = array(code, bytes(len(views[0]) * array(code).itemsize))
+        # memoryview(out) rejects non-buffers, whose results would be lost.
+        out_view = as_chunkable(memoryview(out), code)
+        map_chunks(operation, views, out_view, workers, chunk_rows or CHUNK_ROWS)
+        return out
+
+    def evaluate(self, compiled: CompiledExpression, variables=None) -> float:
+        """Evaluate a CompiledExpression with this calculator's engine.
+
+        Unlike ``calculate`` this bypasses the cache, for callers that keep
+        their own compiled expressions.
+        """
+        return self._evaluate(compiled, variables)
+
+    def _evaluate(self, compiled: CompiledExpression, variables=None) -> float:
+        if self.engine == "native":
+            return compiled.run(variables)
+        if self.engine == "codegen":
+            return compiled.call(variables)
+        return compiled.evaluate(self, variables)
+
+    def _calculate_profiled(self, expression: str, variables=None) -> float:
+        # Same logic as calculate, with each stage timed.
+        clock, record = perf_counter, self.profiler.record
+        start = clock()
+        key = self._key_prefix + " ".join(expression.split())
+        entry = self._cache.get(key)
+        record("cache", clock() - start)
+        if entry is not None:
+            compiled, result = entry
+            if result is not None:
+                return result
+        else:
+            start = clock()
+            compiled = self.compile(expression, self.optimize, self.dtype)
+            if self.engine == "codegen":
+                compiled.function  # generating it is part of parsing
+            record("parse", clock() - start)
+            if compiled.variables:
+                self._cache.put(key, (compiled, None))
+        try:
+            result = self._evaluate_profiled(compiled, variables)
+        except ArithmeticError:
+            if entry is None:
+                self._cache.put(key, (compiled, None))
+            raise
+        if not compiled.variables:
+            start = clock()
+            self._cache.put(key, (compiled, result))
+            record("cache", clock() - start)
+        return result
+
+    def _evaluate_profiled(self, compiled: CompiledExpression, variables=None):
+        clock, record = perf_counter, self.profiler.record
+        start = clock()
+        if self.engine == "native":
+            run = (
+                calculator_c.run
+                if compiled.dtype == "float32"
+                else calculator_c.run_double
+            )
+            args = (compiled.bytecode,)
+            if compiled.variables:
+                args += (compiled._bind(variables),)
+            call = clock()
+            try:
+                return run(*args)
+            finally:
+                record("native", clock() - call)
+                record("dispatch", call - start)
+        if self.engine == "codegen":
+            function = compiled.function
+            args = compiled._bind(variables) if compiled.variables else ()
+            call = clock()
+            try:
+                return function(*args)
+            finally:
+                record("native", clock() - call)
+                record("dispatch", call - start)
+        from .profiling import NativeTimer
+
+        timer = NativeTimer(self)
+        try:
+            return compiled.evaluate(timer, variables)
+        finally:
+            record("native", timer.elapsed)
+            record("dispatch", clock() - start - timer.elapsed)
+
+    def stats(self) -> dict:
+        """Return per-stage call counts and timings, if profiling is enabled.
+
+        Maps stage name to a ``python.profiling.StageStats`` (seconds);
+        empty unless the Calculator was created with ``profile=True``.
+        """
+        return self.profiler.stats() if self.profiler is not None else {}
+
+    def cache_info(self) -> CacheInfo:
+        """Return hit/miss/eviction counters of the expression cache."""
+        return self._cache.info()
+
+    def clear_cache(self):
+        """Drop all cached expressions and reset the cache counters."""
+        self._cache.clear()
@@ -0,0 +1,75 @@
+"""Lazy resolution of the calculator_c bindings.
+
+Importing the package does not load calculator_c; the first attribute
+access on ``calculator_c`` below does. If a plain import fails, the
+directory recorded in ``calculator_c.path`` at install time is tried
+before falling back to scanning every site-packages directory.
+"""
+
+import os
+import sys
+
+LOCATOR_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "calculator_c.path"
+)
+
+
+def _locator_directories():
+    try:
+        with open(LOCATOR_FILE, "r", encoding="utf-8") as fh:
+            directory = fh.read().strip()
+    except OSError:
+        return
+    if directory:
+        yield directory
+
+
+def _site_directories():
+    # Check virtual environment first
+    venv_path = os.environ.get("VIRTUAL_ENV")
+    if venv_path:
+        yield os.path.join(venv_path, "Lib", "site-packages")
+
+    import site
+
+    yield from site.getsitepackages()
+
+
+def load():
+    """Import and return calculator_c, searching known locations if needed."""
+    try:
+        import calculator_c
+
+        return calculator_c
+    except ImportError:
+        pass
+
+    for search in (_locator_directories, _site_directories):
+        for directory in search():
+            if os.path.exists(os.path.join(directory, "calculator_c")):
+                if directory not in sys.path:
+                    sys.path.insert(0, directory)
+                import calculator_c
+
+                return calculator_c
+
+    # Not found anywhere: re-raise the original ImportError
+    import calculator_c
+
+    return calculator_c
+
+
+class _LazyModule:
+    """Stand-in for calculator_c that imports it on first attribute access.
+
+    After loading, the module's functions are copied onto the instance, so
+    later lookups are plain attribute reads with no extra indirection.
+    """
+
+    def __getattr__(self, name):
+        module = load()
+        self.__dict__.update(vars(module))
+        return getattr(module, name)
+
+
+calculator_c = _LazyModule()
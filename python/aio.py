@@ -0,0 +1,169 @@
+"""Micro-batching asyncio front end for Calculator.
+
+``AsyncCalculator.calculate`` queues the request instead of evaluating it.
+Requests arriving within a short window (or until a batch is full) are
+evaluated together in an executor, off the event loop, and each awaiting
+caller gets its own result or exception.
+"""
+
+import asyncio
+from collections import namedtuple
+from time import perf_counter
+
+from .profiling import Profiler
+
+# ``queue_depth`` counts requests waiting for a batch or being evaluated.
+BatchInfo = namedtuple(
+    "BatchInfo",
+    "requests batches mean_batch_size max_batch_size queue_depth "
+    "max_queue_depth window",
+)
+
+
+def _outcome(calc, expression, variables):
+    try:
+        return calc.calculate(expression, variables), None
+    except Exception as e:
+        return None, e
+
+
+def evaluate_batch(calc, requests) -> list:
+    """Return ``(result, exception)`` per ``(expression, variables)`` request.
+
+    Requests with variables that share an expression and variable names are
+    evaluated together with one ``calculate_over``; if that fails, they are
+    evaluated one by one so only the failing requests get an exception.
+    """
+    outcomes = [None] * len(requests)
+    groups = {}
+    for index, (expression, variables) in enumerate(requests):
+        if variables:
+            key = (expression, tuple(sorted(variables)))
+            groups.setdefault(key, []).append(index)
+        else:
+            outcomes[index] = _outcome(calc, expression, variables)
+    for (expression, names), indices in groups.items():
+        if len(indices) > 1:
+            columns = {
+                name: [requests[index][1][name] for index in indices] for name in names
+            }
+            try:
+                results = calc.calculate_over(expression, columns)
+            except Exception:
+                pass
+            else:
+                for index, result in zip(indices, results):
+                    outcomes[index] = (result, None)
+                continue
+        for index in indices:
+            outcomes[index] = _outcome(calc, *requests[index])
+    return outcomes
+
+
+class AsyncCalculator:
+    """Coalesce concurrent ``await calculate(...)`` calls into batches.
+
+    A batch is dispatched ``window`` seconds after its first request, or as
+    soon as it holds ``max_batch`` requests, and evaluated by ``calc`` (a
+    new Calculator by default) on ``executor`` (the loop's default executor
+    if None). Must be used from a single event loop.
+
+    ``batch_info()`` reports batch sizes and queue depth; ``stats()``
+    reports per-request latency percentiles for the stages "queue" (waiting
+    for dispatch), "batch" (evaluating a whole batch) and "latency" (from
+    ``calculate`` to the result); ``profiler.histogram`` buckets them.
+    """
+
+    def __init__(
+        self, calc=None, window: float = 0.001, max_batch: int = 256, executor=None
+    ):
+        if calc is None:
+            from . import Calculator
+
+            calc = Calculator()
+        if window < 0 or max_batch < 1:
+            raise ValueError("window must be >= 0 and max_batch >= 1")
+        self.calc = calc
+        self.window = window
+        self.max_batch = max_batch
+        self.profiler = Profiler()
+        self._executor = executor
+        self._pending = []
+        self._timer = None
+        self._in_flight = 0
+        self._requests = 0
+        self._batches = 0
+        self._max_batch_size = 0
+        self._max_queue_depth = 0
+
+    async def calculate(self, expression: str, variables=None) -> float:
+        """Evaluate ``expression`` as part of the next batch."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((expression, variables, future, perf_counter()))
+        depth = len(self._pending) + self._in_flight
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        """Dispatch the queued requests now instead of at the window's end."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        dispatched = perf_counter()
+        for _, _, _, submitted in batch:
+            self.profiler.record("queue", dispatched - submitted)
+        self._in_flight += len(batch)
+        self._requests += len(batch)
+        self._batches += 1
+        self._max_batch_size = max(self._max_batch_size, len(batch))
+        requests = [(expression, variables) for expression, variables, _, _ in batch]
+        task = asyncio.get_running_loop().run_in_executor(
+            self._executor, evaluate_batch, self.calc, requests
+        )
+        task.add_done_callback(lambda task: self._deliver(batch, task, dispatched))
+
+    def _deliver(self, batch, task, dispatched):
+        now = perf_counter()
+        self._in_flight -= len(batch)
+        self.profiler.record("batch", now - dispatched)
+        error = None if task.cancelled() else task.exception()
+        for index, (_, _, future, submitted) in enumerate(batch):
+            self.profiler.record("latency", now - submitted)
+            if future.done():  # the caller stopped waiting
+                continue
+            if task.cancelled():
+                future.cancel()
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+            result, exception = task.result()[index]
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def batch_info(self) -> BatchInfo:
+        """Return request and batch counters and the current queue depth."""
+        return BatchInfo(
+            self._requests,
+            self._batches,
+            self._requests / self._batches if self._batches else 0.0,
+            self._max_batch_size,
+            len(self._pending) + self._in_flight,
+            self._max_queue_depth,
+            self.window,
+        )
+
+    def stats(self) -> dict:
+        """Return a ``StageStats`` per stage (seconds), as Calculator.stats."""
+        return self.profiler.stats()
@@ -0,0 +1,139 @@
+"""Streaming evaluation of many expressions for the CLI batch mode.
+
+Each stage is a generator, so input is consumed one line at a time and
+memory use does not grow with the number of expressions.
+"""
+
+import csv
+import io
+import json
+import math
+from collections import deque, namedtuple
+
+FORMATS = ("plain", "csv", "json")
+
+
+# One evaluated line; exactly one of result and error is None.
+Record = namedtuple("Record", "line expression result error")
+
+
+def read_expressions(stream):
+    """Yield ``(line_number, expression)`` for non-blank, non-comment lines."""
+    for line_number, line in enumerate(stream, 1):
+        expression = line.strip()
+        if expression and not expression.startswith("#"):
+            yield line_number, expression
+
+
+def error_message(error) -> str:
+    """Return the text reported for a failed expression."""
+    if isinstance(error, (ValueError, ArithmeticError)):
+        return str(error)
+    return f"{type(error).__name__}: {error}"
+
+
+def json_result(result):
+    """Return a result as JSON can hold it: non-finite floats become strings.
+
+    ``inf``, ``-inf`` and ``nan`` are written as in the plain format, since
+    strict JSON has no literal for them.
+    """
+    if result is None or math.isfinite(result):
+        return result
+    return repr(result)
+
+
+def evaluate(calc, expressions, jobs=1):
+    """Yield a Record per expression; errors are captured, not raised."""
+    pending = deque()
+
+    def texts():
+        for line_number, expression in expressions:
+            pending.append((line_number, expression))
+            yield expression
+
+    outcomes = calc.calculate_many(texts(), jobs=jobs, return_exceptions=True)
+    for outcome in outcomes:
+        line_number, expression = pending.popleft()
+        if isinstance(outcome, Exception):
+            yield Record(line_number, expression, None, error_message(outcome))
+        else:
+            yield Record(line_number, expression, outcome, None)
+
+
+def format_plain(records):
+    for record in records:
+        if record.error is None:
+            yield f"{record.result}\n"
+        else:
+            yield f"Error: {record.error}\n"
+
+
+def format_csv(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(["line", "expression", "result", "error"])
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def format_json(records):
+    for record in records:
+        record = record._replace(result=json_result(record.result))
+        yield json.dumps(record._asdict(), allow_nan=False) + "\n"
+
+
+_FORMATTERS = {"plain": format_plain, "csv": format_csv, "json": format_json}
+
+
+BatchSummary = namedtuple("BatchSummary", "count errors")
+
+
+def _write_profiled(output_stream, formatter, records, profiler):
+    # Time from handing a record to the formatter until its text is written.
+    from time import perf_counter
+
+    handed_over = perf_counter()
+
+    def feed():
+        nonlocal handed_over
+        for record in records:
+            handed_over = perf_counter()
+            yield record
+
+    for text in formatter(feed()):
+        output_stream.write(text)
+        profiler.record("output", perf_counter() - handed_over)
+
+
+def run_batch(
+    calc, input_stream, output_stream, output_format="plain", jobs=1, profiler=None
+) -> BatchSummary:
+    """Evaluate every expression in input_stream and write the results.
+
+    Output is written through the stream's own buffering with no per-line
+    flush. ``jobs`` is passed on to Calculator.calculate_many. With a
+    ``profiler`` the formatting and writing of each record is timed as
+    the ``"output"`` stage.
+    """
+    count = errors = 0
+
+    def tally(records):
+        nonlocal count, errors
+        for record in records:
+            count += 1
+            if record.error is not None:
+                errors += 1
+            yield record
+
+    records = tally(evaluate(calc, read_expressions(input_stream), jobs))
+    if profiler is None:
+        output_stream.writelines(_FORMATTERS[output_format](records))
+    else:
+        _write_profiled(output_stream, _FORMATTERS[output_format], records, profiler)
+    return BatchSummary(count, errors)
@@ -0,0 +1,154 @@
+"""Named cells with incremental recomputation, for the interactive mode.
+
+A cell is a name bound to an expression that may refer to other cells.
+The sheet keeps the dependency graph in both directions; when a cell is
+(re)defined or removed, only the cells that transitively depend on it are
+recomputed, in dependency order. The work is proportional to that dirty
+set, not to the size of the sheet, and no step recurses, so long chains of
+cells are fine.
+"""
+
+from collections import defaultdict
+
+
+class Sheet:
+    """A set of named cells evaluated with a Calculator.
+
+    A cell whose evaluation fails holds the exception as its value; cells
+    depending on it hold the same exception, as do cells referring to a
+    name that is not defined.
+    """
+
+    def __init__(self, calc=None):
+        if calc is None:
+            from . import Calculator
+
+            calc = Calculator()
+        self._calc = calc
+        self._compiled = {}
+        self._values = {}
+        # name -> cells whose expression refers to name; name need not be a
+        # cell yet, so defining it later updates those cells.
+        self._dependents = defaultdict(set)
+
+    def __contains__(self, name):
+        return name in self._compiled
+
+    def __len__(self):
+        return len(self._compiled)
+
+    def cells(self) -> list:
+        """Return the cell names in definition order."""
+        return list(self._compiled)
+
+    def expression(self, name: str) -> str:
+        """Return the source expression of a cell."""
+        return self._compiled[name].source
+
+    def value(self, name: str) -> float:
+        """Return the value of a cell, raising its error if it has one."""
+        if name not in self._values:
+            raise ValueError(f"Unknown cell {name!r}")
+        return _raise_error(self._values[name])
+
+    def define(self, name: str, expression: str) -> list:
+        """Set cell ``name`` to ``expression`` and recompute what changed.
+
+        Returns ``(cell, value)`` pairs for every recomputed cell, in
+        evaluation order, starting with ``name``; a failed cell's value is
+        its exception. Raises ValueError for an invalid name or expression,
+        or if the definition would make a cell depend on itself; the sheet
+        is left unchanged in that case.
+        """
+        if not name.isidentifier():
+            raise ValueError(f"Invalid cell name {name!r}")
+        compiled = self._compile(expression)
+        dirty = self._dependent_closure([name])
+        for dependency in compiled.variables:
+            if dependency in dirty:
+                raise ValueError(f"Circular reference: {name!r} depends on itself")
+
+        previous = self._compiled.get(name)
+        if previous is not None:
+            for dependency in previous.variables:
+                self._dependents[dependency].discard(name)
+        for dependency in compiled.variables:
+            self._dependents[dependency].add(name)
+        self._compiled[name] = compiled
+        return self._recompute(dirty)
+
+    def remove(self, name: str) -> list:
+        """Delete cell ``name``; returns the recomputed dependents."""
+        compiled = self._compiled.pop(name, None)
+        if compiled is None:
+            raise ValueError(f"Unknown cell {name!r}")
+        del self._values[name]
+        for dependency in compiled.variables:
+            self._dependents[dependency].discard(name)
+        dirty = self._dependent_closure(self._dependents.get(name, ()))
+        return self._recompute(dirty)
+
+    def evaluate(self, expression: str) -> float:
+        """Evaluate an expression that may refer to cells, without storing it."""
+        return _raise_error(self._compute(self._compile(expression)))
+
+    def _compile(self, expression: str):
+        calc = self._calc
+        return calc.compile(
+            expression,
+            getattr(calc, "optimize", True),
+            getattr(calc, "dtype", "float64"),
+        )
+
+    def _dependent_closure(self, roots) -> set:
+        """Return ``roots`` and every cell that transitively depends on them."""
+        closure = set(roots)
+        pending = list(closure)
+        while pending:
+            for dependent in self._dependents.get(pending.pop(), ()):
+                if dependent not in closure:
+                    closure.add(dependent)
+                    pending.append(dependent)
+        return closure
+
+    def _recompute(self, dirty) -> list:
+        # Kahn's algorithm restricted to the dirty cells: only edges between
+        # two dirty cells constrain the order.
+        waiting = {
+            cell: sum(1 for dep in self._compiled[cell].variables if dep in dirty)
+            for cell in dirty
+            if cell in self._compiled
+        }
+        ready = [cell for cell, count in waiting.items() if count == 0]
+        updated = []
+        while ready:
+            cell = ready.pop()
+            value = self._values[cell] = self._compute(self._compiled[cell])
+            updated.append((cell, value))
+            for dependent in self._dependents.get(cell, ()):
+                if dependent in waiting:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        ready.append(dependent)
+        return updated
+
+    def _compute(self, compiled):
+        """Return the value of ``compiled``, or the exception it fails with."""
+        variables = {}
+        for dependency in compiled.variables:
+            value = self._values.get(dependency)
+            if value is None:
+                return ValueError(f"Unknown cell {dependency!r}")
+            if isinstance(value, Exception):
+                return value
+            variables[dependency] = value
+        try:
+            return self._calc.evaluate(compiled, variables)
+        except (ArithmeticError, ValueError) as e:
+            return e.with_traceback(None)
+
+
+def _raise_error(value):
+    if isinstance(value, Exception):
+        raise value.with_traceback(None)
+    return value
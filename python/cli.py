@@ -1,4 +1,3 @@
-import argparse
 import sys
 import os
 
@@ -10,32 +9,150 @@ except ImportError:
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from python import Calculator
 
+# Everything else (argparse, batch, daemon) is imported only by the modes
+# that need it, so `calculator-cli "2 + 2"` starts as fast as possible.
+
+# Characters that can follow the "-" of an expression, but not of an option.
+_EXPRESSION_STARTS = frozenset("0123456789.(")
+
+
+def build_parser():
+    """Create the argument parser for the full CLI."""
+    import argparse
+
+    from python.batch import FORMATS
+
+    parser = argparse.ArgumentParser(description="CLI Calculator")
+    parser.add_argument(
+        "expression", nargs="?", help="Mathematical expression to evaluate"
+    )
+    parser.add_argument(
+        "--interactive", "-i", action="store_true", help="Interactive mode"
+    )
+    parser.add_argument(
+        "--batch",
+        "-b",
+        action="store_true",
+        help="Evaluate one expression per line from stdin or --input",
+    )
+    parser.add_argument(
+        "--input", metavar="FILE", help="Read batch expressions from FILE"
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="plain",
+        help="Batch output format (default: plain)",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        metavar="N",
+        help="Evaluate batch expressions on N processes (0 = one per CPU)",
+    )
+    parser.add_argument(
+        "--column",
+        action="append",
+        metavar="NAME=PATH",
+        help="Bind variable NAME to a raw little-endian float64 (.f64) or "
+        "float32 (.f32) column file; append :float32 or :float64 to override",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        metavar="FILE",
+        help="Write column results to FILE (.f32 for float32, else float64) "
+        "instead of printing them",
+    )
+    parser.add_argument(
+        "--no-optimize",
+        action="store_true",
+        help="Disable constant folding and common-subexpression elimination",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=Calculator.DTYPES,
+        default="float64",
+        help="Working precision (default: float64)",
+    )
+    parser.add_argument(
+        "--dump",
+        action="store_true",
+        help="Print the compiled (optimized) form of the expression and exit",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print per-stage timings (count, total, percentiles) to stderr",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        help="Reuse results of earlier runs stored in DIR, and store new ones "
+        "(safe to share between concurrent runs)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        metavar="N",
+        help="Keep at most N results in --cache-dir (default: 1000000)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run a calculator daemon on a Unix socket",
+    )
+    parser.add_argument(
+        "--client",
+        action="store_true",
+        help="Forward to a running daemon, evaluating locally if none is up",
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Daemon socket path (default: $CALCULATOR_SOCKET or a temp file)",
+    )
+    return parser
+
 
 def main():
     """Main CLI function."""
+    if getattr(sys, "frozen", False):
+        # In a PyInstaller bundle, worker processes started by --jobs re-run
+        # this executable; freeze_support() makes them run the worker
+        # instead. It does nothing otherwise, so the import is skipped.
+        import multiprocessing
+
+        multiprocessing.freeze_support()
     try:
-        parser = argparse.ArgumentParser(description="CLI Calculator")
-        parser.add_argument(
-            "expression", nargs="?", help="Mathematical expression to evaluate"
-        )
-        parser.add_argument(
-            "--interactive", "-i", action="store_true", help="Interactive mode"
-        )
+        argv = sys.argv[1:]
+        # Fast path: a single expression needs no argument parser. One that
+        # starts with unary minus ("-3*2", "-(1+2)") is not an option either.
+        if len(argv) == 1 and (
+            not argv[0].startswith("-") or argv[0][1:2] in _EXPRESSION_STARTS
+        ):
+            sys.exit(evaluate_expression(Calculator(), argv[0]))
 
-        args = parser.parse_args()
-        calc = Calculator()
+        args = build_parser().parse_args(argv)
 
-        if args.interactive or not args.expression:
-            interactive_mode(calc)
-        else:
+        if args.serve:
+            from python.daemon import run_server
+
+            calc = Calculator(**calculator_options(args))
             try:
-                result = calc.calculate(args.expression)
-                print(f"{args.expression} = {result}")
-                sys.stdout.flush()
-            except Exception as e:
+                run_server(calc, args.socket)
+            except (OSError, RuntimeError) as e:
                 print(f"Error: {e}", file=sys.stderr)
-                sys.stderr.flush()
                 sys.exit(1)
+            if args.profile:
+                print_profile(calc)
+            return
+
+        status = run_mode(args)
+        if args.profile:
+            print_profile(args.calc)
+        sys.exit(status)
     except Exception as e:
         print(f"Fatal error: {e}", file=sys.stderr)
         import traceback
@@ -44,11 +161,182 @@ def main():
         sys.exit(1)
 
 
+def calculator_options(args) -> dict:
+    """Return the Calculator keyword arguments selected by ``args``."""
+    return dict(profile=args.profile, optimize=not args.no_optimize, dtype=args.dtype)
+
+
+def run_mode(args):
+    """Run the mode selected by ``args``; return the exit status.
+
+    The Calculator (or daemon client) used is stored as ``args.calc``.
+    """
+    options = calculator_options(args)
+    optimize = options["optimize"]
+    args.calc = None
+    if args.dump:
+        if not args.expression:
+            raise ValueError("--dump needs an expression")
+        print(Calculator.compile(args.expression, optimize, args.dtype).dump())
+        return 0
+
+    if args.column:
+        if not args.expression:
+            raise ValueError("--column needs an expression")
+        args.calc = Calculator(**options)
+        return column_mode(args.calc, args.expression, args.column, args.output)
+
+    calc = None
+    if args.client:
+        if args.cache_dir:
+            raise ValueError("--cache-dir cannot be used with --client")
+        from python.daemon import connect
+
+        calc = connect(args.socket)
+    calc = args.calc = calc or Calculator(**options)
+    if not args.cache_dir:
+        return evaluate_mode(calc, args)
+
+    from python.store import DEFAULT_MAX_ENTRIES, ResultStore, StoredCalculator
+    from python.store import namespace
+
+    with ResultStore(
+        args.cache_dir, namespace(calc), args.cache_size or DEFAULT_MAX_ENTRIES
+    ) as store:
+        return evaluate_mode(StoredCalculator(calc, store), args)
+
+
+def evaluate_mode(calc, args):
+    """Run the batch, interactive or single-expression mode with ``calc``."""
+    if args.batch or args.input:
+        return batch_mode(calc, args.input, args.format, args.jobs)
+    elif args.interactive or not args.expression:
+        interactive_mode(calc)
+        return 0
+    else:
+        return evaluate_expression(calc, args.expression)
+
+
+def print_profile(calc):
+    """Print the per-stage timing report of ``calc`` to stderr."""
+    profiler = getattr(calc, "profiler", None)
+    if profiler is None:
+        print("Profiling is not available for this calculator", file=sys.stderr)
+    else:
+        print(profiler.report(), file=sys.stderr)
+
+
+def _timed_output(calc, write, text):
+    # Write text, timing it as the "output" stage when profiling.
+    profiler = getattr(calc, "profiler", None)
+    if profiler is None:
+        write(text)
+        return
+    from time import perf_counter
+
+    start = perf_counter()
+    write(text)
+    profiler.record("output", perf_counter() - start)
+
+
+def evaluate_expression(calc, expression):
+    """Print the result of one expression; return the exit status."""
+    try:
+        result = calc.calculate(expression)
+        _timed_output(calc, sys.stdout.write, f"{expression} = {result}\n")
+        sys.stdout.flush()
+        return 0
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.stderr.flush()
+        return 1
+
+
+def batch_mode(calc, input_path, output_format, jobs=None):
+    """Evaluate expressions line by line; return 1 if any line failed.
+
+    When ``jobs`` is given the work is spread over that many processes and
+    the throughput is reported on stderr at the end.
+    """
+    import time
+
+    from python.batch import run_batch
+
+    workers = 1 if jobs is None else jobs or None
+    profiler = getattr(calc, "profiler", None)
+    start = time.perf_counter()
+    if input_path:
+        with open(input_path, "r", encoding="utf-8") as stream:
+            summary = run_batch(
+                calc, stream, sys.stdout, output_format, workers, profiler
+            )
+    else:
+        summary = run_batch(
+            calc, sys.stdin, sys.stdout, output_format, workers, profiler
+        )
+    sys.stdout.flush()
+    if jobs is not None:
+        elapsed = time.perf_counter() - start
+        rate = summary.count / elapsed if elapsed > 0 else 0.0
+        print(
+            f"{summary.count} expressions in {elapsed:.3f}s ({rate:,.0f}/s)",
+            file=sys.stderr,
+        )
+    if summary.errors:
+        print(f"{summary.errors} expression(s) failed", file=sys.stderr)
+    return 1 if summary.errors else 0
+
+
+def column_mode(calc, expression, specs, output_path=None):
+    """Evaluate an expression over memory-mapped column files.
+
+    ``specs`` are ``NAME=PATH[:dtype]`` strings. Results are written to
+    ``output_path`` through a memory map, or printed one per line.
+    """
+    from contextlib import ExitStack
+
+    from python.columns import Column, OutputColumn, evaluate_columns, parse_column_spec
+
+    try:
+        with ExitStack() as stack:
+            columns = {}
+            for spec in specs:
+                name, path, dtype = parse_column_spec(spec)
+                columns[name] = stack.enter_context(Column(path, dtype))
+            output = None
+            if output_path:
+                rows = len(next(iter(columns.values())))
+                output = stack.enter_context(OutputColumn(output_path, rows))
+            for result in evaluate_columns(calc, expression, columns, output):
+                if output is None:
+                    text = "".join(f"{value}\n" for value in result)
+                    _timed_output(calc, sys.stdout.write, text)
+    except (OSError, ValueError, ArithmeticError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    sys.stdout.flush()
+    return 0
+
+
+# Dependent cells listed after a definition; beyond this only a count is shown.
+MAX_SHOWN_UPDATES = 10
+
+
 def interactive_mode(calc):
-    """Run calculator in interactive mode."""
+    """Run calculator in interactive mode.
+
+    ``name = expression`` defines a cell other lines can refer to;
+    redefining it recomputes only the cells that depend on it.
+    ``del name`` removes a cell.
+    """
+    from python.cells import Sheet
+
+    # Cells need compiled expressions, which a daemon client does not expose.
+    sheet = Sheet(calc if isinstance(calc, Calculator) else Calculator())
+
     print("Calculator CLI - Interactive Mode")
     print("Enter mathematical expressions or 'quit' to exit")
-    print("Examples: 2 + 3, 10 * 5, 20 / 4")
+    print("Examples: 2 + 3, 10 * 5, 20 / 4, rate = 0.5, total = rate * 8")
     print("-" * 40)
 
     while True:
@@ -62,8 +350,16 @@ def interactive_mode(calc):
             if not expr:
                 continue
 
-            result = calc.calculate(expr)
-            print(f"= {result}")
+            target, sep, source = expr.partition("=")
+            target = target.strip()
+            if sep and target.isidentifier():
+                print_updates(sheet.define(target, source))
+            elif expr.startswith("del ") and expr[4:].strip().isidentifier():
+                print_updates(sheet.remove(expr[4:].strip()))
+            elif len(sheet):
+                print(f"= {sheet.evaluate(expr)}")
+            else:
+                print(f"= {calc.calculate(expr)}")
 
         except KeyboardInterrupt:
             print("\nGoodbye!")
@@ -75,5 +371,16 @@ def interactive_mode(calc):
             print(f"Error: {e}")
 
 
+def print_updates(updates):
+    """Print the cells recomputed by a definition, failed ones as errors."""
+    for cell, value in updates[:MAX_SHOWN_UPDATES]:
+        if isinstance(value, Exception):
+            print(f"{cell} = Error: {value}")
+        else:
+            print(f"{cell} = {value}")
+    if len(updates) > MAX_SHOWN_UPDATES:
+        print(f"({len(updates) - MAX_SHOWN_UPDATES} more cells updated)")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,190 @@
+"""Memory-mapped binary column files for the CLI column mode.
+
+A column file is a headerless sequence of little-endian float64 (``.f64``)
+or float32 (``.f32``) values. Inputs and the output are mapped with
+``mmap`` and evaluated in fixed-size chunks, so memory use stays flat no
+matter how large the files are.
+"""
+
+import mmap
+import os
+import sys
+from array import array
+
+DTYPES = {"float64": "d", "float32": "f"}
+_EXTENSIONS = {".f64": "float64", ".f32": "float32"}
+
+# Rows evaluated per call to Calculator.calculate_over.
+CHUNK_ROWS = 1 << 16
+
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def dtype_for(path: str, dtype: str = None) -> str:
+    """Return ``dtype`` or the dtype implied by the file extension."""
+    if dtype is None:
+        dtype = _EXTENSIONS.get(os.path.splitext(path)[1].lower(), "float64")
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown dtype {dtype!r}")
+    return dtype
+
+
+def parse_column_spec(spec: str):
+    """Split ``name=path[:dtype]`` into ``(name, path, dtype)``."""
+    name, sep, path = spec.partition("=")
+    if not sep or not name or not path:
+        raise ValueError(f"Invalid column {spec!r}, expected NAME=PATH")
+    dtype = None
+    head, sep, tail = path.rpartition(":")
+    if sep and tail in DTYPES:
+        path, dtype = head, tail
+    return name, path, dtype_for(path, dtype)
+
+
+def _discard(mapping, itemsize, start, stop):
+    """Let the OS drop the mapped pages of rows ``start:stop`` from memory.
+
+    The pages are file-backed, so they are re-read (or were already
+    written back) if touched again; this keeps resident memory flat.
+    """
+    if mapping is None or not hasattr(mmap, "MADV_DONTNEED"):
+        return
+    offset = start * itemsize // mmap.PAGESIZE * mmap.PAGESIZE
+    mapping.madvise(mmap.MADV_DONTNEED, offset, stop * itemsize - offset)
+
+
+def _close(view, mapping):
+    view.release()
+    if mapping is not None:
+        try:
+            mapping.close()
+        except BufferError:
+            # A chunk view is still referenced (e.g. by a traceback); the
+            # mapping is unmapped when that view is garbage collected.
+            pass
+
+
+class Column:
+    """A read-only memory-mapped column file."""
+
+    def __init__(self, path: str, dtype: str = None):
+        self.path = path
+        self.dtype = dtype_for(path, dtype)
+        code = DTYPES[self.dtype]
+        with open(path, "rb") as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if size % array(code).itemsize:
+                raise ValueError(f"{path}: size is not a multiple of {self.dtype}")
+            self._mmap = None
+            if size:
+                self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self._mmap if size else b"").cast(code)
+
+    def __len__(self):
+        return len(self.view)
+
+    def chunk(self, start: int, stop: int, dtype: str = "float64"):
+        """Return rows ``start:stop`` as a ``dtype`` buffer.
+
+        Files of that dtype on little-endian hosts are returned as a view
+        into the mapping; anything else is converted into a new array.
+        """
+        view = self.view[start:stop]
+        code = DTYPES[dtype]
+        if self.dtype == dtype and _NATIVE_LITTLE_ENDIAN:
+            return view
+        values = array(view.format)
+        values.frombytes(view.cast("B"))
+        if not _NATIVE_LITTLE_ENDIAN:
+            values.byteswap()
+        return values if values.typecode == code else array(code, values)
+
+    def discard(self, start: int, stop: int):
+        """Drop rows ``start:stop`` from memory once they have been used."""
+        _discard(self._mmap, self.view.itemsize, start, stop)
+
+    def close(self):
+        _close(self.view, self._mmap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class OutputColumn:
+    """A writable memory-mapped column file of a fixed number of rows."""
+
+    def __init__(self, path: str, rows: int, dtype: str = None):
+        self.path = path
+        self.dtype = dtype_for(path, dtype)
+        code = DTYPES[self.dtype]
+        with open(path, "w+b") as fh:
+            fh.truncate(rows * array(code).itemsize)
+            self._mmap = mmap.mmap(fh.fileno(), 0) if rows else None
+        self.view = memoryview(self._mmap if rows else bytearray()).cast(code)
+
+    def write(self, start: int, values):
+        """Store ``values`` at rows ``start:start + len(values)``."""
+        stop = start + len(values)
+        code = DTYPES[self.dtype]
+        if memoryview(values).format == code and _NATIVE_LITTLE_ENDIAN:
+            self.view[start:stop] = memoryview(values).cast("B").cast(code)
+            return
+        converted = array(code, values)
+        if not _NATIVE_LITTLE_ENDIAN:
+            converted.byteswap()
+        self.view[start:stop] = converted
+
+    def out_buffer(self, start: int, stop: int, dtype: str = "float64"):
+        """Return rows ``start:stop`` to write ``dtype`` results in place.
+
+        Returns None if the file is not of native ``dtype``.
+        """
+        if self.dtype == dtype and _NATIVE_LITTLE_ENDIAN:
+            return self.view[start:stop]
+        return None
+
+    def discard(self, start: int, stop: int):
+        """Drop written rows ``start:stop`` from memory."""
+        _discard(self._mmap, self.view.itemsize, start, stop)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.flush()
+        _close(self.view, self._mmap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def evaluate_columns(calc, expression, columns, output=None, chunk_rows=CHUNK_ROWS):
+    """Evaluate ``expression`` over ``columns``, a mapping of name to Column.
+
+    Yields the results of each chunk of ``chunk_rows`` rows, in the
+    calculator's dtype. When ``output`` (an OutputColumn) is given they are
+    also stored there, computed in place when the output file has that dtype.
+    """
+    dtype = getattr(calc, "dtype", "float64")
+    lengths = {len(column) for column in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("Column files must have the same number of rows")
+    rows = lengths.pop() if lengths else 0
+    for start in range(0, rows, chunk_rows):
+        stop = min(start + chunk_rows, rows)
+        chunk = {
+            name: column.chunk(start, stop, dtype) for name, column in columns.items()
+        }
+        out = output.out_buffer(start, stop, dtype) if output is not None else None
+        result = calc.calculate_over(expression, chunk, out)
+        if output is not None and out is None:
+            output.write(start, result)
+        yield result
+        for column in columns.values():
+            column.discard(start, stop)
+        if output is not None:
+            output.discard(start, stop)
@@ -0,0 +1,210 @@
+"""Calculator daemon on a Unix domain socket and its client.
+
+Protocol: the client sends one request per line and the server answers each
+line, in order, with one line. Requests may be pipelined. A request is
+either a plain expression, answered with ``ok <result>`` or
+``error <ExceptionType>: <message>``, or a JSON object
+``{"expression": ..., "id": ...}``, answered with a JSON object holding
+``id``, ``result`` and ``error``; non-finite results are the strings
+``"inf"``, ``"-inf"`` and ``"nan"``.
+"""
+
+import json
+import os
+import socket
+import tempfile
+
+from .batch import json_result
+
+_ERROR_TYPES = {"ZeroDivisionError": ZeroDivisionError, "ValueError": ValueError}
+
+
+def default_socket_path() -> str:
+    """Return $CALCULATOR_SOCKET or a per-user path in the temp directory."""
+    path = os.environ.get("CALCULATOR_SOCKET")
+    if path:
+        return path
+    user = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "")
+    return os.path.join(tempfile.gettempdir(), f"calculator-cli-{user}.sock")
+
+
+def handle_request(calc, line: str) -> str:
+    """Evaluate one request line and return the response line."""
+    if line.startswith("{"):
+        return _handle_json_request(calc, line)
+    try:
+        return f"ok {calc.calculate(line)!r}"
+    except Exception as e:  # a bad request must not end the connection
+        return f"error {type(e).__name__}: {e}"
+
+
+def _handle_json_request(calc, line: str) -> str:
+    request_id = result = error = None
+    try:
+        request = json.loads(line)
+        request_id = request.get("id")
+        result = calc.calculate(request["expression"])
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    reply = {"id": request_id, "result": json_result(result), "error": error}
+    return json.dumps(reply, allow_nan=False)
+
+
+async def _handle_connection(calc, reader, writer):
+    # Every complete line already received is answered with a single write,
+    # so pipelined requests cost one syscall per burst, not per line.
+    pending = b""
+    try:
+        while True:
+            chunk = await reader.read(65536)
+            if chunk:
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+            else:
+                lines = [pending] if pending.strip() else []
+            # Undecodable bytes become U+FFFD, which the tokenizer rejects.
+            replies = [
+                handle_request(calc, line.decode("utf-8", "replace").strip())
+                for line in lines
+            ]
+            if replies:
+                writer.write(("\n".join(replies) + "\n").encode("utf-8"))
+                await writer.drain()
+            if not chunk:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def remove_stale_socket(path: str):
+    """Remove the socket at ``path`` if no daemon is listening on it.
+
+    Raises RuntimeError if a daemon answers there, and OSError if ``path``
+    cannot be probed, so a running daemon is never replaced.
+    """
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:  # left behind by a daemon that died
+            os.unlink(path)
+            return
+    raise RuntimeError(f"A calculator daemon is already listening on {path}")
+
+
+async def serve(calc, path: str):
+    """Serve ``calc`` on the Unix socket at ``path`` until cancelled."""
+    import asyncio
+
+    remove_stale_socket(path)
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: _handle_connection(calc, reader, writer), path=path
+    )
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def run_server(calc, path: str = None):
+    """Run the daemon in the foreground; Ctrl+C or SIGTERM stops it."""
+    import asyncio
+    import signal
+
+    path = path or default_socket_path()
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("Unix domain sockets are not supported on this platform")
+    remove_stale_socket(path)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Calculator daemon listening on {path}", flush=True)
+    try:
+        asyncio.run(serve(calc, path))
+    except KeyboardInterrupt:
+        pass
+
+
+def _parse_reply(reply: str):
+    status, _, payload = reply.partition(" ")
+    if status == "ok":
+        return float(payload)
+    name, _, message = payload.partition(": ")
+    return _ERROR_TYPES.get(name, ValueError)(message)
+
+
+class DaemonClient:
+    """Forward expressions to a running daemon.
+
+    Exposes ``calculate`` and ``calculate_many`` like Calculator, so it can
+    be used wherever a Calculator is expected for evaluation.
+    """
+
+    def __init__(self, path: str = None, timeout: float = 5.0):
+        self.path = path or default_socket_path()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(self.path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile("rwb")
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def calculate(self, expression: str) -> float:
+        outcome = next(self.calculate_many([expression], return_exceptions=True))
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def calculate_many(
+        self, expressions, jobs=1, window: int = 512, return_exceptions=False
+    ):
+        """Pipeline expressions to the daemon, ``window`` requests at a time.
+
+        ``jobs`` is accepted for compatibility with Calculator and ignored.
+        """
+        batch = []
+        for expression in expressions:
+            batch.append(" ".join(expression.split()))
+            if len(batch) == window:
+                yield from self._round_trip(batch, return_exceptions)
+                batch = []
+        if batch:
+            yield from self._round_trip(batch, return_exceptions)
+
+    def _round_trip(self, expressions, return_exceptions):
+        payload = "".join(f"{expression}\n" for expression in expressions)
+        self._file.write(payload.encode("utf-8"))
+        self._file.flush()
+        for _ in expressions:
+            reply = self._file.readline()
+            if not reply:
+                raise ConnectionError("Calculator daemon closed the connection")
+            outcome = _parse_reply(reply.decode("utf-8").rstrip("\n"))
+            if isinstance(outcome, Exception) and not return_exceptions:
+                raise outcome
+            yield outcome
+
+
+def connect(path: str = None):
+    """Return a DaemonClient, or None if no daemon is listening on path."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    try:
+        return DaemonClient(path)
+    except OSError:
+        return None
@@ -0,0 +1,513 @@
+"""Tokenizer, parser and compiled form for calculator expressions."""
+
+from array import array
+from collections import namedtuple
+
+from ._backend import calculator_c
+
+# Binary operators and their precedence; all of them are left-associative.
+BINARY_PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+Token = namedtuple("Token", "kind value position")
+
+# Expression tree nodes. Being tuples, equal subtrees compare and hash equal.
+Number = namedtuple("Number", "value")
+Variable = namedtuple("Variable", "name")
+Negate = namedtuple("Negate", "operand")
+BinaryOp = namedtuple("BinaryOp", "op left right")
+
+
+def to_float32(value: float) -> float:
+    """Return ``value`` rounded to float32, as C's ``(float)`` conversion does."""
+    return array("f", (value,))[0]
+
+
+# The tokenizer is a hand-written scanner rather than a regular expression:
+# it is as fast and keeps `re` out of the CLI start-up path.
+_OPERATORS = frozenset("+-*/()")
+_NUMBER_CHARS = frozenset("0123456789.")
+_DIGITS = frozenset("0123456789")
+
+
+def tokenize(expression: str) -> list:
+    """Split an expression into number, name and operator tokens."""
+    tokens = []
+    position = 0
+    end = len(expression)
+    while position < end:
+        char = expression[position]
+        if char in _OPERATORS:
+            tokens.append(Token("op", char, position))
+            position += 1
+        elif char in _NUMBER_CHARS:
+            start = position
+            while position < end and expression[position] in _NUMBER_CHARS:
+                position += 1
+            if position < end and expression[position] in "eE":
+                exponent = position + 1
+                if exponent < end and expression[exponent] in "+-":
+                    exponent += 1
+                if exponent < end and expression[exponent] in _DIGITS:
+                    position = exponent
+                    while position < end and expression[position] in _DIGITS:
+                        position += 1
+            text = expression[start:position]
+            if text.count(".") > 1 or text == ".":
+                raise ValueError(f"Invalid number {text!r} at position {start}")
+            tokens.append(Token("number", text, start))
+        elif char.isalpha() or char == "_":
+            start = position
+            while position < end and (
+                expression[position].isalnum() or expression[position] == "_"
+            ):
+                position += 1
+            tokens.append(Token("name", expression[start:position], start))
+        elif char.isspace():
+            position += 1
+        else:
+            raise ValueError(f"Invalid character {char!r} at position {position}")
+    return tokens
+
+
+# Marks a unary minus on the operator stack of ``parse``.
+_NEGATE = "neg"
+
+
+def _reduce(operands, operator):
+    """Apply ``operator`` to the top of the operand stack."""
+    if operator == _NEGATE:
+        operands.append(Negate(operands.pop()))
+    else:
+        right = operands.pop()
+        operands.append(BinaryOp(operator, operands.pop(), right))
+
+
+def parse(expression: str) -> tuple:
+    """Parse an expression string into an expression tree.
+
+    Operators and parentheses are kept on explicit stacks rather than the
+    call stack, so deeply nested input cannot exhaust the recursion limit.
+    Unary minus binds tighter than any binary operator.
+    """
+    tokens = tokenize(expression)
+    if not tokens:
+        raise ValueError("Empty expression")
+    operands = []
+    operators = []  # binary operators, _NEGATE and "("
+    parentheses = []  # positions of the open parentheses
+    expect_operand = True
+    for token in tokens:
+        if expect_operand:
+            if token.kind == "number":
+                operands.append(Number(float(token.value)))
+                expect_operand = False
+            elif token.kind == "name":
+                operands.append(Variable(token.value))
+                expect_operand = False
+            elif token.value == "-":
+                operators.append(_NEGATE)
+            elif token.value == "(":
+                operators.append("(")
+                parentheses.append(token.position)
+            elif token.value != "+":
+                raise ValueError(
+                    f"Unexpected {token.value!r} at position {token.position}"
+                )
+            continue
+        precedence = BINARY_PRECEDENCE.get(token.value) if token.kind == "op" else None
+        if precedence is not None:
+            while (
+                operators
+                and operators[-1] != "("
+                and (
+                    operators[-1] == _NEGATE
+                    or BINARY_PRECEDENCE[operators[-1]] >= precedence
+                )
+            ):
+                _reduce(operands, operators.pop())
+            operators.append(token.value)
+            expect_operand = True
+        elif token.value == ")" and parentheses:
+            while operators[-1] != "(":
+                _reduce(operands, operators.pop())
+            operators.pop()
+            parentheses.pop()
+        elif parentheses:
+            raise ValueError(f"Unbalanced parenthesis at position {parentheses[-1]}")
+        else:
+            raise ValueError(f"Unexpected {token.value!r} at position {token.position}")
+    if expect_operand:
+        raise ValueError("Unexpected end of expression")
+    if parentheses:
+        raise ValueError(f"Unbalanced parenthesis at position {parentheses[-1]}")
+    while operators:
+        _reduce(operands, operators.pop())
+    return operands[0]
+
+
+# Instructions of the postfix program produced by ``to_postfix``.
+PUSH = "push"
+VARIABLE = "var"
+NEGATE = "neg"
+STORE = "store"
+RECALL = "recall"
+
+
+def to_postfix(node, share: bool = False) -> tuple:
+    """Flatten an expression tree into a postfix instruction sequence.
+
+    Each instruction is ``(PUSH, value)``, ``(VARIABLE, name)``,
+    ``(NEGATE, None)`` or ``(op, None)`` for a binary operator ``op``.
+    With ``share``, a subexpression occurring more than once is evaluated
+    once: its first occurrence is followed by ``(STORE, register)`` and the
+    others become ``(RECALL, register)``.
+    """
+    if share:
+        return _shared_postfix(node)
+    program = []
+    stack = [(node, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if isinstance(node, Number):
+            program.append((PUSH, node.value))
+        elif isinstance(node, Variable):
+            program.append((VARIABLE, node.name))
+        elif children_done:
+            program.append((node.op if isinstance(node, BinaryOp) else NEGATE, None))
+        elif isinstance(node, Negate):
+            stack.append((node, True))
+            stack.append((node.operand, False))
+        else:
+            stack.append((node, True))
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+    return tuple(program)
+
+
+def _value_numbers(root):
+    """Number the distinct subexpressions of a tree.
+
+    Returns the root's number and a list mapping each number to
+    ``(instruction, argument, child numbers)``. Keys are built from the
+    children's numbers, so no subtree is hashed or compared recursively.
+    """
+    numbers = {}
+    nodes = []
+    results = []
+    stack = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if isinstance(node, Number):
+            entry = (PUSH, node.value, ())
+            key = (PUSH, node.value.hex())  # tells -0.0 from 0.0
+        elif isinstance(node, Variable):
+            entry = key = (VARIABLE, node.name, ())
+        elif not children_done:
+            stack.append((node, True))
+            if isinstance(node, Negate):
+                stack.append((node.operand, False))
+            else:
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+            continue
+        elif isinstance(node, Negate):
+            entry = key = (NEGATE, None, (results.pop(),))
+        else:
+            right = results.pop()
+            entry = key = (node.op, None, (results.pop(), right))
+        number = numbers.get(key)
+        if number is None:
+            number = numbers[key] = len(nodes)
+            nodes.append(entry)
+        results.append(number)
+    return results[0], nodes
+
+
+def _shared_postfix(root) -> tuple:
+    root, nodes = _value_numbers(root)
+    uses = [0] * len(nodes)
+    for _, _, children in nodes:
+        for child in children:
+            uses[child] += 1
+    registers = {}
+    program = []
+    stack = [(root, False)]
+    while stack:
+        number, children_done = stack.pop()
+        instruction, argument, children = nodes[number]
+        if number in registers:
+            program.append((RECALL, registers[number]))
+        elif not children:
+            program.append((instruction, argument))
+        elif not children_done:
+            stack.append((number, True))
+            stack.extend((child, False) for child in reversed(children))
+        else:
+            program.append((instruction, argument))
+            if uses[number] > 1:
+                registers[number] = len(registers)
+                program.append((STORE, registers[number]))
+    return tuple(program)
+
+
+class CompiledExpression:
+    """An expression parsed once and ready to be evaluated many times.
+
+    ``variables`` lists the names the expression refers to, in order of
+    first use; an expression without variables is a constant. With
+    ``share``, repeated subexpressions are evaluated once (see to_postfix).
+    ``dtype`` ("float64" or "float32") is the precision of the native runs.
+    """
+
+    def __init__(
+        self, source: str, tree: tuple, share: bool = False, dtype: str = "float64"
+    ):
+        self.source = source
+        self.tree = tree
+        self.dtype = dtype
+        self.program = to_postfix(tree, share)
+        self.variables = tuple(
+            dict.fromkeys(name for op, name in self.program if op == VARIABLE)
+        )
+        self._bytecode = None
+        self._function = None
+
+    def __repr__(self):
+        return f"CompiledExpression({self.source!r})"
+
+    def _bind(self, variables) -> list:
+        """Return the values of ``variables`` in the order of ``self.variables``."""
+        try:
+            return [variables[name] for name in self.variables]
+        except (KeyError, TypeError):
+            for name in self.variables:
+                if variables is None or name not in variables:
+                    raise ValueError(f"Unbound variable {name!r}") from None
+            raise
+
+    def evaluate(self, calculator=None, variables=None) -> float:
+        """Evaluate the expression with the arithmetic of ``calculator``.
+
+        The default is a Calculator of the expression's dtype.
+        """
+        if calculator is None:
+            from . import Calculator as calculator
+
+            if self.dtype != "float64":
+                calculator = calculator(cache_size=0, dtype=self.dtype)
+        operations = {
+            "+": calculator.add,
+            "-": calculator.subtract,
+            "*": calculator.multiply,
+            "/": calculator.divide,
+        }
+        values = self._bind(variables)
+        float32 = self.dtype == "float32"
+        if float32:  # constants and variables are rounded like the native VM's
+            values = map(to_float32, values)
+        values = dict(zip(self.variables, values))
+        registers = {}
+        stack = []
+        for op, value in self.program:
+            if op == PUSH:
+                stack.append(to_float32(value) if float32 else value)
+            elif op == VARIABLE:
+                stack.append(values[value])
+            elif op == NEGATE:
+                stack.append(-stack.pop())
+            elif op == STORE:
+                registers[value] = stack[-1]
+            elif op == RECALL:
+                stack.append(registers[value])
+            else:
+                right = stack.pop()
+                stack.append(operations[op](stack.pop(), right))
+        return float(stack[0])
+
+    @property
+    def bytecode(self):
+        """The program compiled for the native VM in ``calculator_c``."""
+        if self._bytecode is None:
+            index = {name: i for i, name in enumerate(self.variables)}
+            self._bytecode = calculator_c.compile(
+                [
+                    (op, index[value]) if op == VARIABLE else (op, value)
+                    for op, value in self.program
+                ]
+            )
+        return self._bytecode
+
+    def run(self, variables=None) -> float:
+        """Evaluate the whole expression in a single native call."""
+        run = calculator_c.run_double if self.dtype == "float64" else calculator_c.run
+        if not self.variables:
+            return run(self.bytecode)
+        return run(self.bytecode, self._bind(variables))
+
+    @property
+    def python_source(self) -> str:
+        """Source of the Python function generated for the expression."""
+        return generate_python(self.program, self.variables, self.dtype)[0]
+
+    @property
+    def function(self):
+        """The expression compiled to a Python function, built on first use.
+
+        It takes the values of ``variables`` as positional arguments (see
+        ``generate_python``) and is kept with the expression, so it is
+        generated once per cached expression.
+        """
+        if self._function is None:
+            source, namespace = generate_python(
+                self.program, self.variables, self.dtype
+            )
+            exec(compile(source, f"<expression {self.source!r}>", "exec"), namespace)
+            self._function = namespace["evaluate"]
+        return self._function
+
+    def call(self, variables=None) -> float:
+        """Evaluate the expression with its generated Python function."""
+        if not self.variables:
+            return self.function()
+        return self.function(*self._bind(variables))
+
+    def run_columns(self, columns, out=None):
+        """Evaluate once per row of ``columns``, a mapping of name to array.
+
+        The columns used must have the same length; a constant expression
+        takes its length from the first column. Rows are evaluated in
+        blocks by ``calculator_c.run_columns``, or ``run_columns_float`` for
+        float32, which takes and returns float32 arrays. Returns ``out``, or
+        a new ``array('d')`` (``array('f')``) if it is None.
+        """
+        if not columns:
+            raise ValueError("at least one column is required")
+        values = self._bind(columns) or [next(iter(columns.values()))]
+        if self.dtype == "float32":
+            return calculator_c.run_columns_float(self.bytecode, values, out)
+        return calculator_c.run_columns(self.bytecode, values, out)
+
+    def dump(self) -> str:
+        """Return a readable listing of the compiled form, for debugging."""
+        lines = [
+            f"source:    {self.source}",
+            f"evaluates: {format_program(self.program)}",
+            "program:",
+        ]
+        for position, (op, value) in enumerate(self.program):
+            argument = "" if value is None else f" {value}"
+            lines.append(f"  {position:4d}  {op}{argument}")
+        return "\n".join(lines)
+
+
+# calculator_c functions called by generated float32 code, which round each
+# result to single precision.
+_FLOAT32_FUNCTIONS = {"+": "add", "-": "subtract", "*": "multiply", "/": "divide"}
+
+
+def generate_python(program, variables, dtype: str = "float64") -> tuple:
+    """Translate a postfix program into the source of a Python function.
+
+    Returns ``(source, namespace)``: executing ``source`` in ``namespace``
+    defines ``evaluate(v0, v1, ...)``, taking the values of ``variables`` in
+    order. Each instruction becomes a line of straight-line code and
+    registers become local names. float64 arithmetic is inlined, which
+    matches the double arithmetic of ``calculator_c`` exactly; float32 code
+    rounds constants and variables to float32 and calls the ``calculator_c``
+    float32 functions. As in
+    ``Calculator.divide``, a zero divisor raises ZeroDivisionError.
+    """
+    parameters = {name: f"v{i}" for i, name in enumerate(variables)}
+    lines = [f"def evaluate({', '.join(parameters.values())}):"]
+    # Variables may be ints, which the C functions would convert to doubles;
+    # float32 constants and variables are rounded like the native VM's.
+    narrow = to_float32 if dtype == "float32" else float
+    namespace = {"to_float32": to_float32} if dtype == "float32" else {}
+    lines += [f"    {name} = {narrow.__name__}({name})" for name in parameters.values()]
+    constants = {}  # operand text -> value, for operands that are literals
+    registers = {}
+    stack = []
+    temporaries = 0
+    for op, value in program:
+        if op == PUSH:
+            value = narrow(value)
+            if value - value == 0:  # finite, so repr() is a float literal
+                stack.append(repr(value))
+            else:
+                stack.append(f"k{len(namespace)}")
+                namespace[stack[-1]] = value
+            constants[stack[-1]] = value
+        elif op == VARIABLE:
+            stack.append(parameters[value])
+        elif op == STORE:
+            registers[value] = stack[-1]
+        elif op == RECALL:
+            stack.append(registers[value])
+        else:
+            target = f"t{temporaries}"
+            temporaries += 1
+            if op == NEGATE:
+                lines.append(f"    {target} = -{stack.pop()}")
+            else:
+                right = stack.pop()
+                left = stack.pop()
+                if op == "/" and constants.get(right, 0.0) == 0.0:
+                    lines.append(f"    if {right} == 0.0:")
+                    lines.append('        raise ZeroDivisionError("Division by zero")')
+                if dtype == "float32":
+                    function = _FLOAT32_FUNCTIONS[op]
+                    namespace[function] = getattr(calculator_c, function)
+                    lines.append(f"    {target} = {function}({left}, {right})")
+                else:
+                    lines.append(f"    {target} = {left} {op} {right}")
+            stack.append(target)
+    lines.append(f"    return {stack[0]}")
+    return "\n".join(lines) + "\n", namespace
+
+
+def format_program(program) -> str:
+    """Return the infix form of a postfix program, with minimal parentheses."""
+    # Stack of (text, precedence); operands of unary minus and atoms bind
+    # tightest.
+    atom = max(BINARY_PRECEDENCE.values()) + 1
+    registers = {}
+    stack = []
+    for op, value in program:
+        if op == PUSH:
+            stack.append((repr(value), atom))
+        elif op == VARIABLE:
+            stack.append((value, atom))
+        elif op == STORE:
+            registers[value] = stack[-1]
+        elif op == RECALL:
+            stack.append(registers[value])
+        elif op == NEGATE:
+            text, precedence = stack.pop()
+            stack.append((f"-({text})" if precedence < atom else f"-{text}", atom))
+        else:
+            precedence = BINARY_PRECEDENCE[op]
+            right, right_precedence = stack.pop()
+            left, left_precedence = stack.pop()
+            if left_precedence < precedence:
+                left = f"({left})"
+            if right_precedence <= precedence:
+                right = f"({right})"
+            stack.append((f"{left} {op} {right}", precedence))
+    return stack[0][0]
+
+
+def compile_expression(
+    expression: str, optimize: bool = True, dtype: str = "float64"
+) -> CompiledExpression:
+    """Parse ``expression`` into a reusable CompiledExpression.
+
+    With ``optimize`` the tree is simplified by ``optimizer.optimize`` and
+    repeated subexpressions are evaluated once. Constants are folded in
+    ``dtype`` arithmetic.
+    """
+    tree = parse(expression)
+    if optimize:
+        from .optimizer import optimize as optimize_tree
+
+        tree = optimize_tree(tree, dtype)
+    return CompiledExpression(expression, tree, share=optimize, dtype=dtype)
@@ -0,0 +1,131 @@
+"""Optimization pass over expression trees.
+
+``optimize`` rewrites a parsed tree bottom-up:
+
+- Constant subtrees are evaluated at compile time with the same
+  ``calculator_c`` arithmetic used at run time (float64 or float32), so
+  folding never changes a result. A constant division by zero is left in
+  place to fail at run time.
+- Algebraic identities are applied only where they are exact in IEEE 754
+  arithmetic: ``x * 1``, ``x / 1``, ``x - 0``, ``x + -0``, ``x * -1``,
+  ``--x``, ``x + -y`` and ``x - -y``. ``x + 0`` is kept because
+  ``-0 + 0`` is ``+0``, and ``x * 0`` because ``x`` may be infinite or NaN.
+  For float32 the identities that drop an operation are not applied, as
+  that would also drop the rounding to float32 of its result.
+
+Common subexpressions are shared later, when the tree is flattened into a
+program (see ``expression.to_postfix``).
+"""
+
+import math
+
+from ._backend import calculator_c
+from .expression import BinaryOp, Negate, Number
+
+# calculator_c functions folding each operator, per dtype.
+_FOLD = {
+    "float64": {
+        "+": "add_double",
+        "-": "subtract_double",
+        "*": "multiply_double",
+        "/": "divide_double",
+    },
+    "float32": {
+        "+": "add",
+        "-": "subtract",
+        "*": "multiply",
+        "/": "divide",
+    },
+}
+
+
+def _is_constant(node, value: float) -> bool:
+    """Return True if node is the number ``value``, with the same sign."""
+    return (
+        isinstance(node, Number)
+        and node.value == value
+        and math.copysign(1.0, node.value) == math.copysign(1.0, value)
+    )
+
+
+def _negate(operand):
+    if isinstance(operand, Number):
+        return Number(-operand.value)
+    if isinstance(operand, Negate):
+        return operand.operand
+    return Negate(operand)
+
+
+def _drop_identity(op, left, right):
+    """Return the operation without its identity operand, or None."""
+    if op == "*":
+        if _is_constant(right, 1.0):
+            return left
+        if _is_constant(left, 1.0):
+            return right
+        if _is_constant(right, -1.0):
+            return _negate(left)
+        if _is_constant(left, -1.0):
+            return _negate(right)
+    elif op == "/":
+        if _is_constant(right, 1.0):
+            return left
+        if _is_constant(right, -1.0):
+            return _negate(left)
+    elif op == "+":
+        if _is_constant(right, -0.0):
+            return left
+        if _is_constant(left, -0.0):
+            return right
+    elif op == "-":
+        if _is_constant(right, 0.0):
+            return left
+    return None
+
+
+def _simplify_binary(op, left, right, fold, identities):
+    if isinstance(left, Number) and isinstance(right, Number):
+        try:
+            return Number(getattr(calculator_c, fold[op])(left.value, right.value))
+        except ZeroDivisionError:
+            pass  # left in place to fail at run time
+    if identities:
+        simplified = _drop_identity(op, left, right)
+        if simplified is not None:
+            return simplified
+    if op == "+":
+        if isinstance(right, Negate):
+            return BinaryOp("-", left, right.operand)
+        if isinstance(left, Negate):
+            return BinaryOp("-", right, left.operand)
+    elif op == "-":
+        if isinstance(right, Negate):
+            return BinaryOp("+", left, right.operand)
+    return BinaryOp(op, left, right)
+
+
+def optimize(tree, dtype: str = "float64"):
+    """Return an equivalent, simplified expression tree for ``dtype``."""
+    fold = _FOLD[dtype]
+    identities = dtype == "float64"
+    # Iterative post-order walk: long operator chains make deep trees.
+    results = []
+    stack = [(tree, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not isinstance(node, (BinaryOp, Negate)):
+            results.append(node)
+        elif not children_done:
+            stack.append((node, True))
+            if isinstance(node, Negate):
+                stack.append((node.operand, False))
+            else:
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+        elif isinstance(node, Negate):
+            results.append(_negate(results.pop()))
+        else:
+            right = results.pop()
+            left = results.pop()
+            results.append(_simplify_binary(node.op, left, right, fold, identities))
+    return results[0]
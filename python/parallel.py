@@ -0,0 +1,123 @@
+"""Ordered, bounded-memory evaluation of expression streams on many cores.
+
+Also splits large array operations across threads, for the native kernels
+that release the GIL.
+"""
+
+import itertools
+import os
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Rows per task of map_chunks, unless the caller chooses.
+CHUNK_ROWS = 1 << 16
+
+_BYTE_FORMATS = ("B", "b", "c")
+
+# Calculator owned by the current worker process, created once by
+# _init_worker so calculator_c is loaded once per worker, not per task.
+_worker_calculator = None
+
+
+def _init_worker(cache_size, engine, dtype, optimize):
+    global _worker_calculator
+    from . import Calculator
+
+    _worker_calculator = Calculator(
+        cache_size=cache_size, engine=engine, dtype=dtype, optimize=optimize
+    )
+
+
+def evaluate_chunk(calc, expressions) -> list:
+    """Return ``(result, exception)`` pairs for a list of expressions."""
+    outcomes = []
+    for expression in expressions:
+        try:
+            outcomes.append((calc.calculate(expression), None))
+        except Exception as e:  # one bad expression must not end the stream
+            outcomes.append((None, e))
+    return outcomes
+
+
+def _evaluate_in_worker(expressions):
+    return evaluate_chunk(_worker_calculator, expressions)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap_outcomes(calc, expressions, jobs=None, chunk_size=1024):
+    """Yield ``(result, exception)`` per expression, in input order.
+
+    Expressions are sent to a pool of ``jobs`` worker processes in chunks
+    of ``chunk_size``. At most two chunks per worker are in flight, so the
+    input is only consumed as fast as results are taken.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1:
+        for chunk in _chunks(expressions, chunk_size):
+            yield from evaluate_chunk(calc, chunk)
+        return
+
+    max_pending = 2 * jobs
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(calc.cache_info().maxsize, calc.engine, calc.dtype, calc.optimize),
+    ) as pool:
+        pending = deque()
+        for chunk in _chunks(expressions, chunk_size):
+            pending.append(pool.submit(_evaluate_in_worker, chunk))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def as_chunkable(values, code="d"):
+    """Return a 1-D memoryview over ``values`` that slices without copying.
+
+    Objects that are not buffers are converted to ``array(code)``; bytes
+    are reinterpreted as ``code`` elements.
+    """
+    try:
+        view = memoryview(values)
+    except TypeError:
+        return memoryview(array(code, values))
+    if view.c_contiguous and (view.ndim != 1 or view.format in _BYTE_FORMATS):
+        view = view.cast("B").cast(
+            code if view.format in _BYTE_FORMATS else view.format
+        )
+    return view
+
+
+def map_chunks(operation, views, out, workers=None, chunk_rows=CHUNK_ROWS):
+    """Run ``operation(*chunks, out=out_chunk)`` over row ranges on threads.
+
+    ``views`` and ``out`` are equal-length 1-D memoryviews; each task gets
+    the same ``chunk_rows`` slice of every view. Only worthwhile when
+    ``operation`` releases the GIL. Exceptions from any chunk are raised.
+    """
+    rows = len(out)
+    if any(len(view) != rows for view in views):
+        raise ValueError("operands must have the same length")
+    starts = range(0, rows, chunk_rows)
+    workers = min(workers or os.cpu_count() or 1, len(starts))
+    if workers <= 1:
+        operation(*views, out=out)
+        return
+
+    def run(start):
+        stop = start + chunk_rows
+        operation(*(view[start:stop] for view in views), out=out[start:stop])
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(run, start) for start in starts]:
+            future.result()
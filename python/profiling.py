@@ -0,0 +1,147 @@
+"""Opt-in per-stage timing for Calculator and the CLI.
+
+Nothing here runs unless profiling is enabled with
+``Calculator(profile=True)`` or ``calculator-cli --profile``.
+"""
+
+import threading
+from array import array
+from collections import namedtuple
+from time import perf_counter
+
+# Stages in the order they are reported; other names are reported after.
+STAGES = ("store", "cache", "parse", "dispatch", "native", "output")
+
+# Per-call durations are kept for percentiles, up to this many per stage;
+# beyond that a uniform random sample is kept. Counts and totals are exact.
+MAX_SAMPLES = 100_000
+
+# Times are in seconds.
+StageStats = namedtuple("StageStats", "calls total mean p50 p90 p99 max")
+
+
+class _Stage:
+    __slots__ = ("calls", "total", "maximum", "samples")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.samples = array("d")
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Profiler:
+    """Call counts and durations per stage. Safe to share between threads."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        """Add one call of ``seconds`` to ``stage``."""
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = _Stage()
+            entry.calls += 1
+            entry.total += seconds
+            if seconds > entry.maximum:
+                entry.maximum = seconds
+            if len(entry.samples) < MAX_SAMPLES:
+                entry.samples.append(seconds)
+            else:
+                import random
+
+                slot = random.randrange(entry.calls)
+                if slot < MAX_SAMPLES:
+                    entry.samples[slot] = seconds
+
+    def stats(self) -> dict:
+        """Return a StageStats per recorded stage, in pipeline order."""
+        with self._lock:
+            names = [name for name in STAGES if name in self._stages]
+            names += sorted(set(self._stages) - set(STAGES))
+            result = {}
+            for name in names:
+                entry = self._stages[name]
+                ordered = sorted(entry.samples)
+                result[name] = StageStats(
+                    entry.calls,
+                    entry.total,
+                    entry.total / entry.calls,
+                    _percentile(ordered, 0.50),
+                    _percentile(ordered, 0.90),
+                    _percentile(ordered, 0.99),
+                    entry.maximum,
+                )
+            return result
+
+    def histogram(self, stage: str, bounds) -> list:
+        """Count the durations of ``stage`` per bucket of ``bounds`` (seconds).
+
+        Returns ``len(bounds) + 1`` counts: durations up to ``bounds[0]``,
+        up to each following bound, and above the last one. Counts come from
+        the kept samples, so they add up to at most MAX_SAMPLES.
+        """
+        import bisect
+
+        counts = [0] * (len(bounds) + 1)
+        with self._lock:
+            entry = self._stages.get(stage)
+            for seconds in entry.samples if entry is not None else ():
+                counts[bisect.bisect_left(bounds, seconds)] += 1
+        return counts
+
+    def clear(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._stages.clear()
+
+    def report(self) -> str:
+        """Return the stats as a table: totals in ms, per-call times in us."""
+        lines = [
+            f"{'stage':10s} {'calls':>10s} {'total ms':>10s} {'mean us':>9s}"
+            f" {'p50 us':>9s} {'p90 us':>9s} {'p99 us':>9s} {'max us':>9s}"
+        ]
+        for name, stage in self.stats().items():
+            per_call = (stage.mean, stage.p50, stage.p90, stage.p99, stage.max)
+            lines.append(
+                f"{name:10s} {stage.calls:10d} {stage.total * 1e3:10.3f}"
+                + "".join(f" {value * 1e6:9.2f}" for value in per_call)
+            )
+        return "\n".join(lines)
+
+
+class NativeTimer:
+    """Stand-in for a Calculator that times each scalar backend call.
+
+    Used with CompiledExpression.evaluate so the ``"python"`` engine's time
+    can be split between interpreting the program and calling calculator_c.
+    """
+
+    def __init__(self, calculator):
+        self._calculator = calculator
+        self.elapsed = 0.0
+
+    def _timed(self, operation, a, b):
+        start = perf_counter()
+        try:
+            return operation(a, b)
+        finally:
+            self.elapsed += perf_counter() - start
+
+    def add(self, a, b):
+        return self._timed(self._calculator.add, a, b)
+
+    def subtract(self, a, b):
+        return self._timed(self._calculator.subtract, a, b)
+
+    def multiply(self, a, b):
+        return self._timed(self._calculator.multiply, a, b)
+
+    def divide(self, a, b):
+        return self._timed(self._calculator.divide, a, b)
@@ -0,0 +1,275 @@
+"""Persistent result cache shared by CLI runs and concurrent processes.
+
+``ResultStore`` keeps the results of constant expressions in an SQLite file;
+``StoredCalculator`` consults it before evaluating. Entries are keyed by a
+namespace naming everything that can change a result (see ``namespace``),
+so entries written by another calculator_c build or precision are never
+served; they are evicted like any other unused entry.
+"""
+
+import hashlib
+import os
+import struct
+from time import perf_counter, time
+
+from ._backend import calculator_c
+from .cache import CacheInfo
+
+# Bumped when the table layout or the way results are stored changes.
+FORMAT_VERSION = 1
+
+FILENAME = "results.sqlite3"
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+# When the store exceeds max_entries it is trimmed to this fraction of it,
+# so a full store does not evict on every write.
+_EVICT_TO = 0.9
+
+# Expressions per SQL statement, below SQLite's limit on bound parameters.
+_QUERY_ROWS = 500
+
+# Lookup groups span this many chunks per worker of calculate_many.
+_CHUNKS_PER_GROUP = 4
+
+# Results are stored as raw doubles: a REAL column would turn -0.0 into 0
+# and NaN into NULL.
+_DOUBLE = struct.Struct("<d")
+
+
+def backend_fingerprint() -> str:
+    """Identify the loaded calculator_c build by its backend and files."""
+    directory = os.path.dirname(os.path.abspath(calculator_c.__file__))
+    stamps = sorted(
+        (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in os.scandir(directory)
+        if entry.is_file()
+    )
+    digest = hashlib.sha1(repr(stamps).encode()).hexdigest()[:16]
+    return f"{calculator_c.BACKEND}-{digest}"
+
+
+def namespace(calc) -> str:
+    """Return the namespace of the results computed by Calculator ``calc``."""
+    optimized = "optimized" if calc.optimize else "unoptimized"
+    return f"v{FORMAT_VERSION}:{backend_fingerprint()}:{calc.dtype}:{optimized}"
+
+
+def _groups(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class ResultStore:
+    """Expression results in an SQLite file in ``directory``.
+
+    Beyond ``max_entries`` (over all namespaces) the least recently used
+    entries are evicted. The database runs in WAL mode, so processes can
+    read while another writes; writers wait up to ``timeout`` seconds for
+    each other. Lookups and writes that fail are treated as misses and
+    skipped: the store never makes an evaluation fail.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        namespace: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        timeout: float = 30.0,
+    ):
+        import sqlite3
+
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, FILENAME)
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._errors = sqlite3.Error
+        self._connection = sqlite3.connect(
+            self.path, timeout=timeout, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # A lost write after a power failure only costs a recomputation.
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " namespace TEXT NOT NULL, expression TEXT NOT NULL,"
+            " result BLOB NOT NULL, used INTEGER NOT NULL,"
+            " PRIMARY KEY (namespace, expression))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_used ON results (used)"
+        )
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._unchecked = 0  # entries written since the last eviction check
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Evict down to ``max_entries`` if needed and close the database."""
+        if self._connection is None:
+            return
+        if self._unchecked:
+            try:
+                self._evict()
+            except self._errors:
+                pass
+        self._connection.close()
+        self._connection = None
+
+    def get_many(self, expressions) -> dict:
+        """Return ``{expression: result}`` for the stored ``expressions``."""
+        expressions = list(expressions)
+        found = {}
+        try:
+            for group in _groups(expressions, _QUERY_ROWS):
+                rows = self._connection.execute(
+                    "SELECT expression, result FROM results WHERE namespace = ?"
+                    f" AND expression IN ({', '.join('?' * len(group))})",
+                    [self.namespace, *group],
+                )
+                for expression, result in rows:
+                    found[expression] = _DOUBLE.unpack(result)[0]
+        except self._errors:
+            found = {}
+        hits = sum(expression in found for expression in expressions)
+        self._hits += hits
+        self._misses += len(expressions) - hits
+        return found
+
+    def put_many(self, results, used=()):
+        """Store ``{expression: result}`` and mark ``used`` expressions as used.
+
+        Both happen in one transaction, which evicts the least recently
+        used entries once enough new ones were written.
+        """
+        now = int(time())
+        try:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                    [
+                        (self.namespace, expression, _DOUBLE.pack(result), now)
+                        for expression, result in results.items()
+                    ],
+                )
+                for group in _groups(list(used), _QUERY_ROWS):
+                    self._connection.execute(
+                        "UPDATE results SET used = ? WHERE namespace = ?"
+                        f" AND expression IN ({', '.join('?' * len(group))})",
+                        [now, self.namespace, *group],
+                    )
+                self._unchecked += len(results)
+                if self._unchecked > self.max_entries * (1 - _EVICT_TO):
+                    self._evict()
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        except self._errors:
+            pass
+
+    def _evict(self):
+        # Called inside a write transaction, or on close.
+        self._unchecked = 0
+        count = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * _EVICT_TO)
+        self._connection.execute(
+            "DELETE FROM results WHERE rowid IN"
+            " (SELECT rowid FROM results ORDER BY used LIMIT ?)",
+            (excess,),
+        )
+        self._evictions += excess
+
+    def info(self) -> CacheInfo:
+        """Return hit/miss/eviction counters and the number of stored entries."""
+        count = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return CacheInfo(
+            self._hits, self._misses, self._evictions, self.max_entries, count
+        )
+
+
+class StoredCalculator:
+    """A Calculator whose constant-expression results go through a ResultStore.
+
+    Expressions with variables are passed straight to ``calc``, and so are
+    other attributes (``profiler``, ``cache_info``, ...). Only successful
+    results are stored. With a profiling ``calc``, store lookups and writes
+    are timed as the ``"store"`` stage.
+    """
+
+    def __init__(self, calc, store: ResultStore):
+        self.calc = calc
+        self.store = store
+
+    def __getattr__(self, name):
+        return getattr(self.calc, name)
+
+    def calculate(self, expression: str, variables=None) -> float:
+        """Return the stored result of ``expression``, or evaluate and store it."""
+        if variables:
+            return self.calc.calculate(expression, variables)
+        return next(self.calculate_many([expression]))
+
+    def calculate_many(
+        self,
+        expressions,
+        jobs: int = 1,
+        chunk_size: int = 1024,
+        return_exceptions=False,
+    ):
+        """Yield the result of each expression, in input order.
+
+        As ``Calculator.calculate_many``, but expressions are looked up in
+        the store in groups; only the misses of a group are evaluated, on
+        ``jobs`` processes if they fill more than one chunk.
+        """
+        profiler = getattr(self.calc, "profiler", None)
+        workers = jobs or os.cpu_count() or 1
+        iterator = iter(expressions)
+        while True:
+            group = [
+                expression
+                for _, expression in zip(
+                    range(chunk_size * workers * _CHUNKS_PER_GROUP), iterator
+                )
+            ]
+            if not group:
+                return
+            keys = [" ".join(expression.split()) for expression in group]
+            start = perf_counter()
+            found = self.store.get_many(keys)
+            if profiler is not None:
+                profiler.record("store", perf_counter() - start)
+            misses = [index for index, key in enumerate(keys) if key not in found]
+            outcomes = self.calc.calculate_many(
+                [group[index] for index in misses],
+                jobs=jobs if len(misses) > chunk_size else 1,
+                chunk_size=chunk_size,
+                return_exceptions=True,
+            )
+            results = dict(found)
+            new = {}
+            for index, outcome in zip(misses, outcomes):
+                results[keys[index]] = outcome
+                if not isinstance(outcome, Exception):
+                    new[keys[index]] = outcome
+            start = perf_counter()
+            self.store.put_many(new, used=found)
+            if profiler is not None:
+                profiler.record("store", perf_counter() - start)
+            for key in keys:
+                outcome = results[key]
+                if isinstance(outcome, Exception) and not return_exceptions:
+                    raise outcome
+                yield outcome
@@ -129,6 +129,7 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/yusufafify/Calculator-CLI",
     packages=find_packages(),
+    package_data={"python": ["calculator_c.path"]},
     # We're not using ext_modules as we build the C extension with Makefile
     # ext_modules=[calculator_c],
     install_requires=requirements,
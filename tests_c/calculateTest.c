@@ -1,5 +1,8 @@
 #include <math.h>
+#include <stdint.h>
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
 
 #include "../c_src/calculate_c.h"
 #include "Unity/unity.h"
@@ -31,11 +34,357 @@ void test_divide(void) {
   TEST_ASSERT_TRUE(isnan(divide(5.0, 0.0)));
 }
 
+void test_double_scalars(void) {
+  TEST_ASSERT_TRUE(add_double(0.1, 0.2) == 0.1 + 0.2);
+  TEST_ASSERT_TRUE(subtract_double(0.3, 0.1) == 0.3 - 0.1);
+  TEST_ASSERT_TRUE(multiply_double(0.1, 3.0) == 0.1 * 3.0);
+  TEST_ASSERT_TRUE(divide_double(1.0, 3.0) == 1.0 / 3.0);
+  TEST_ASSERT_TRUE(isnan(divide_double(5.0, 0.0)));
+}
+
+void test_add_array(void) {
+  const double a[] = {1.0, -2.0, 0.5};
+  const double b[] = {2.0, 1.0, 0.25};
+  double out[3];
+  add_array(a, b, out, 3);
+  TEST_ASSERT_EQUAL_FLOAT(3.0, out[0]);
+  TEST_ASSERT_EQUAL_FLOAT(-1.0, out[1]);
+  TEST_ASSERT_EQUAL_FLOAT(0.75, out[2]);
+}
+
+void test_subtract_multiply_array(void) {
+  const double a[] = {5.0, -2.0};
+  const double b[] = {3.0, 4.0};
+  double out[2];
+  subtract_array(a, b, out, 2);
+  TEST_ASSERT_EQUAL_FLOAT(2.0, out[0]);
+  TEST_ASSERT_EQUAL_FLOAT(-6.0, out[1]);
+  multiply_array(a, b, out, 2);
+  TEST_ASSERT_EQUAL_FLOAT(15.0, out[0]);
+  TEST_ASSERT_EQUAL_FLOAT(-8.0, out[1]);
+}
+
+void test_divide_array(void) {
+  const double a[] = {6.0, 1.0, 2.0};
+  const double b[] = {3.0, 0.0, 4.0};
+  double out[3];
+  TEST_ASSERT_EQUAL_UINT(1, divide_array(a, b, out, 3));
+  TEST_ASSERT_EQUAL_FLOAT(2.0, out[0]);
+  TEST_ASSERT_TRUE(isnan(out[1]));
+  TEST_ASSERT_EQUAL_FLOAT(0.5, out[2]);
+}
+
+void test_strided_array_op(void) {
+  /* 600 interleaved pairs: more than one block of the strided path. */
+  enum { N = 600 };
+  static double pairs[2 * N], out[N];
+  static float pairs32[2 * N];
+  const ptrdiff_t pair = 2 * sizeof(double), pair32 = 2 * sizeof(float);
+  for (int i = 0; i < 2 * N; i++) {
+    pairs[i] = i + 1;
+    pairs32[i] = i + 1;
+  }
+  TEST_ASSERT_EQUAL_UINT(
+      0, strided_array_op(CALC_OP_ADD, pairs, pair, pairs + 1, pair, out,
+                          sizeof(double), N));
+  TEST_ASSERT_EQUAL_FLOAT(3.0, out[0]);
+  TEST_ASSERT_EQUAL_FLOAT(4.0 * N - 1.0, out[N - 1]);
+  /* Reversed output, written back over the first element of each pair. */
+  TEST_ASSERT_EQUAL_UINT(
+      0, strided_array_op(CALC_OP_MULTIPLY, out, sizeof(double), out,
+                          sizeof(double), pairs + 2 * (N - 1), -pair, N));
+  TEST_ASSERT_EQUAL_FLOAT(9.0, pairs[2 * (N - 1)]);
+  TEST_ASSERT_EQUAL_FLOAT((4.0 * N - 1.0) * (4.0 * N - 1.0), pairs[0]);
+  TEST_ASSERT_EQUAL_FLOAT(2.0, pairs[1]);
+  /* In place, with zero divisors counted. */
+  pairs32[4] = 0.0f;
+  TEST_ASSERT_EQUAL_UINT(
+      1, strided_array_op_float(CALC_OP_DIVIDE, pairs32 + 1, pair32, pairs32,
+                                pair32, pairs32 + 1, pair32, N));
+  TEST_ASSERT_EQUAL_FLOAT(2.0f, pairs32[1]);
+  TEST_ASSERT_TRUE(isnan(pairs32[5]));
+  TEST_ASSERT_EQUAL_UINT(
+      SIZE_MAX, strided_array_op(CALC_OP_NEGATE, out, 8, out, 8, out, 8, N));
+}
+
+/* Run every float64 and float32 array kernel on `path` and compare it bit
+ * for bit with the scalar path, at lengths that exercise full vectors and
+ * remainders. */
+static void check_simd_path(int path) {
+  enum { N = 37 };
+  double a[N], b[N], expected[N], actual[N];
+  float a32[N], b32[N], expected32[N], actual32[N];
+  for (int i = 0; i < N; i++) {
+    a[i] = (i - 17) * 1.1e-3 + 1.0 / (i + 1);
+    b[i] = i % 7 == 3 ? 0.0 : (i - 5.5) * 0.37;
+  }
+  b[N - 1] = 0.0; /* a zero divisor in the scalar remainder too */
+  for (int i = 0; i < N; i++) {
+    a32[i] = (float)a[i];
+    b32[i] = (float)b[i];
+  }
+  if (set_simd_path(path) != 0) {
+    TEST_IGNORE_MESSAGE("SIMD path not supported on this CPU");
+  }
+  TEST_ASSERT_EQUAL_INT(path, get_simd_path());
+  for (size_t n = 0; n <= N; n += n < 17 ? 1 : 10) {
+    for (int op = 0; op < 4; op++) {
+      size_t zeros[2];
+      for (int pass = 0; pass < 2; pass++) {
+        double* out = pass == 0 ? expected : actual;
+        memset(out, 0, sizeof(expected));
+        set_simd_path(pass == 0 ? CALC_SIMD_SCALAR : path);
+        zeros[pass] = 0;
+        if (op == 0) {
+          add_array(a, b, out, n);
+        } else if (op == 1) {
+          subtract_array(a, b, out, n);
+        } else if (op == 2) {
+          multiply_array(a, b, out, n);
+        } else {
+          zeros[pass] = divide_array(a, b, out, n);
+        }
+      }
+      TEST_ASSERT_EQUAL_UINT(zeros[0], zeros[1]);
+      TEST_ASSERT_EQUAL_MEMORY(expected, actual, sizeof(expected));
+    }
+    for (int op = 0; op < 4; op++) {
+      size_t zeros[2];
+      for (int pass = 0; pass < 2; pass++) {
+        float* out = pass == 0 ? expected32 : actual32;
+        memset(out, 0, sizeof(expected32));
+        set_simd_path(pass == 0 ? CALC_SIMD_SCALAR : path);
+        zeros[pass] = 0;
+        if (op == 0) {
+          add_array_float(a32, b32, out, n);
+        } else if (op == 1) {
+          subtract_array_float(a32, b32, out, n);
+        } else if (op == 2) {
+          multiply_array_float(a32, b32, out, n);
+        } else {
+          zeros[pass] = divide_array_float(a32, b32, out, n);
+        }
+      }
+      TEST_ASSERT_EQUAL_UINT(zeros[0], zeros[1]);
+      TEST_ASSERT_EQUAL_MEMORY(expected32, actual32, sizeof(expected32));
+    }
+  }
+  /* In place, with out aliasing the divisor. */
+  memcpy(actual, b, sizeof(b));
+  TEST_ASSERT_EQUAL_UINT(6, divide_array(a, actual, actual, N));
+  TEST_ASSERT_TRUE(isnan(actual[3]));
+  TEST_ASSERT_TRUE(isnan(actual[N - 1]));
+  set_simd_path(CALC_SIMD_AUTO);
+}
+
+void test_simd_scalar(void) { check_simd_path(CALC_SIMD_SCALAR); }
+void test_simd_sse2(void) { check_simd_path(CALC_SIMD_SSE2); }
+void test_simd_avx2(void) { check_simd_path(CALC_SIMD_AVX2); }
+void test_simd_avx512(void) { check_simd_path(CALC_SIMD_AVX512); }
+
+void test_simd_path_selection(void) {
+  TEST_ASSERT_EQUAL_INT(-1, set_simd_path(42));
+  TEST_ASSERT_EQUAL_STRING("scalar", simd_path_name(CALC_SIMD_SCALAR));
+  TEST_ASSERT_NULL(simd_path_name(42));
+  TEST_ASSERT_EQUAL_INT(0, set_simd_path(CALC_SIMD_AUTO));
+  TEST_ASSERT_NOT_NULL(simd_path_name(get_simd_path()));
+}
+
+void test_reductions(void) {
+  const double a[] = {3.0, -1.5, 4.0, 0.5};
+  const double b[] = {2.0, 2.0, 0.5, -4.0};
+  TEST_ASSERT_EQUAL_FLOAT(6.0, sum_array(a, 4));
+  TEST_ASSERT_EQUAL_FLOAT(-9.0, product_array(a, 4));
+  TEST_ASSERT_EQUAL_FLOAT(-1.5, min_array(a, 4));
+  TEST_ASSERT_EQUAL_FLOAT(4.0, max_array(a, 4));
+  TEST_ASSERT_EQUAL_FLOAT(1.5, mean_array(a, 4));
+  TEST_ASSERT_EQUAL_FLOAT(3.0, dot_array(a, b, 4));
+  TEST_ASSERT_EQUAL_FLOAT(0.0, sum_array(a, 0));
+  TEST_ASSERT_EQUAL_FLOAT(1.0, product_array(a, 0));
+  TEST_ASSERT_TRUE(isnan(min_array(a, 0)));
+  TEST_ASSERT_TRUE(isnan(mean_array(a, 0)));
+  const double with_nan[] = {1.0, NAN, -1.0};
+  TEST_ASSERT_TRUE(isnan(min_array(with_nan, 3)));
+  TEST_ASSERT_TRUE(isnan(max_array(with_nan, 3)));
+}
+
+void test_sum_array_accuracy(void) {
+  /* A naive running sum of a million 0.1s is off by about 1e-6. */
+  const size_t n = 1000000;
+  double* values = malloc(n * sizeof(double));
+  TEST_ASSERT_NOT_NULL(values);
+  for (size_t i = 0; i < n; i++) {
+    values[i] = 0.1;
+  }
+  TEST_ASSERT_TRUE(fabs(sum_array(values, n) - 100000.0) < 1e-8);
+  free(values);
+}
+
+void test_reductions_threads(void) {
+  /* Results must not depend on how many threads share the work. */
+  const size_t n = (size_t)1 << 21;
+  double* values = malloc(n * sizeof(double));
+  TEST_ASSERT_NOT_NULL(values);
+  unsigned int seed = 12345;
+  for (size_t i = 0; i < n; i++) {
+    seed = seed * 1103515245u + 12345u;
+    values[i] = (double)(seed >> 8) / 16777216.0 - 0.25;
+  }
+  size_t previous = set_reduction_threads(1);
+  double sum = sum_array(values, n);
+  double dot = dot_array(values, values, n);
+  double smallest = min_array(values, n);
+  const size_t threads[] = {2, 3, 8, 0};
+  for (size_t i = 0; i < sizeof(threads) / sizeof(threads[0]); i++) {
+    set_reduction_threads(threads[i]);
+    TEST_ASSERT_TRUE(sum_array(values, n) == sum);
+    TEST_ASSERT_TRUE(dot_array(values, values, n) == dot);
+    TEST_ASSERT_TRUE(min_array(values, n) == smallest);
+  }
+  set_reduction_threads(previous);
+  free(values);
+}
+
+void test_run_program(void) {
+  /* -(x + 2) * 3 with x = 4 */
+  const calc_instruction code[] = {
+      {CALC_OP_LOAD, 0, 0.0}, {CALC_OP_PUSH, 0, 2.0},
+      {CALC_OP_ADD, 0, 0.0},  {CALC_OP_NEGATE, 0, 0.0},
+      {CALC_OP_PUSH, 0, 3.0}, {CALC_OP_MULTIPLY, 0, 0.0},
+  };
+  const double variables[] = {4.0};
+  double result = 0.0;
+  TEST_ASSERT_EQUAL_INT(2, check_program(code, 6));
+  TEST_ASSERT_EQUAL_INT(CALC_OK, run_program(code, 6, variables, 1, &result));
+  TEST_ASSERT_EQUAL_FLOAT(-18.0, result);
+  TEST_ASSERT_EQUAL_INT(CALC_ERR_BAD_VARIABLE,
+                        run_program(code, 6, NULL, 0, &result));
+}
+
+void test_run_program_precision(void) {
+  /* (x + 0.2) / 3 with x = 0.1 */
+  const calc_instruction code[] = {{CALC_OP_LOAD, 0, 0.0},
+                                   {CALC_OP_PUSH, 0, 0.2},
+                                   {CALC_OP_ADD, 0, 0.0},
+                                   {CALC_OP_PUSH, 0, 3.0},
+                                   {CALC_OP_DIVIDE, 0, 0.0}};
+  const double variables[] = {0.1};
+  const float x32[] = {0.1f, 0.1f};
+  const float* columns32[] = {x32};
+  const float narrowed = (float)((float)(0.1f + 0.2f) / 3.0f);
+  double result = 0.0;
+  float out32[2];
+  TEST_ASSERT_EQUAL_INT(CALC_OK,
+                        run_program_double(code, 5, variables, 1, &result));
+  TEST_ASSERT_TRUE(result == (0.1 + 0.2) / 3.0);
+  TEST_ASSERT_EQUAL_INT(CALC_OK, run_program(code, 5, variables, 1, &result));
+  TEST_ASSERT_TRUE(result == narrowed);
+  TEST_ASSERT_EQUAL_INT(
+      CALC_OK, run_program_columns_float(code, 5, columns32, 1, 2, out32));
+  TEST_ASSERT_TRUE(out32[0] == narrowed && out32[1] == narrowed);
+  /* A bare constant or variable is rounded to float too. */
+  TEST_ASSERT_EQUAL_INT(CALC_OK, run_program(code + 1, 1, NULL, 0, &result));
+  TEST_ASSERT_TRUE(result == 0.2f);
+  TEST_ASSERT_EQUAL_INT(CALC_OK, run_program(code, 1, variables, 1, &result));
+  TEST_ASSERT_TRUE(result == 0.1f);
+}
+
+void test_run_program_errors(void) {
+  const calc_instruction divide_by_zero[] = {
+      {CALC_OP_PUSH, 0, 1.0}, {CALC_OP_PUSH, 0, 0.0}, {CALC_OP_DIVIDE, 0, 0.0}};
+  /* 1e-50 is not zero as a double, but is as a float. */
+  const calc_instruction divide_by_tiny[] = {{CALC_OP_PUSH, 0, 1.0},
+                                             {CALC_OP_PUSH, 0, 1e-50},
+                                             {CALC_OP_DIVIDE, 0, 0.0}};
+  const calc_instruction underflow[] = {{CALC_OP_PUSH, 0, 1.0},
+                                        {CALC_OP_SUBTRACT, 0, 0.0}};
+  double result = 0.0;
+  TEST_ASSERT_EQUAL_INT(CALC_ERR_DIVISION_BY_ZERO,
+                        run_program(divide_by_zero, 3, NULL, 0, &result));
+  TEST_ASSERT_EQUAL_INT(CALC_ERR_DIVISION_BY_ZERO,
+                        run_program(divide_by_tiny, 3, NULL, 0, &result));
+  TEST_ASSERT_EQUAL_INT(
+      CALC_OK, run_program_double(divide_by_tiny, 3, NULL, 0, &result));
+  TEST_ASSERT_EQUAL_INT(-1, check_program(underflow, 2));
+  TEST_ASSERT_EQUAL_INT(CALC_ERR_BAD_PROGRAM,
+                        run_program(underflow, 2, NULL, 0, &result));
+}
+
+void test_run_program_registers(void) {
+  /* (x + 1) * (x + 1), computing x + 1 once */
+  const calc_instruction code[] = {
+      {CALC_OP_LOAD, 0, 0.0},   {CALC_OP_PUSH, 0, 1.0},
+      {CALC_OP_ADD, 0, 0.0},    {CALC_OP_STORE, 0, 0.0},
+      {CALC_OP_RECALL, 0, 0.0}, {CALC_OP_MULTIPLY, 0, 0.0}};
+  const calc_instruction recall_first[] = {{CALC_OP_RECALL, 0, 0.0}};
+  const calc_instruction skipped[] = {{CALC_OP_PUSH, 0, 1.0},
+                                      {CALC_OP_STORE, 1, 0.0}};
+  const double variables[] = {2.0};
+  const double* columns[] = {variables};
+  double result, out[1];
+
+  TEST_ASSERT_EQUAL_INT(2, check_program(code, 6));
+  TEST_ASSERT_EQUAL_INT(CALC_OK, run_program(code, 6, variables, 1, &result));
+  TEST_ASSERT_EQUAL_FLOAT(9.0, result);
+  TEST_ASSERT_EQUAL_INT(CALC_OK,
+                        run_program_columns(code, 6, columns, 1, 1, out));
+  TEST_ASSERT_EQUAL_FLOAT(9.0, out[0]);
+  TEST_ASSERT_EQUAL_INT(-1, check_program(recall_first, 1));
+  TEST_ASSERT_EQUAL_INT(-1, check_program(skipped, 2));
+  TEST_ASSERT_EQUAL_INT(CALC_ERR_BAD_PROGRAM,
+                        run_program(recall_first, 1, NULL, 0, &result));
+}
+
+void test_run_program_columns(void) {
+  /* x * y - 1 over 1000 rows, more than one block */
+  enum { ROWS = 1000 };
+  static double x[ROWS], y[ROWS], out[ROWS];
+  const double* columns[] = {x, y};
+  const calc_instruction code[] = {{CALC_OP_LOAD, 0, 0.0},
+                                   {CALC_OP_LOAD, 1, 0.0},
+                                   {CALC_OP_MULTIPLY, 0, 0.0},
+                                   {CALC_OP_PUSH, 0, 1.0},
+                                   {CALC_OP_SUBTRACT, 0, 0.0}};
+  for (int i = 0; i < ROWS; i++) {
+    x[i] = i;
+    y[i] = 0.5;
+  }
+  TEST_ASSERT_EQUAL_INT(CALC_OK,
+                        run_program_columns(code, 5, columns, 2, ROWS, out));
+  TEST_ASSERT_EQUAL_FLOAT(-1.0, out[0]);
+  TEST_ASSERT_EQUAL_FLOAT(498.5, out[ROWS - 1]);
+  TEST_ASSERT_EQUAL_INT(CALC_ERR_BAD_VARIABLE,
+                        run_program_columns(code, 5, columns, 1, ROWS, out));
+  y[700] = 0.0;
+  const calc_instruction divide[] = {
+      {CALC_OP_LOAD, 0, 0.0}, {CALC_OP_LOAD, 1, 0.0}, {CALC_OP_DIVIDE, 0, 0.0}};
+  TEST_ASSERT_EQUAL_INT(CALC_ERR_DIVISION_BY_ZERO,
+                        run_program_columns(divide, 3, columns, 2, ROWS, out));
+}
+
 int main(void) {
   UNITY_BEGIN();
   RUN_TEST(test_add);
   RUN_TEST(test_subtract);
   RUN_TEST(test_multiply);
   RUN_TEST(test_divide);
+  RUN_TEST(test_double_scalars);
+  RUN_TEST(test_add_array);
+  RUN_TEST(test_subtract_multiply_array);
+  RUN_TEST(test_divide_array);
+  RUN_TEST(test_strided_array_op);
+  RUN_TEST(test_simd_scalar);
+  RUN_TEST(test_simd_sse2);
+  RUN_TEST(test_simd_avx2);
+  RUN_TEST(test_simd_avx512);
+  RUN_TEST(test_simd_path_selection);
+  RUN_TEST(test_reductions);
+  RUN_TEST(test_sum_array_accuracy);
+  RUN_TEST(test_reductions_threads);
+  RUN_TEST(test_run_program);
+  RUN_TEST(test_run_program_precision);
+  RUN_TEST(test_run_program_errors);
+  RUN_TEST(test_run_program_registers);
+  RUN_TEST(test_run_program_columns);
   return UNITY_END();
 }
\ No newline at end of file
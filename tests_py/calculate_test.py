@@ -1,6 +1,15 @@
+import asyncio
 import pytest
 import calculator_c
 import math
+import os
+import subprocess
+import sys
+from array import array
+
+from python import Calculator, parallel
+from python.aio import AsyncCalculator, evaluate_batch
+from python.cells import Sheet
 
 
 class TestCBackend:
@@ -29,9 +38,762 @@ class TestCBackend:
         assert calculator_c.divide(6.0, 2.0) == 3.0
         assert calculator_c.divide(-6.0, 2.0) == -3.0
         assert calculator_c.divide(1.0, 3.0) == pytest.approx(0.333333, rel=1e-5)
+        with pytest.raises(ZeroDivisionError, match="Division by zero"):
+            calculator_c.divide(1.0, 1e-50)  # zero once narrowed to float32
+
+    def test_double_scalars(self):
+        """Test the float64 scalar functions do not narrow to float32."""
+        assert calculator_c.add_double(0.1, 0.2) == 0.1 + 0.2
+        assert calculator_c.subtract_double(0.3, 0.1) == 0.3 - 0.1
+        assert calculator_c.multiply_double(0.1, 3.0) == 0.1 * 3.0
+        assert calculator_c.divide_double(1.0, 3.0) == 1.0 / 3.0
+        with pytest.raises(ZeroDivisionError, match="Division by zero"):
+            calculator_c.divide_double(1.0, 0.0)
+
+    def test_backend(self):
+        """Test the bindings report which backend they use."""
+        assert calculator_c.BACKEND in ("native", "ctypes")
+
+    @pytest.mark.skipif(
+        calculator_c.BACKEND != "native", reason="native extension not built"
+    )
+    def test_native_argument_checking(self):
+        """Test the METH_FASTCALL wrappers validate their arguments."""
+        assert calculator_c.add(2, 3) == 5.0
+        with pytest.raises(TypeError):
+            calculator_c.add(1.0)
+        with pytest.raises(TypeError):
+            calculator_c.multiply(1.0, "2")
 
     def test_divide_by_zero(self):
         """Test division by zero raises exception."""
         with pytest.raises(ZeroDivisionError, match="Division by zero"):
             if math.isnan(calculator_c.divide(5.0, 0.0)):
                 raise ZeroDivisionError("Division by zero")
+
+
+class TestCArrayBackend:
+    """Test the C backend array kernels."""
+
+    def test_add_array(self):
+        """Test element-wise addition allocates a float64 result."""
+        result = calculator_c.add_array(array("d", [1.0, 2.5]), array("d", [3.0, 4.0]))
+        assert isinstance(result, array)
+        assert list(result) == [4.0, 6.5]
+
+    def test_subtract_multiply_array(self):
+        """Test element-wise subtraction and multiplication."""
+        a, b = array("d", [5.0, -1.0]), array("d", [2.0, 3.0])
+        assert list(calculator_c.subtract_array(a, b)) == [3.0, -4.0]
+        assert list(calculator_c.multiply_array(a, b)) == [10.0, -3.0]
+
+    def test_array_keeps_double_precision(self):
+        """Test array kernels do not narrow to float32."""
+        result = calculator_c.add_array(array("d", [0.1]), array("d", [0.2]))
+        assert result[0] == 0.1 + 0.2
+
+    def test_float_arrays(self):
+        """Test the float32 kernels take and return float32 arrays."""
+        a, b = array("f", [0.1, 6.0]), array("f", [0.2, 4.0])
+        result = calculator_c.add_array_float(a, b)
+        assert result.typecode == "f"
+        assert list(result) == list(array("f", [0.1 + 0.2, 10.0]))
+        assert list(calculator_c.subtract_array_float(b, a))[1] == -2.0
+        assert list(calculator_c.multiply_array_float(a, b))[1] == 24.0
+        out = array("f", [0.0, 0.0])
+        assert calculator_c.divide_array_float(b, a, out=out) is out
+        assert out[1] == array("f", [4.0 / 6.0])[0]
+        with pytest.raises(ZeroDivisionError):
+            calculator_c.divide_array_float(a, array("f", [1.0, 0.0]))
+
+    def test_buffer_inputs(self):
+        """Test bytes, memoryview and plain sequences are accepted."""
+        a = array("d", [1.0, 2.0]).tobytes()
+        b = memoryview(array("d", [3.0, 4.0]))
+        assert list(calculator_c.add_array(a, b)) == [4.0, 6.0]
+        assert list(calculator_c.add_array([1, 2], (3, 4))) == [4.0, 6.0]
+
+    def test_out_buffer(self):
+        """Test results are written into a caller-provided buffer."""
+        out = array("d", [0.0, 0.0])
+        result = calculator_c.multiply_array([2.0, 3.0], [4.0, 5.0], out)
+        assert result is out
+        assert list(out) == [8.0, 15.0]
+
+    def test_strided_views(self):
+        """Test strided and reversed memoryviews, including a strided out."""
+        values = array("d", range(1, 601))
+        view = memoryview(values)
+        out = array("d", bytes(8 * 600))
+        calculator_c.add_array(view[::2], view[1::2], memoryview(out)[1::2])
+        assert list(out[1::2]) == [4.0 * i + 3.0 for i in range(300)]
+        assert list(out[::2]) == [0.0] * 300
+        reversed_product = calculator_c.multiply_array(view[::-1], view)
+        assert list(reversed_product) == [(601 - i) * i for i in range(1, 601)]
+        floats = memoryview(array("f", range(9)))
+        assert list(calculator_c.add_array_float(floats[::4], floats[::4])) == [
+            0.0,
+            8.0,
+            16.0,
+        ]
+
+    def test_in_place(self):
+        """Test out may be an operand or overlap one."""
+        values = array("d", [1.0, 2.0, 3.0, 4.0])
+        assert calculator_c.add_array(values, values, values) is values
+        assert list(values) == [2.0, 4.0, 6.0, 8.0]
+        view = memoryview(values)
+        calculator_c.subtract_array(view[1:], view[:-1], view[:-1])
+        assert list(values) == [2.0, 2.0, 2.0, 8.0]
+        calculator_c.multiply_array(view[:-1], view[:-1], view[1:])
+        assert list(values) == [2.0, 4.0, 4.0, 4.0]
+
+    def test_out_reuse_allocates_nothing(self):
+        """Test repeated calls with out= leave no allocations behind."""
+        a, out = array("d", range(1000)), array("d", bytes(8000))
+        strided = memoryview(array("d", range(2000)))[::2]
+        for _ in range(3):
+            calculator_c.add_array(a, strided, out=out)
+        blocks = sys.getallocatedblocks()
+        for _ in range(1000):
+            calculator_c.add_array(a, strided, out=out)
+        assert sys.getallocatedblocks() - blocks < 10
+
+    def test_length_mismatch(self):
+        """Test operands of different lengths are rejected."""
+        with pytest.raises(ValueError):
+            calculator_c.add_array([1.0, 2.0], [1.0])
+        with pytest.raises(ValueError):
+            calculator_c.add_array([1.0], [1.0], array("d", [0.0, 0.0]))
+
+    def test_read_only_out(self):
+        """Test read-only out buffers are rejected."""
+        with pytest.raises(TypeError):
+            calculator_c.add_array([1.0], [1.0], bytes(8))
+
+    def test_divide_array(self):
+        """Test element-wise division and division by zero."""
+        assert list(calculator_c.divide_array([6.0, 1.0], [2.0, 4.0])) == [3.0, 0.25]
+        with pytest.raises(ZeroDivisionError, match="Division by zero"):
+            calculator_c.divide_array([1.0, 2.0], [1.0, 0.0])
+
+    def test_simd_paths_match(self):
+        """Test every supported SIMD path gives bit-identical results."""
+        a = array("d", (1.0 / (i + 1) for i in range(37)))
+        b = array("d", (0.0 if i % 7 == 3 else i * 0.37 - 2 for i in range(37)))
+        kernels = (calculator_c.add_array, calculator_c.multiply_array)
+        results = set()
+        try:
+            for path in ("scalar", "sse2", "avx2", "avx512"):
+                try:
+                    assert calculator_c.set_simd_path(path) == path
+                except ValueError:
+                    continue
+                out = b"".join(bytes(kernel(a, b)) for kernel in kernels)
+                with pytest.raises(ZeroDivisionError):
+                    calculator_c.divide_array(a, b)
+                results.add(out)
+        finally:
+            calculator_c.set_simd_path(None)
+        assert len(results) == 1
+        with pytest.raises(ValueError, match="Unknown SIMD path"):
+            calculator_c.set_simd_path("neon")
+
+
+class TestCReductions:
+    """Test the C backend reductions."""
+
+    def test_reductions(self):
+        """Test sum, product, min, max, mean and dot."""
+        values = array("d", [3.0, -1.5, 4.0, 0.5])
+        assert calculator_c.sum_array(values) == 6.0
+        assert calculator_c.product_array(values) == -9.0
+        assert calculator_c.min_array(values) == -1.5
+        assert calculator_c.max_array([3, 7, 5]) == 7.0
+        assert calculator_c.mean_array(values.tobytes()) == 1.5
+        assert calculator_c.dot_array(values, [2.0, 2.0, 0.5, -4.0]) == 3.0
+        assert Calculator.sum_array(range(101)) == 5050.0
+
+    def test_empty(self):
+        """Test empty arrays: identities for sum/product, errors otherwise."""
+        assert calculator_c.sum_array([]) == 0.0
+        assert calculator_c.product_array([]) == 1.0
+        for reduction in (calculator_c.min_array, calculator_c.mean_array):
+            with pytest.raises(ValueError):
+                reduction([])
+        with pytest.raises(ValueError):
+            calculator_c.dot_array([1.0], [1.0, 2.0])
+
+    def test_sum_accuracy(self):
+        """Test pairwise summation stays close to the exact sum."""
+        # A naive running sum of these values is off by about 1e-6.
+        values = array("d", [0.1]) * 1_000_000
+        assert abs(calculator_c.sum_array(values) - math.fsum(values)) < 1e-9
+
+    def test_threads_do_not_change_results(self):
+        """Test reductions give identical results for any thread count."""
+        values = array("d", (math.sin(i) for i in range(1 << 20)))
+        previous = calculator_c.set_reduction_threads(1)
+        try:
+            expected = calculator_c.sum_array(values), calculator_c.max_array(values)
+            for threads in (2, 4, 0):
+                calculator_c.set_reduction_threads(threads)
+                assert calculator_c.sum_array(values) == expected[0]
+                assert calculator_c.max_array(values) == expected[1]
+        finally:
+            calculator_c.set_reduction_threads(previous)
+
+
+class TestCBytecode:
+    """Test the C backend bytecode VM."""
+
+    def test_run(self):
+        """Test a program with constants and variables in one call."""
+        program = calculator_c.compile(
+            [("push", 1.0), ("var", 0), ("+", None), ("push", 3.0), ("*", None)]
+        )
+        assert calculator_c.run(program, [2.0]) == 9.0
+        assert calculator_c.run(program, array("d", [-1.0])) == 0.0
+
+    def test_negate_and_deep_program(self):
+        """Test negation and programs deeper than the VM's small stack."""
+        program = [("push", 1.0)] * 100 + [("+", None)] * 99 + [("neg", None)]
+        assert calculator_c.run(calculator_c.compile(program)) == -100.0
+
+    def test_invalid_programs(self):
+        """Test malformed programs are rejected at compile time."""
+        for program in [[], [("push", 1.0), ("+", None)], [("pow", None)]]:
+            with pytest.raises(ValueError):
+                calculator_c.compile(program)
+
+    def test_run_errors(self):
+        """Test division by zero and missing variables."""
+        program = calculator_c.compile([("push", 1.0), ("push", 0.0), ("/", None)])
+        with pytest.raises(ZeroDivisionError, match="Division by zero"):
+            calculator_c.run(program)
+        with pytest.raises(IndexError):
+            calculator_c.run(calculator_c.compile([("var", 1)]), [1.0])
+
+    def test_registers(self):
+        """Test values stored once and recalled by later instructions."""
+        program = calculator_c.compile(
+            [("var", 0), ("push", 1.0), ("+", None), ("store", 0)]
+            + [("recall", 0), ("*", None)]
+        )
+        assert calculator_c.run(program, [2.0]) == 9.0
+        assert list(calculator_c.run_columns(program, [[1.0, 2.0]])) == [4.0, 9.0]
+        for invalid in ([("recall", 0)], [("push", 1.0), ("store", 1)]):
+            with pytest.raises(ValueError):
+                calculator_c.compile(invalid)
+
+    def test_run_columns(self):
+        """Test evaluating a program over columns in blocks of rows."""
+        program = calculator_c.compile(
+            [("var", 0), ("var", 1), ("*", None), ("push", 2.0), ("-", None)]
+        )
+        x = array("d", range(1500))
+        result = calculator_c.run_columns(program, [x, [0.5] * 1500])
+        assert list(result) == [i * 0.5 - 2.0 for i in range(1500)]
+        out = array("d", x)
+        assert calculator_c.run_columns(program, [x, x], out=out) is out
+        assert out[3] == 7.0
+        with pytest.raises(ValueError, match="same length"):
+            calculator_c.run_columns(program, [x, [1.0]])
+        # out overlapping a column at an offset, across several blocks
+        double = calculator_c.compile([("var", 0), ("push", 2.0), ("*", None)])
+        for code, run in (("d", "run_columns"), ("f", "run_columns_float")):
+            m = memoryview(array(code, range(1501)))
+            getattr(calculator_c, run)(double, [m[:-1]], out=m[1:])
+            assert list(m) == [0.0] + [i * 2.0 for i in range(1500)]
+            m = memoryview(array(code, range(1501)))
+            getattr(calculator_c, run)(double, [m[1:]], out=m[:-1])
+            assert list(m) == [i * 2.0 for i in range(1, 1501)] + [1500.0]
+        with pytest.raises(IndexError):
+            calculator_c.run_columns(program, [x])
+        with pytest.raises(ZeroDivisionError):
+            calculator_c.run_columns(
+                calculator_c.compile([("var", 0), ("var", 0), ("/", None)]), [x]
+            )
+
+    def test_precision(self):
+        """Test run_double keeps float64 and run rounds every step to float32."""
+        program = calculator_c.compile(
+            [("var", 0), ("push", 0.2), ("+", None), ("push", 3.0), ("/", None)]
+        )
+        assert calculator_c.run_double(program, [0.1]) == (0.1 + 0.2) / 3.0
+        narrowed = array("f", [array("f", [0.1 + 0.2])[0] / 3.0])[0]
+        assert calculator_c.run(program, [0.1]) == narrowed
+        result = calculator_c.run_columns_float(program, [array("f", [0.1, 0.1])])
+        assert result.typecode == "f"
+        assert list(result) == [narrowed, narrowed]
+        out = array("f", [0.0, 0.0])
+        assert calculator_c.run_columns_float(program, [[0.1, 0.1]], out=out) is out
+        assert out[0] == narrowed
+
+
+class TestOptimizer:
+    """Test constant folding, identities and shared subexpressions."""
+
+    def program(self, expression, optimize=True):
+        return [op for op, _ in Calculator.compile(expression, optimize).program]
+
+    def test_constant_folding(self):
+        """Test constant subtrees are evaluated at compile time."""
+        assert Calculator.compile("(1 + 2) * 4 - -3").program == (("push", 15.0),)
+        assert self.program("x * (2 + 3)") == ["var", "push", "*"]
+        assert self.program("x * (2 + 3)", optimize=False) == [
+            "var",
+            "push",
+            "push",
+            "+",
+            "*",
+        ]
+
+    def test_division_by_zero_not_folded(self):
+        """Test a constant division by zero still fails at evaluation."""
+        for engine in Calculator.ENGINES:
+            with pytest.raises(ZeroDivisionError):
+                Calculator(engine=engine).calculate("x + 1 / 0", {"x": 1.0})
+
+    def test_identities(self):
+        """Test only IEEE-exact identities are applied."""
+        assert self.program("x * 1 / 1 - 0") == ["var"]
+        assert self.program("--x") == ["var"]
+        assert self.program("x * -1") == ["var", "neg"]
+        assert self.program("x + -y") == ["var", "var", "-"]
+        assert self.program("x + 0") == ["var", "push", "+"]
+        assert self.program("x * 0") == ["var", "push", "*"]
+        calc = Calculator()
+        assert math.copysign(1.0, calc.calculate("x + 0", {"x": -0.0})) == 1.0
+
+    def test_common_subexpressions(self):
+        """Test repeated subexpressions are evaluated once."""
+        expression = "(a + b) * c + (a + b) * c / ((a + b) * c)"
+        assert self.program(expression) == [
+            "var",
+            "var",
+            "+",
+            "var",
+            "*",
+            "store",
+            "recall",
+            "recall",
+            "/",
+            "+",
+        ]
+        variables = {"a": 1.0, "b": 2.0, "c": 3.0}
+        for engine in Calculator.ENGINES:
+            for optimize in (True, False):
+                calc = Calculator(engine=engine, optimize=optimize)
+                assert calc.calculate(expression, variables) == 10.0
+        columns = {name: [value] for name, value in variables.items()}
+        assert list(Calculator().calculate_over(expression, columns)) == [10.0]
+
+    def test_deep_expression(self):
+        """Test long operator chains do not hit the recursion limit."""
+        assert Calculator().calculate(" + ".join(["x"] * 5000), {"x": 1.0}) == 5000.0
+
+    def test_dump(self):
+        """Test the debug dump shows the optimized form and program."""
+        dump = Calculator.compile("(1 + 2) * x + (1 + 2) * x").dump()
+        assert "evaluates: 3.0 * x + 3.0 * x" in dump
+        assert "store 0" in dump and "recall 0" in dump
+        result = subprocess.run(
+            [sys.executable, "run_cli.py", "--dump", "--no-optimize", "2 * 3"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        assert "evaluates: 2.0 * 3.0" in result.stdout
+
+
+class TestSheet:
+    """Test named cells and incremental recomputation."""
+
+    def test_define_updates_dependents(self):
+        """Test redefining a cell recomputes exactly its dependents, in order."""
+        sheet = Sheet()
+        sheet.define("a", "1")
+        sheet.define("b", "2")
+        sheet.define("total", "a + b")
+        sheet.define("double", "total * 2")
+        assert sheet.define("a", "10") == [
+            ("a", 10.0),
+            ("total", 12.0),
+            ("double", 24.0),
+        ]
+        assert sheet.evaluate("double - a") == 14.0
+        assert sheet.cells() == ["a", "b", "total", "double"]
+
+    def test_forward_reference(self):
+        """Test a cell referring to an undefined name updates once it exists."""
+        sheet = Sheet()
+        ((cell, error),) = sheet.define("c", "d * 2")
+        assert cell == "c" and isinstance(error, ValueError)
+        with pytest.raises(ValueError, match="Unknown cell 'd'"):
+            sheet.value("c")
+        assert sheet.define("d", "3") == [("d", 3.0), ("c", 6.0)]
+
+    def test_errors_propagate(self):
+        """Test a failing cell's error reaches its dependents until fixed."""
+        sheet = Sheet()
+        sheet.define("x", "1 / 0")
+        sheet.define("y", "x + 1")
+        with pytest.raises(ZeroDivisionError):
+            sheet.value("y")
+        assert sheet.define("x", "4") == [("x", 4.0), ("y", 5.0)]
+
+    def test_circular_reference(self):
+        """Test a cycle is rejected and leaves the sheet unchanged."""
+        sheet = Sheet()
+        sheet.define("a", "1")
+        sheet.define("b", "a + 1")
+        for expression in ("b * 2", "a"):
+            with pytest.raises(ValueError, match="Circular reference"):
+                sheet.define("a", expression)
+        assert sheet.expression("a") == "1"
+        assert sheet.value("b") == 2.0
+
+    def test_remove(self):
+        """Test removing a cell turns its dependents into errors."""
+        sheet = Sheet()
+        sheet.define("a", "1")
+        sheet.define("b", "a + 1")
+        ((cell, error),) = sheet.remove("a")
+        assert cell == "b" and isinstance(error, ValueError)
+        assert "a" not in sheet and len(sheet) == 1
+        with pytest.raises(ValueError):
+            sheet.remove("a")
+
+    def test_long_chain(self):
+        """Test long chains neither recurse nor recompute unrelated cells."""
+        sheet = Sheet()
+        sheet.define("c0", "1")
+        for i in range(1, 5000):
+            sheet.define(f"c{i}", f"c{i - 1} + 1")
+        assert len(sheet.define("c0", "2")) == 5000
+        assert sheet.value("c4999") == 5001.0
+        assert [cell for cell, _ in sheet.define("c4997", "0")] == [
+            "c4997",
+            "c4998",
+            "c4999",
+        ]
+        assert sheet.value("c4999") == 2.0
+
+
+class TestCalculator:
+    """Test the Python Calculator interface."""
+
+    def test_array_methods(self):
+        """Test Calculator array methods delegate to the C backend."""
+        calc = Calculator()
+        assert list(calc.add_array([1.0], [2.0])) == [3.0]
+        assert list(calc.subtract_array([1.0], [2.0])) == [-1.0]
+        assert list(calc.multiply_array([1.5], [2.0])) == [3.0]
+        assert list(calc.divide_array([1.0], [4.0])) == [0.25]
+        with pytest.raises(ZeroDivisionError):
+            calc.divide_array([1.0], [0.0])
+
+    def test_calculate(self):
+        """Test precedence, parentheses, unary minus and n-ary chains."""
+        calc = Calculator()
+        assert calc.calculate("2 + 3") == 5.0
+        assert calc.calculate("-3*2") == -6.0
+        assert calc.calculate("2 * -3") == -6.0
+        assert calc.calculate("1 + 2 * 3") == 7.0
+        assert calc.calculate("(1 + 2) * 3") == 9.0
+        assert calc.calculate("10 - 2 - 3") == 5.0
+        assert calc.calculate("8 / 4 / 2") == 1.0
+        assert calc.calculate("-(4 - 6) * 1.5e1") == 30.0
+
+    def test_calculate_errors(self):
+        """Test malformed expressions and division by zero."""
+        calc = Calculator()
+        for expression in ["", "2 +", "(1 + 2", "1 + 2)", "2 $ 3", "1 2"]:
+            with pytest.raises(ValueError):
+                calc.calculate(expression)
+        with pytest.raises(ZeroDivisionError, match="Division by zero"):
+            calc.calculate("1 / (2 - 2)")
+
+    def test_deep_nesting(self):
+        """Test deeply nested input parses without recursion."""
+        calc = Calculator()
+        assert calc.calculate("(" * 2000 + "1" + ")" * 2000) == 1.0
+        assert calc.calculate("-" * 3001 + "1") == -1.0
+        assert calc.calculate("1" + " + (1" * 3000 + ")" * 3000) == 3001.0
+        with pytest.raises(ValueError, match="Unbalanced parenthesis at position 0"):
+            calc.calculate("(" * 2000 + "1" + ")" * 1999)
+
+    def test_compile(self):
+        """Test a compiled expression can be evaluated repeatedly."""
+        compiled = Calculator.compile("(1 + 2) * -4")
+        assert compiled.evaluate() == -12.0
+        assert compiled.evaluate(Calculator()) == -12.0
+
+    def test_cache(self):
+        """Test repeated expressions are served from the LRU cache."""
+        calc = Calculator(cache_size=2)
+        assert calc.calculate("1 + 2") == 3.0
+        assert calc.calculate(" 1  +  2 ") == 3.0
+        info = calc.cache_info()
+        assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+
+        calc.calculate("2 * 3")
+        calc.calculate("4 - 1")
+        assert calc.cache_info().evictions == 1
+        calc.calculate("1 + 2")
+        assert calc.cache_info().misses == 4
+
+        calc.clear_cache()
+        assert calc.cache_info() == (0, 0, 0, 2, 0)
+
+    def test_cache_errors(self):
+        """Test cached expressions still raise on every evaluation."""
+        calc = Calculator()
+        for _ in range(2):
+            with pytest.raises(ZeroDivisionError):
+                calc.calculate("1 / 0")
+        with pytest.raises(ValueError):
+            calc.calculate("1 +")
+        assert calc.cache_info().currsize == 1
+
+    def test_shared_cache(self):
+        """Test calculators can share the process-wide cache across threads."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        first, second = Calculator(shared_cache=True), Calculator(shared_cache=True)
+        first.clear_cache()
+        first.calculate("6 / 3")
+        assert second.calculate("6 / 3") == 2.0
+        assert second.cache_info().hits == 1
+
+        expressions = [f"{i} * 2" for i in range(50)] * 20
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(first.calculate, expressions))
+        assert results == [float(i * 2) for i in range(50)] * 20
+        first.clear_cache()
+
+    @pytest.mark.parametrize("engine", Calculator.ENGINES)
+    def test_engines_agree(self, engine):
+        """Test the native VM and the per-operator engine give equal results."""
+        calc = Calculator(engine=engine)
+        assert calc.calculate("0.1") == 0.1
+        assert calc.calculate("-(1.5 + 2) * 4 / 7 - 0.25") == Calculator(
+            engine="python"
+        ).calculate("-(1.5 + 2) * 4 / 7 - 0.25")
+        with pytest.raises(ZeroDivisionError):
+            calc.calculate("1 / (3 - 3)")
+
+    def test_codegen(self):
+        """Test generated functions are cached and match the other engines."""
+        calc = Calculator(engine="codegen")
+        expression = "(a + b) * c - a / b - c / 1e999"
+        variables = {"a": 1, "b": 2, "c": 3}
+        assert calc.calculate(expression, variables) == Calculator(
+            engine="python"
+        ).calculate(expression, variables)
+        compiled = calc._cache.get(" ".join(expression.split()))[0]
+        assert compiled.function is compiled.function
+        source = compiled.python_source
+        assert "t0 = v0 + v1" in source and "add" not in source
+        assert calc.calculate(expression, variables) == 8.5 and "k0" in source
+        assert "if 2.0 == 0.0" not in Calculator.compile("x / 2").python_source
+        with pytest.raises(ZeroDivisionError, match="Division by zero"):
+            calc.calculate("a / (b - 2)", variables)
+        assert calc.calculate("(a + b) * c", {"a": 2**53, "b": 1, "c": 1}) == 2.0**53
+        single = Calculator(engine="codegen", dtype="float32")
+        assert single.calculate("x / 3", {"x": 1}) == array("f", [1 / 3])[0]
+
+    def test_unknown_engine(self):
+        """Test an unknown engine name is rejected."""
+        with pytest.raises(ValueError):
+            Calculator(engine="gpu")
+
+    @pytest.mark.parametrize("engine", Calculator.ENGINES)
+    def test_variables(self, engine):
+        """Test expressions with variables bound per call."""
+        calc = Calculator(engine=engine)
+        assert calc.calculate("price * qty - 1", {"price": 2.5, "qty": 4}) == 9.0
+        assert calc.calculate("price * qty - 1", {"price": 1.0, "qty": 2}) == 1.0
+        assert calc.compile("a + b * a").variables == ("a", "b")
+        with pytest.raises(ValueError, match="Unbound variable 'qty'"):
+            calc.calculate("price * qty", {"price": 1.0})
+        with pytest.raises(ValueError, match="Unbound variable"):
+            calc.calculate("price")
+
+    @pytest.mark.parametrize("engine", Calculator.ENGINES)
+    def test_dtype(self, engine):
+        """Test float64 is the default and float32 narrows every operation."""
+        single = Calculator(engine=engine, dtype="float32")
+        assert Calculator(engine=engine).calculate("0.1 + 0.2") == 0.1 + 0.2
+        assert single.calculate("0.1 + 0.2") == array("f", [0.1 + 0.2])[0]
+        assert single.calculate("1 / 3") == array("f", [1 / 3])[0]
+        assert Calculator.compile("1 / 3", dtype="float32").evaluate() == (
+            single.calculate("1 / 3")
+        )
+        with pytest.raises(ZeroDivisionError):
+            single.calculate("1 / (2 - 2)")
+        for optimize in (True, False):
+            calc = Calculator(engine=engine, optimize=optimize, dtype="float32")
+            with pytest.raises(ZeroDivisionError):
+                calc.calculate("1 / 1e-50")
+            with pytest.raises(ZeroDivisionError):
+                calc.calculate("1 / x", {"x": -1e-50})
+            # Constants and variables are rounded too, as by calculate_over.
+            x = array("f", [0.1])
+            for expression in ("x * 1", "x / -1", "x - 0", "0.1", "-x"):
+                expected = calc.calculate_over(expression, {"x": x})[0]
+                assert calc.calculate(expression, {"x": 0.1}) == expected
+        with pytest.raises(ValueError, match="Unknown dtype"):
+            Calculator(dtype="float16")
+
+    def test_float32_columns(self):
+        """Test float32 calculators take and return float32 arrays."""
+        calc = Calculator(dtype="float32")
+        x = array("f", [0.1, 0.5])
+        result = calc.calculate_over("x * 3 + 0.2", {"x": x})
+        assert result.typecode == "f"
+        assert list(result) == list(array("f", [v * 3 + 0.2 for v in x]))
+        assert calc.add_array(x, x).typecode == "f"
+
+    def test_dtype_cache_keys(self):
+        """Test float32 and float64 results are cached apart."""
+        double, single = Calculator(shared_cache=True), Calculator(
+            shared_cache=True, dtype="float32"
+        )
+        double.clear_cache()
+        assert double.calculate("0.1 + 0.2") == 0.1 + 0.2
+        assert single.calculate("0.1 + 0.2") != 0.1 + 0.2
+        assert single.cache_info().hits == 0
+        double.clear_cache()
+
+    def test_map_threaded(self):
+        """Test array operations and expressions split across threads."""
+        calc = Calculator()
+        a = array("d", range(10_000))
+        b = memoryview(array("d", range(20_000)))[::2]
+        result = calc.map_threaded(calc.add_array, a, b, workers=4, chunk_rows=999)
+        assert list(result) == [3.0 * i for i in range(10_000)]
+        out = array("d", bytes(80_000))
+        columns = {"x": a, "y": [1.0] * 10_000}
+        assert calc.map_threaded("x * 2 - y", columns, out=out, chunk_rows=999) is out
+        assert list(out) == [2.0 * i - 1.0 for i in range(10_000)]
+        with pytest.raises(ZeroDivisionError):
+            calc.map_threaded(calc.divide_array, b, a, workers=2, chunk_rows=999)
+        with pytest.raises(ValueError, match="same length"):
+            calc.map_threaded(calc.add_array, a, [1.0], workers=2)
+        with pytest.raises(TypeError):
+            calc.map_threaded(calc.add_array, a, a, out=[0.0] * 10_000)
+        single = Calculator(dtype="float32")
+        assert single.map_threaded(single.add_array, [1.5], [2.0]).typecode == "f"
+
+    def test_calculate_over(self):
+        """Test evaluating one expression over columns of bindings."""
+        calc = Calculator()
+        price = array("d", [1.0, 2.5, 4.0])
+        qty = [2.0, 4.0, 0.5]
+        result = calc.calculate_over("price * qty - 1", {"price": price, "qty": qty})
+        assert list(result) == [1.0, 9.0, 1.0]
+        assert list(calc.calculate_over("2 * 3", {"price": price})) == [6.0] * 3
+        out = array("d", [0.0] * 3)
+        assert calc.calculate_over("-price", {"price": price}, out=out) is out
+        assert list(out) == [-1.0, -2.5, -4.0]
+        with pytest.raises(ValueError, match="Unbound variable 'qty'"):
+            calc.calculate_over("price * qty", {"price": price})
+        with pytest.raises(ZeroDivisionError):
+            calc.calculate_over("1 / (qty - 4)", {"qty": qty})
+
+    @pytest.mark.parametrize("engine", Calculator.ENGINES)
+    def test_stats(self, engine):
+        """Test per-stage timings are recorded only when profiling."""
+        assert Calculator(engine=engine).stats() == {}
+        calc = Calculator(engine=engine, profile=True)
+        assert calc.calculate("1 + 2") == 3.0
+        assert calc.calculate("1 + 2") == 3.0
+        with pytest.raises(ZeroDivisionError):
+            calc.calculate("1 / 0")
+        stats = calc.stats()
+        assert list(stats) == ["cache", "parse", "dispatch", "native"]
+        assert stats["parse"].calls == 2
+        assert stats["native"].calls == 2
+        assert stats["cache"].calls == 4
+        for stage in stats.values():
+            assert 0 <= stage.p50 <= stage.p99 <= stage.max <= stage.total
+
+    def test_calculate_many(self):
+        """Test ordered results from one or several processes."""
+        calc = Calculator()
+        expressions = [f"{i} + 0.5" for i in range(100)]
+        expected = [i + 0.5 for i in range(100)]
+        assert list(calc.calculate_many(expressions)) == expected
+        parallel = calc.calculate_many(iter(expressions), jobs=2, chunk_size=8)
+        assert list(parallel) == expected
+
+    def test_worker_settings(self):
+        """Test worker processes copy the calling Calculator's settings."""
+        calc = Calculator(cache_size=16, engine="python", optimize=False)
+        results = calc.calculate_many([f"{i} * 1" for i in range(20)], jobs=2)
+        assert list(results) == [float(i) for i in range(20)]
+        parallel._init_worker(16, "python", "float32", False)
+        worker = parallel._worker_calculator
+        assert worker.engine == "python"
+        assert worker.dtype == "float32"
+        assert worker.optimize is False
+        assert worker.cache_info().maxsize == 16
+
+    def test_calculate_many_errors(self):
+        """Test errors are raised or returned in place."""
+        calc = Calculator()
+        outcomes = list(calc.calculate_many(["1", "1 / 0"], return_exceptions=True))
+        assert outcomes[0] == 1.0
+        assert isinstance(outcomes[1], ZeroDivisionError)
+        with pytest.raises(ZeroDivisionError):
+            list(calc.calculate_many(["1", "1 / 0"], jobs=2))
+
+    def test_backend_loaded_lazily(self):
+        """Test importing the package defers loading calculator_c."""
+        script = (
+            "import sys, python\n"
+            "assert 'calculator_c' not in sys.modules\n"
+            "assert python.Calculator.add(1.0, 2.0) == 3.0\n"
+            "assert 'calculator_c' in sys.modules\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.run([sys.executable, "-c", script], check=True, cwd=root)
+
+
+class TestAsyncCalculator:
+    """Test micro-batched evaluation from asyncio."""
+
+    def test_batches_concurrent_requests(self):
+        """Test concurrent requests share batches and get their own results."""
+
+        async def run():
+            calc = AsyncCalculator(window=0.01, max_batch=64)
+            requests = [calc.calculate("x * 2 + 1", {"x": i}) for i in range(100)]
+            requests += [calc.calculate("1 / 0"), calc.calculate("2 +")]
+            requests.append(calc.calculate("x / y", {"x": 1.0, "y": 0.0}))
+            results = await asyncio.gather(*requests, return_exceptions=True)
+            return calc, results
+
+        calc, results = asyncio.run(run())
+        assert results[:100] == [2.0 * i + 1 for i in range(100)]
+        assert isinstance(results[100], ZeroDivisionError)
+        assert isinstance(results[101], ValueError)
+        assert isinstance(results[102], ZeroDivisionError)
+        info = calc.batch_info()
+        assert (info.requests, info.batches, info.max_batch_size) == (103, 2, 64)
+        assert info.queue_depth == 0 and info.max_queue_depth == 103
+        stats = calc.stats()
+        assert stats["latency"].calls == stats["queue"].calls == 103
+        assert stats["batch"].calls == 2
+        assert sum(calc.profiler.histogram("latency", [0.001, 0.1])) == 103
+
+    def test_failed_group_falls_back(self):
+        """Test a failing grouped evaluation only fails the bad requests."""
+        outcomes = evaluate_batch(
+            Calculator(),
+            [("a / b", {"a": 1.0, "b": 2.0}), ("a / b", {"a": 1.0, "b": 0.0})],
+        )
+        assert outcomes[0] == (0.5, None)
+        assert isinstance(outcomes[1][1], ZeroDivisionError)
@@ -0,0 +1,511 @@
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from array import array
+
+import pytest
+
+from python import Calculator
+from python.batch import run_batch
+from python.columns import Column, OutputColumn, evaluate_columns
+from python.daemon import DaemonClient, connect, handle_request
+from python.store import ResultStore, StoredCalculator, namespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_cli(*args, stdin=""):
+    """Run the CLI in a subprocess and return the completed process."""
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, "run_cli.py"), *args],
+        input=stdin,
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+    )
+
+
+# Modules the single-expression fast path must not import.
+HEAVY_MODULES = (
+    "argparse",
+    "asyncio",
+    "socket",
+    "json",
+    "csv",
+    "re",
+    "typing",
+    "concurrent.futures",
+)
+
+# Generous cumulative import budget for python.cli, in microseconds.
+STARTUP_BUDGET_US = 150_000
+
+
+def import_times(*args):
+    """Run the CLI under -X importtime; return {module: cumulative_us}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(ROOT, "run_cli.py"), *args],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+    )
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestBatch:
+    """Test streaming batch evaluation."""
+
+    def test_plain(self):
+        """Test results are written per line and errors do not abort."""
+        output = io.StringIO()
+        summary = run_batch(
+            Calculator(), io.StringIO("1 + 2\n\n# comment\n2 / 0\n-2 * 3\n"), output
+        )
+        assert summary == (3, 1)
+        assert output.getvalue() == "3.0\nError: Division by zero\n-6.0\n"
+
+    def test_unexpected_errors_do_not_abort(self):
+        """Test any exception is reported on its line and the batch goes on."""
+
+        class Fragile(Calculator):
+            def calculate(self, expression, variables=None):
+                if expression == "boom":
+                    raise RecursionError("maximum recursion depth exceeded")
+                return super().calculate(expression, variables)
+
+        output = io.StringIO()
+        deep = "(" * 5000 + "2" + ")" * 5000
+        lines = f"1 + 2\nboom\n{deep}\n(1 + 2\n2 * 4\n"
+        summary = run_batch(Fragile(), io.StringIO(lines), output)
+        assert summary == (5, 2)
+        assert output.getvalue().splitlines() == [
+            "3.0",
+            "Error: RecursionError: maximum recursion depth exceeded",
+            "2.0",
+            "Error: Unbalanced parenthesis at position 0",
+            "8.0",
+        ]
+
+    def test_csv(self):
+        """Test CSV output includes a header and the error column."""
+        output = io.StringIO()
+        run_batch(Calculator(), io.StringIO("1 + 2\n1 +\n"), output, "csv")
+        lines = output.getvalue().splitlines()
+        assert lines[0] == "line,expression,result,error"
+        assert lines[1] == "1,1 + 2,3.0,"
+        assert lines[2].startswith("2,1 +,,")
+
+    def test_json(self):
+        """Test JSON lines output."""
+        output = io.StringIO()
+        run_batch(Calculator(), io.StringIO("4 / 2\n4 / 0\n"), output, "json")
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert records[0] == {
+            "line": 1,
+            "expression": "4 / 2",
+            "result": 2.0,
+            "error": None,
+        }
+        assert records[1]["error"] == "Division by zero"
+
+    def test_json_non_finite(self):
+        """Test non-finite results are written as strings, in strict JSON."""
+        output = io.StringIO()
+        lines = "1e308 * 10\n-1e308 * 10\n1e308 * 10 - 1e308 * 10\n"
+        run_batch(Calculator(), io.StringIO(lines), output, "json")
+
+        def reject(constant):
+            raise ValueError(f"non-standard JSON constant {constant}")
+
+        records = [
+            json.loads(line, parse_constant=reject)
+            for line in output.getvalue().splitlines()
+        ]
+        assert [record["result"] for record in records] == ["inf", "-inf", "nan"]
+        assert all(record["error"] is None for record in records)
+
+    def test_parallel_preserves_order(self):
+        """Test multi-process evaluation keeps input order."""
+        lines = "".join(f"{i} * 2\n" if i % 7 else "1 / 0\n" for i in range(200))
+        serial, parallel = io.StringIO(), io.StringIO()
+        run_batch(Calculator(), io.StringIO(lines), serial)
+        summary = run_batch(Calculator(), io.StringIO(lines), parallel, jobs=2)
+        assert parallel.getvalue() == serial.getvalue()
+        assert summary == (200, 29)
+
+
+class TestCli:
+    """Test the command-line entry point."""
+
+    def test_expression(self):
+        """Test a single expression argument."""
+        result = run_cli("2 + 2")
+        assert result.returncode == 0
+        assert result.stdout.strip() == "2 + 2 = 4.0"
+
+    def test_leading_unary_minus(self):
+        """Test a single expression starting with "-" is not taken for an option."""
+        for expression, value in (("-3*2", -6.0), ("-(1+2)", -3.0), ("-.5", -0.5)):
+            result = run_cli(expression)
+            assert result.returncode == 0, result.stderr
+            assert result.stdout.strip() == f"{expression} = {value}"
+        assert run_cli("-x").returncode == 2
+
+    def test_interactive_cells(self):
+        """Test interactive cells and their incremental updates."""
+        result = run_cli(
+            "-i", stdin="rate = 2\ntotal = rate * 4\nrate = 3\ntotal + 1\ndel rate\n"
+        )
+        lines = result.stdout.replace("calc> ", "").splitlines()
+        assert lines[4:9] == [
+            "rate = 2.0",
+            "total = 8.0",
+            "rate = 3.0",
+            "total = 12.0",
+            "= 13.0",
+        ]
+        assert lines[9].startswith("total = Error: Unknown cell 'rate'")
+
+    def test_batch_stdin(self):
+        """Test --batch reads stdin and reports failures in the exit code."""
+        result = run_cli("--batch", stdin="1 + 1\n1 / 0\n")
+        assert result.stdout == "2.0\nError: Division by zero\n"
+        assert result.returncode == 1
+
+    def test_batch_jobs(self):
+        """Test --jobs evaluates in parallel and reports throughput."""
+        result = run_cli("--batch", "--jobs", "2", stdin="1 + 1\n2 * 3\n")
+        assert result.stdout == "2.0\n6.0\n"
+        assert "2 expressions in" in result.stderr
+
+    def test_batch_input_file(self, tmp_path):
+        """Test --input reads expressions from a file."""
+        path = tmp_path / "expressions.txt"
+        path.write_text("3 * 3\n")
+        result = run_cli("--input", str(path), "--format", "json")
+        assert result.returncode == 0
+        assert json.loads(result.stdout)["result"] == 9.0
+
+    def test_profile(self):
+        """Test --profile prints a per-stage summary on stderr."""
+        result = run_cli("--profile", "--batch", stdin="1 + 1\n2 * 3\n")
+        assert result.stdout == "2.0\n6.0\n"
+        header, *rows = result.stderr.splitlines()
+        assert header.split()[:3] == ["stage", "calls", "total"]
+        assert [row.split()[:2] for row in rows] == [
+            ["cache", "4"],
+            ["parse", "2"],
+            ["dispatch", "2"],
+            ["native", "2"],
+            ["output", "2"],
+        ]
+
+    def test_startup_budget(self):
+        """Test a single expression skips heavy imports and starts quickly."""
+        times = import_times("2+2")
+        assert [name for name in HEAVY_MODULES if name in times] == []
+        assert times["python.cli"] < STARTUP_BUDGET_US
+
+
+NATIVE_CLI = os.path.join(
+    ROOT, "c_src", "calculate.exe" if os.name == "nt" else "calculate"
+)
+
+
+@pytest.mark.skipif(not os.path.exists(NATIVE_CLI), reason="run `make cli` first")
+class TestNativeBatch:
+    """Tests for the batch mode of the standalone C calculator."""
+
+    def test_text_records(self):
+        result = subprocess.run(
+            [NATIVE_CLI, "--batch"],
+            input="+ 1 2\n# comment\n\n/ 1 0\n* 2.5 4\nx 1 2\n- -1 -2",
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 1
+        assert result.stdout.splitlines() == [
+            "3",
+            "Error: Division by zero",
+            "10",
+            "Error: Invalid record",
+            "1",
+        ]
+        assert "2 record(s) failed" in result.stderr
+
+    def test_binary_records(self, tmp_path):
+        import math
+        import struct
+
+        records = [(b"+", 1.5, 2.0), (b"/", 1.0, 3.0), (b"/", 1.0, 0.0)] * 30_000
+        source = tmp_path / "records.bin"
+        source.write_bytes(b"".join(struct.pack("=cxxxff", *r) for r in records))
+        target = tmp_path / "results.f32"
+        result = subprocess.run(
+            [NATIVE_CLI, "--batch", "--binary", "--input", source, "--output", target],
+            capture_output=True,
+        )
+        assert result.returncode == 1
+        values = array("f", target.read_bytes())
+        assert len(values) == len(records)
+        assert values[0] == 3.5
+        assert values[1] == Calculator(dtype="float32").divide(1.0, 3.0)
+        assert math.isnan(values[2]) and math.isnan(values[-1])
+
+        truncated = subprocess.run(
+            [NATIVE_CLI, "--batch", "--binary"],
+            input=source.read_bytes()[:18],
+            capture_output=True,
+        )
+        assert truncated.returncode == 1
+        assert len(truncated.stdout) == 4
+        assert b"truncated record" in truncated.stderr
+
+
+class TestColumns:
+    """Test evaluating expressions over memory-mapped column files."""
+
+    def test_column_files(self, tmp_path):
+        """Test float64 and float32 inputs with a float64 output file."""
+        (tmp_path / "price.f64").write_bytes(array("d", [1.0, 2.5, 4.0]).tobytes())
+        (tmp_path / "qty.f32").write_bytes(array("f", [2.0, 4.0, 0.5]).tobytes())
+        output = tmp_path / "total.f64"
+        with Column(str(tmp_path / "price.f64")) as price, Column(
+            str(tmp_path / "qty.f32")
+        ) as qty, OutputColumn(str(output), 3) as out:
+            chunks = evaluate_columns(
+                Calculator(), "price * qty - 1", {"price": price, "qty": qty}, out, 2
+            )
+            assert [list(chunk) for chunk in chunks] == [[1.0, 9.0], [1.0]]
+        result = array("d")
+        result.frombytes(output.read_bytes())
+        assert list(result) == [1.0, 9.0, 1.0]
+
+    def test_cli_columns(self, tmp_path):
+        """Test --column prints results and --output writes float32."""
+        (tmp_path / "x.bin").write_bytes(array("d", [1.0, 2.0]).tobytes())
+        column = f"x={tmp_path / 'x.bin'}:float64"
+        result = run_cli("x * 3", "--column", column)
+        assert result.stdout == "3.0\n6.0\n"
+        result = run_cli("x / 2", "--column", column, "-o", str(tmp_path / "y.f32"))
+        assert result.returncode == 0
+        assert (tmp_path / "y.f32").read_bytes() == array("f", [0.5, 1.0]).tobytes()
+        result = run_cli("x / (x - 1)", "--column", column)
+        assert result.returncode == 1
+        assert "Division by zero" in result.stderr
+
+    def test_cli_float32_columns(self, tmp_path):
+        """Test --dtype float32 evaluates float32 files in float32."""
+        (tmp_path / "x.f32").write_bytes(array("f", [0.1, 1.0]).tobytes())
+        output = tmp_path / "y.f32"
+        column = f"x={tmp_path / 'x.f32'}"
+        result = run_cli(
+            "x / 3", "--column", column, "-o", str(output), "--dtype", "float32"
+        )
+        assert result.returncode == 0
+        expected = array("f", [array("f", [0.1])[0] / 3, 1.0 / 3])
+        assert output.read_bytes() == expected.tobytes()
+
+
+class TestResultStore:
+    """Tests for the persistent result cache."""
+
+    def test_round_trip(self, tmp_path):
+        values = {"a": 1 / 3, "b": -0.0, "c": float("inf"), "d": float("nan")}
+        with ResultStore(tmp_path, "v1") as store:
+            store.put_many(values)
+        with ResultStore(tmp_path, "v1") as store:
+            found = store.get_many(["a", "b", "c", "d", "e"])
+            assert found["a"] == 1 / 3 and found["c"] == float("inf")
+            assert str(found["b"]) == "-0.0" and found["d"] != found["d"]
+            assert "e" not in found
+            assert store.info()[:2] == (4, 1)
+        with ResultStore(tmp_path, "v2") as store:
+            assert store.get_many(["a"]) == {}
+
+    def test_eviction(self, tmp_path):
+        with ResultStore(tmp_path, "v1", max_entries=10) as store:
+            for i in range(25):
+                store.put_many({str(i): float(i)})
+            assert store.info().currsize <= 10
+            assert store.info().evictions >= 15
+
+    def test_stored_calculator(self, tmp_path):
+        calc = Calculator()
+        with ResultStore(tmp_path, namespace(calc)) as store:
+            store.put_many({"2 + 2": 5.0})  # only served from the store
+            stored = StoredCalculator(calc, store)
+            assert stored.calculate("2  +  2") == 5.0
+            assert stored.calculate("x + 1", {"x": 1}) == 2.0
+            outcomes = list(
+                stored.calculate_many(
+                    ["1 / 0", "2 + 2", "3 * 3"], return_exceptions=True
+                )
+            )
+            assert isinstance(outcomes[0], ZeroDivisionError)
+            assert outcomes[1:] == [5.0, 9.0]
+            assert set(store.get_many(["1 / 0", "3 * 3"])) == {"3 * 3"}
+            with pytest.raises(ZeroDivisionError):
+                stored.calculate("1 / 0")
+        single = Calculator(dtype="float32")
+        assert namespace(single) != namespace(calc)
+        with ResultStore(tmp_path, namespace(single)) as store:
+            assert StoredCalculator(single, store).calculate("2 + 2") == 4.0
+
+    def test_cli_concurrent_runs(self, tmp_path):
+        source = tmp_path / "expressions.txt"
+        source.write_text("".join(f"{i} * 3 / 7\n" for i in range(2000)) + "1 / 0\n")
+        command = [sys.executable, os.path.join(ROOT, "run_cli.py"), "--input"]
+        command += [str(source), "--cache-dir", str(tmp_path / "cache")]
+        runs = [
+            subprocess.Popen(command, stdout=subprocess.PIPE, cwd=ROOT)
+            for _ in range(3)
+        ]
+        outputs = [run.communicate()[0] for run in runs]
+        assert [run.returncode for run in runs] == [1, 1, 1]
+        expected = run_cli("--input", str(source)).stdout.encode()
+        assert outputs == [expected] * 3
+        with ResultStore(tmp_path / "cache", "") as store:
+            assert store.info().currsize == 2000
+        rerun = subprocess.run(command, capture_output=True, cwd=ROOT)
+        assert rerun.stdout == expected
+
+
+def start_daemon(path, *args):
+    """Start a calculator daemon on ``path`` and wait until it accepts."""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "run_cli.py"), "--serve"]
+        + ["--socket", path, *args],
+        stdout=subprocess.DEVNULL,
+        cwd=ROOT,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        client = connect(path)
+        if client is not None:
+            client.close()
+            break
+        time.sleep(0.02)
+    return process
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    """Start a calculator daemon and yield its socket path."""
+    path = str(tmp_path / "calc.sock")
+    process = start_daemon(path)
+    yield path
+    process.terminate()
+    process.wait(timeout=10)
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+class TestDaemon:
+    """Test the Unix socket daemon and client."""
+
+    def test_handle_request(self):
+        """Test the plain and JSON line protocol."""
+        calc = Calculator()
+        assert handle_request(calc, "1 + 2") == "ok 3.0"
+        assert (
+            handle_request(calc, "1 / 0") == "error ZeroDivisionError: Division by zero"
+        )
+        reply = json.loads(handle_request(calc, '{"id": 3, "expression": "2 * 4"}'))
+        assert reply == {"id": 3, "result": 8.0, "error": None}
+        assert json.loads(handle_request(calc, "{}"))["error"].startswith("KeyError")
+        # Non-finite results are strings: strict JSON has no NaN or Infinity.
+        reply = handle_request(calc, '{"id": 4, "expression": "1e308 * 10"}')
+        assert json.loads(reply) == {"id": 4, "result": "inf", "error": None}
+        assert "Infinity" not in reply
+        assert handle_request(calc, "1e308 * 10") == "ok inf"
+
+    def test_unexpected_errors(self):
+        """Test any exception becomes an error reply."""
+
+        class Fragile:
+            def calculate(self, expression):
+                raise RecursionError("maximum recursion depth exceeded")
+
+        assert handle_request(Fragile(), "1") == (
+            "error RecursionError: maximum recursion depth exceeded"
+        )
+        reply = json.loads(handle_request(Fragile(), '{"expression": "1"}'))
+        assert reply["error"].startswith("RecursionError")
+
+    def test_bad_requests_keep_connection(self, daemon):
+        """Test undecodable and deeply nested lines get replies in order."""
+        deep = "(" * 5000 + "1" + ")" * 5000
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(daemon)
+            client.sendall(b"\xff\xfe\n1+1\n" + deep.encode() + b"\n2*3\n")
+            client.shutdown(socket.SHUT_WR)
+            received = b""
+            while chunk := client.recv(65536):
+                received += chunk
+        replies = received.decode().splitlines()
+        assert replies[0].startswith("error ValueError: Invalid character")
+        assert replies[1:] == ["ok 2.0", "ok 1.0", "ok 6.0"]
+
+    def test_socket_in_use(self, daemon, tmp_path):
+        """Test a second daemon refuses a live socket but replaces a stale one."""
+        result = run_cli("--serve", "--socket", daemon)
+        assert result.returncode == 1
+        assert "already listening" in result.stderr
+        with DaemonClient(daemon) as client:
+            assert client.calculate("2 + 2") == 4.0
+
+        stale = str(tmp_path / "stale.sock")
+        with socket.socket(socket.AF_UNIX) as server:
+            server.bind(stale)  # closed without listening or unlinking
+        process = start_daemon(stale)
+        try:
+            with DaemonClient(stale) as client:
+                assert client.calculate("2 + 3") == 5.0
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    def test_server_options(self, tmp_path):
+        """Test --serve evaluates with the --dtype it was started with."""
+        path = str(tmp_path / "calc.sock")
+        process = start_daemon(path, "--dtype", "float32", "--no-optimize")
+        try:
+            with DaemonClient(path) as client:
+                assert client.calculate("0.1 * 3") == array("f", [0.1 * 3])[0]
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    def test_pipelined_clients(self, daemon):
+        """Test concurrent clients with pipelined requests."""
+        first, second = DaemonClient(daemon), DaemonClient(daemon)
+        with first, second:
+            expressions = [f"{i} * 3" for i in range(1000)]
+            assert list(first.calculate_many(expressions, window=100)) == [
+                i * 3.0 for i in range(1000)
+            ]
+            assert second.calculate("2 + 2") == 4.0
+            with pytest.raises(ZeroDivisionError):
+                second.calculate("1 / 0")
+            with pytest.raises(ValueError):
+                first.calculate("")
+
+    def test_cli_client(self, daemon):
+        """Test --client forwards to the daemon or falls back locally."""
+        result = run_cli("--client", "--socket", daemon, "6 * 7")
+        assert result.stdout.strip() == "6 * 7 = 42.0"
+        missing = daemon + ".missing"
+        assert connect(missing) is None
+        result = run_cli("--client", "--socket", missing, "6 * 7")
+        assert result.stdout.strip() == "6 * 7 = 42.0"